@@ -0,0 +1,317 @@
+"""
+End-to-end benchmark of the training pipeline on a synthetic corpus.
+
+Runs generate -> preprocess_data -> train_model (a few epochs, including
+the TF.js export) in a scratch directory and records wall time, CPU time,
+peak RSS and samples/sec for each stage. Each stage runs in its own
+process so peak RSS is attributable to that stage rather than being the
+high-water mark of everything that ran before it.
+
+Results are written as JSON. --save-baseline stores them as the baseline;
+--compare checks them against the baseline and exits non-zero if any stage
+regressed beyond the tolerance.
+"""
+
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from profiling import Profiler, peak_rss_mb
+
+
+def _run_generate(work_dir: str, corpus: dict) -> dict:
+    from generate_synthetic import generate_corpus
+
+    profiler = Profiler(enabled=True)
+    with profiler.stage(
+        "generate", n_samples=corpus["files"] * corpus["frames"]
+    ):
+        generate_corpus(
+            str(Path(work_dir) / "raw"),
+            n_files=corpus["files"],
+            n_frames=corpus["frames"],
+            onset_density=corpus["onset_density"],
+            silent_fraction=corpus["silent_fraction"],
+            seed=corpus["seed"],
+        )
+    return {"stages": profiler.summary(), "peak_rss_mb": peak_rss_mb()}
+
+
+def _run_preprocess(work_dir: str) -> dict:
+    from preprocess import preprocess_data
+
+    profiler = Profiler(enabled=True)
+    preprocess_data(
+        str(Path(work_dir) / "raw"),
+        str(Path(work_dir) / "processed"),
+        profiler=profiler,
+    )
+    return {"stages": profiler.summary(), "peak_rss_mb": peak_rss_mb()}
+
+
+def _run_train(work_dir: str, epochs: int, batch_size: int) -> dict:
+    from train import train_model
+
+    profiler = Profiler(enabled=True)
+    train_model(
+        str(Path(work_dir) / "processed"),
+        str(Path(work_dir) / "models"),
+        epochs=epochs,
+        batch_size=batch_size,
+        profiler=profiler,
+        publish=False,
+    )
+    return {
+        "stages": profiler.summary(),
+        "epochs": profiler.epochs,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _in_subprocess(fn, *args) -> dict:
+    """Run fn in a fresh process and add its total wall time."""
+    ctx = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        result = pool.submit(fn, *args).result()
+    result["wall_s"] = time.perf_counter() - start
+    return result
+
+
+def run_benchmark(
+    work_dir: str,
+    corpus: dict,
+    epochs: int = 3,
+    batch_size: int = 256,
+) -> dict:
+    """
+    Run the full pipeline once and collect per-stage measurements.
+
+    Args:
+        work_dir: Scratch directory for the corpus, processed data and models
+        corpus: Synthetic corpus settings (files, frames, onset_density,
+            silent_fraction, seed)
+        epochs: Training epochs (keep small, this measures throughput)
+        batch_size: Training batch size
+
+    Returns:
+        Benchmark results dictionary
+    """
+    print(f"Benchmark scratch directory: {work_dir}")
+    pipeline = {}
+
+    print("\n[1/3] Generating synthetic corpus...")
+    pipeline["generate"] = _in_subprocess(_run_generate, work_dir, corpus)
+    print("\n[2/3] Preprocessing...")
+    pipeline["preprocess"] = _in_subprocess(_run_preprocess, work_dir)
+    print("\n[3/3] Training + export...")
+    pipeline["train"] = _in_subprocess(
+        _run_train, work_dir, epochs, batch_size
+    )
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": multiprocessing.cpu_count(),
+        },
+        "corpus": corpus,
+        "epochs": epochs,
+        "batch_size": batch_size,
+        "pipeline": pipeline,
+    }
+
+
+def _flatten_metrics(results: dict) -> dict:
+    """Map "step/stage" -> metrics for comparison."""
+    metrics = {}
+    for step, step_result in results["pipeline"].items():
+        metrics[step] = {
+            "wall_s": step_result["wall_s"],
+            "peak_rss_mb": step_result["peak_rss_mb"],
+        }
+        for stage, entry in step_result["stages"].items():
+            metrics[f"{step}/{stage}"] = {
+                "wall_s": entry["wall_s"],
+                "peak_rss_mb": entry["peak_rss_mb"],
+                "samples_per_s": entry.get("samples_per_s"),
+            }
+    return metrics
+
+
+def compare_results(
+    current: dict,
+    baseline: dict,
+    tolerance: float = 0.15,
+    min_wall_s: float = 0.05,
+) -> list:
+    """
+    Compare benchmark results against a baseline.
+
+    A stage regresses when its wall time or peak RSS grows, or its
+    throughput drops, by more than ``tolerance`` (relative). Timing of
+    stages faster than ``min_wall_s`` in the baseline is too noisy to
+    compare and is only checked for memory.
+
+    Returns:
+        List of human-readable regression descriptions (empty if none)
+    """
+    if current["corpus"] != baseline["corpus"] or (
+        current["epochs"] != baseline["epochs"]
+    ):
+        print(
+            "Warning: corpus or epoch settings differ from the baseline; "
+            "comparison is not like-for-like"
+        )
+
+    regressions = []
+    cur = _flatten_metrics(current)
+    base = _flatten_metrics(baseline)
+
+    print(
+        f"\n  {'stage':<22} {'metric':<14} {'baseline':>12} "
+        f"{'current':>12} {'change':>8}"
+    )
+    for name, base_metrics in base.items():
+        if name not in cur:
+            continue
+        for metric, base_value in base_metrics.items():
+            cur_value = cur[name].get(metric)
+            if not base_value or cur_value is None:
+                continue
+            if metric != "peak_rss_mb" and base_metrics["wall_s"] < min_wall_s:
+                continue
+            change = (cur_value - base_value) / base_value
+            higher_is_worse = metric != "samples_per_s"
+            regressed = (
+                change > tolerance if higher_is_worse else change < -tolerance
+            )
+            flag = "  REGRESSION" if regressed else ""
+            print(
+                f"  {name:<22} {metric:<14} {base_value:>12.3f} "
+                f"{cur_value:>12.3f} {change * 100:>+7.1f}%{flag}"
+            )
+            if regressed:
+                regressions.append(
+                    f"{name} {metric}: {base_value:.3f} -> {cur_value:.3f} "
+                    f"({change * 100:+.1f}%)"
+                )
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    print("\nBenchmark results:")
+    for step, step_result in results["pipeline"].items():
+        print(
+            f"  {step}: {step_result['wall_s']:.2f}s wall, "
+            f"{step_result['peak_rss_mb']:.0f} MiB peak RSS"
+        )
+        for stage, entry in step_result["stages"].items():
+            rate = entry.get("samples_per_s")
+            rate_str = f", {rate:.0f} samples/s" if rate else ""
+            print(f"    {stage:<10} {entry['wall_s']:>8.3f}s{rate_str}")
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the training pipeline on synthetic data"
+    )
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=6000)
+    parser.add_argument("--onset-density", type=float, default=2.0)
+    parser.add_argument("--silent-fraction", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument(
+        "--output",
+        default=str(training_dir / "benchmarks" / "latest.json"),
+        help="Where to write this run's results",
+    )
+    parser.add_argument(
+        "--baseline",
+        default=str(training_dir / "benchmarks" / "baseline.json"),
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store this run as the new baseline",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Compare against the baseline and fail on regressions",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="Relative change that counts as a regression (default 0.15)",
+    )
+    parser.add_argument(
+        "--min-wall",
+        type=float,
+        default=0.05,
+        help="Skip timing comparisons for stages faster than this (seconds)",
+    )
+    parser.add_argument(
+        "--work-dir",
+        help="Scratch directory (default: a temporary directory)",
+    )
+    args = parser.parse_args()
+
+    corpus = {
+        "files": args.files,
+        "frames": args.frames,
+        "onset_density": args.onset_density,
+        "silent_fraction": args.silent_fraction,
+        "seed": args.seed,
+    }
+
+    if args.work_dir:
+        Path(args.work_dir).mkdir(parents=True, exist_ok=True)
+        results = run_benchmark(
+            args.work_dir, corpus, args.epochs, args.batch_size
+        )
+    else:
+        with tempfile.TemporaryDirectory(prefix="onset-bench-") as tmp:
+            results = run_benchmark(tmp, corpus, args.epochs, args.batch_size)
+
+    print_results(results)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {output_path}")
+
+    if args.save_baseline:
+        baseline_path = Path(args.baseline)
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(baseline_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+
+    if args.compare:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_results(
+            results, baseline, args.tolerance, args.min_wall
+        )
+        if regressions:
+            print(f"\n{len(regressions)} regression(s):")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
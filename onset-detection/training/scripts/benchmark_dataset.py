@@ -0,0 +1,131 @@
+"""
+Disk footprint and load time of the preprocessed dataset formats.
+
+Takes an existing processed directory, writes it again in each format to
+a temporary directory and reports:
+
+- bytes on disk and save time
+- load_dataset() time (best of ``--repeats``; files are in the page
+  cache after the first read, so this measures decoding, not the disk)
+- largest absolute difference of the loaded X from the original
+
+Formats: "npy" (float64 X, int64 y, as preprocess.py writes by default),
+"compact" with float32 features and "compact" with float16 features.
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+
+from dataset import load_dataset, save_dataset
+
+VARIANTS = [
+    ("npy", "npy", "float32"),
+    ("compact-float32", "compact", "float32"),
+    ("compact-float16", "compact", "float16"),
+]
+
+
+def benchmark_formats(
+    data_dir, repeats: int = 5, jobs: int | None = None
+) -> list:
+    """
+    Rewrite data_dir in each format and time saving and loading it.
+
+    Args:
+        data_dir: Processed data directory (either format, with scaler.json)
+        repeats: Loads per format; the fastest is reported
+        jobs: Decompression threads for compact shards
+
+    Returns:
+        One result dict per format
+    """
+    data_dir = Path(data_dir)
+    X, y, instruments = load_dataset(data_dir, with_instruments=True)
+    X = X.astype(np.float64)
+    y = y.astype(np.int64)
+    with open(data_dir / "scaler.json", "r") as f:
+        scaler_data = json.load(f)
+    X_raw = X * np.asarray(scaler_data["std"]) + np.asarray(
+        scaler_data["mean"]
+    )
+
+    results = []
+    for name, dataset_format, feature_dtype in VARIANTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            (tmp / "scaler.json").write_text(json.dumps(scaler_data))
+            start = time.perf_counter()
+            saved = save_dataset(
+                tmp,
+                X,
+                y,
+                instruments,
+                dataset_format,
+                X_raw=X_raw,
+                feature_dtype=feature_dtype,
+            )
+            save_s = time.perf_counter() - start
+
+            load_times = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                X_loaded, y_loaded = load_dataset(tmp, jobs=jobs)
+                load_times.append(time.perf_counter() - start)
+
+        results.append(
+            {
+                "format": name,
+                "windows": len(y),
+                "bytes": saved["bytes"],
+                "files": len(saved["files"]),
+                "save_s": save_s,
+                "load_s": min(load_times),
+                "max_abs_error": float(np.abs(X_loaded - X).max()),
+                "labels_equal": bool(np.array_equal(y_loaded, y)),
+            }
+        )
+    return results
+
+
+def print_results(results: list) -> None:
+    baseline = results[0]["bytes"]
+    print(f"\nDataset of {results[0]['windows']} windows:")
+    print(
+        f"{'format':<17} {'MB':>8} {'ratio':>6} {'save s':>7} "
+        f"{'load s':>7} {'max |dX|':>9} {'y ok':>5}"
+    )
+    for result in results:
+        print(
+            f"{result['format']:<17} {result['bytes'] / 1e6:>8.2f} "
+            f"{baseline / result['bytes']:>5.1f}x {result['save_s']:>7.3f} "
+            f"{result['load_s']:>7.3f} {result['max_abs_error']:>9.2e} "
+            f"{str(result['labels_equal']):>5}"
+        )
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Compare disk size and load time of dataset formats"
+    )
+    parser.add_argument(
+        "data_dir",
+        nargs="?",
+        default=str(training_dir / "data" / "processed"),
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--jobs", type=int, help="Decompression threads")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    results = benchmark_formats(args.data_dir, args.repeats, args.jobs)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,243 @@
+"""
+Throughput and tail latency of the scoring service under concurrent load.
+
+Starts scoring_service.py in its own process (HTTP on localhost or a Unix
+socket), then has ``--clients`` threads each send ``--requests`` synthetic
+sessions as fast as they get answers. Each configuration is measured
+twice: unbatched (every request is its own forward pass) and
+micro-batched with the given deadline, so the effect of coalescing shows
+directly.
+
+Reports requests/sec, frames/sec, latency percentiles and the mean batch
+size the service actually formed.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+from pathlib import Path
+import numpy as np
+
+from generate_synthetic import generate_recording
+from preprocess import FEATURE_NAMES
+from scoring_service import ScoringClient
+
+
+def _serve(model_dir, address, max_batch_rows, max_latency_ms, ready):
+    from scoring_service import ScoringService, make_server
+
+    service = ScoringService(model_dir, max_batch_rows, max_latency_ms)
+    server = make_server(service, **address)
+    ready.set()
+    try:
+        server.serve_forever()
+    finally:
+        service.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def synthetic_bodies(
+    n_sessions: int, min_frames: int, max_frames: int, seed: int = 42
+) -> list:
+    """Encoded /score request bodies for random-length synthetic sessions."""
+    rng = np.random.default_rng(seed)
+    bodies = []
+    for _ in range(n_sessions):
+        n_frames = int(rng.integers(min_frames, max_frames + 1))
+        recording = generate_recording(n_frames, rng=rng)
+        frames = [
+            [frame[name] for name in FEATURE_NAMES] for frame in recording
+        ]
+        bodies.append((n_frames, json.dumps({"frames": frames}).encode()))
+    return bodies
+
+
+def run_load(
+    model_dir: str,
+    bodies: list,
+    clients: int,
+    requests_per_client: int,
+    max_batch_rows: int,
+    max_latency_ms: float,
+    unix_socket: bool = False,
+) -> dict:
+    """
+    Serve the model in a subprocess and hit it from concurrent clients.
+
+    Returns:
+        Throughput, latency percentiles (ms) and the service's batch stats
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        if unix_socket:
+            address = {"unix_socket": str(Path(tmp) / "scoring.sock")}
+        else:
+            address = {"host": "127.0.0.1", "port": _free_port()}
+        ready = ctx.Event()
+        process = ctx.Process(
+            target=_serve,
+            args=(model_dir, address, max_batch_rows, max_latency_ms, ready),
+            daemon=True,
+        )
+        process.start()
+        try:
+            while not ready.wait(0.1):
+                if not process.is_alive():
+                    raise RuntimeError(
+                        f"Scoring service exited with {process.exitcode}"
+                    )
+            return _drive(
+                address, bodies, clients, requests_per_client, max_latency_ms
+            )
+        finally:
+            process.terminate()
+            process.join()
+
+
+def _drive(address, bodies, clients, requests_per_client, max_latency_ms):
+    latencies = [[] for _ in range(clients)]
+    frames = [0] * clients
+    errors = []
+    start_barrier = threading.Barrier(clients + 1)
+
+    def client(index):
+        connection = ScoringClient(**address)
+        try:
+            connection.health()  # connect before the clock starts
+            start_barrier.wait()
+            for i in range(requests_per_client):
+                n_frames, body = bodies[(index + i * clients) % len(bodies)]
+                start = time.perf_counter()
+                connection.score_body(body)
+                latencies[index].append(time.perf_counter() - start)
+                frames[index] += n_frames
+        except Exception as err:  # noqa: BLE001
+            errors.append(err)
+            start_barrier.abort()  # don't leave the others waiting
+        finally:
+            connection.close()
+
+    threads = [
+        threading.Thread(target=client, args=(i,)) for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        start_barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    if errors:
+        raise RuntimeError(f"{len(errors)} client errors, first: {errors[0]}")
+
+    stats = ScoringClient(**address).health()["batching"]
+    all_latencies = np.concatenate(latencies) * 1000
+    n_requests = len(all_latencies)
+    return {
+        "max_latency_ms": max_latency_ms,
+        "requests": n_requests,
+        "wall_s": wall,
+        "requests_per_s": n_requests / wall,
+        "frames_per_s": sum(frames) / wall,
+        "latency_ms": {
+            "mean": float(all_latencies.mean()),
+            "p50": float(np.percentile(all_latencies, 50)),
+            "p95": float(np.percentile(all_latencies, 95)),
+            "p99": float(np.percentile(all_latencies, 99)),
+            "max": float(all_latencies.max()),
+        },
+        "mean_batch_requests": stats["mean_batch_requests"],
+        "mean_batch_rows": stats["mean_batch_rows"],
+    }
+
+
+def print_results(results: dict) -> None:
+    print(
+        f"\n{'mode':<16} {'req/s':>8} {'frames/s':>11} {'p50 ms':>8} "
+        f"{'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'req/batch':>10}"
+    )
+    for name, result in results.items():
+        latency = result["latency_ms"]
+        print(
+            f"{name:<16} {result['requests_per_s']:>8.1f} "
+            f"{result['frames_per_s']:>11,.0f} {latency['p50']:>8.1f} "
+            f"{latency['p95']:>8.1f} {latency['p99']:>8.1f} "
+            f"{latency['max']:>8.1f} {result['mean_batch_requests']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scoring service under concurrent load"
+    )
+    parser.add_argument(
+        "--model-dir",
+        default=str(training_dir / "models" / "saved" / "tfjs_model"),
+    )
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=25)
+    parser.add_argument("--min-frames", type=int, default=200)
+    parser.add_argument("--max-frames", type=int, default=3000)
+    parser.add_argument("--sessions", type=int, default=64)
+    parser.add_argument("--max-batch-rows", type=int, default=16384)
+    parser.add_argument(
+        "--max-latency-ms",
+        type=float,
+        nargs="+",
+        default=[2.0, 5.0, 10.0],
+        help="Micro-batching deadlines to measure",
+    )
+    parser.add_argument(
+        "--unix-socket", action="store_true", help="Use a Unix socket"
+    )
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    bodies = synthetic_bodies(args.sessions, args.min_frames, args.max_frames)
+    print(
+        f"{args.clients} clients x {args.requests} requests, sessions of "
+        f"{args.min_frames}-{args.max_frames} frames, "
+        f"{'Unix socket' if args.unix_socket else 'TCP'}, "
+        f"{os.cpu_count()} CPUs"
+    )
+
+    configs = {"unbatched": (1, 0.0)}
+    for deadline in args.max_latency_ms:
+        configs[f"batched {deadline:g}ms"] = (args.max_batch_rows, deadline)
+
+    results = {}
+    for name, (max_batch_rows, max_latency_ms) in configs.items():
+        print(f"Running {name}...")
+        results[name] = run_load(
+            args.model_dir,
+            bodies,
+            args.clients,
+            args.requests,
+            max_batch_rows,
+            max_latency_ms,
+            unix_socket=args.unix_socket,
+        )
+    print_results(results)
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {output_path}")
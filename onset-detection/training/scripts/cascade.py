@@ -0,0 +1,288 @@
+"""
+First-stage gate of a two-stage onset detector.
+
+Most 10 ms frames are obviously not onsets (steady tones, decays, room
+noise), yet the MLP runs on every one of them. The gate is a linear score
+on the current frame's raw amplitude and spectral flux:
+
+    fires = sum(weights * current_frame[features]) + bias >= 0
+
+Only frames where the gate fires are passed to the MLP; the others get
+probability 0. The weights come from a class-balanced logistic regression
+on the training windows, and the bias is lowered until the gate keeps
+``target_recall`` of the onsets in the full training recordings, so the
+cascade trades almost no recall for the skipped forward passes.
+
+The gate is saved as config.json ``gate`` (weights in raw feature units,
+plus the window ``columns`` it reads) and applied by OnsetModel.ts.
+"""
+
+import argparse
+import json
+from pathlib import Path
+import numpy as np
+
+from event_metrics import (
+    event_scores,
+    label_events,
+    load_recording,
+    recording_event_counts,
+)
+from numpy_model import load_tfjs_model
+from preprocess import FEATURE_NAMES, holdout_recordings
+
+GATE_FEATURES = ["amplitude", "spectralFlux"]
+TARGET_RECALL = 0.999
+
+
+def gate_columns(window_size: int = 5, features: list | None = None) -> list:
+    """Columns of the current frame's gate features in a full window."""
+    features = features or GATE_FEATURES
+    return [
+        (window_size - 1) * len(FEATURE_NAMES) + FEATURE_NAMES.index(name)
+        for name in features
+    ]
+
+
+def fit_gate(
+    X_gate: np.ndarray,
+    y: np.ndarray,
+    mean: np.ndarray,
+    std: np.ndarray,
+    raw_dir: Path,
+    window_size: int = 5,
+    target_recall: float = TARGET_RECALL,
+    holdout: list | None = None,
+) -> dict:
+    """
+    Fit the gate weights on training windows and tune its bias on full
+    recordings.
+
+    An onset counts as kept when the gate passes any frame of its
+    positive-label run, since the detector only needs one frame to fire.
+    The bias is lowered until ``target_recall`` of the onsets in raw_dir
+    are kept. Held-out recordings are left out, so cascade_report can
+    measure the gate on recordings it was not tuned on.
+
+    Args:
+        X_gate: Scaled gate columns (see gate_columns) of training windows
+        y: Their labels
+        mean, std: Scaler parameters of those columns
+        raw_dir: Raw recordings to tune the bias on
+        window_size: Frames per window
+        target_recall: Share of onsets the gate must keep
+        holdout: Held-out recording names (preprocess.holdout_recordings)
+            to skip
+
+    Returns:
+        config.json ``gate`` block
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    classifier = LogisticRegression(class_weight="balanced")
+    classifier.fit(X_gate, y)
+
+    # Same score in raw units: what the client computes before scaling
+    std = np.where(std == 0, 1.0, std)
+    weights = classifier.coef_[0] / std
+    offset = -float(np.sum(classifier.coef_[0] * mean / std))
+    columns = gate_columns(window_size)
+
+    holdout = set(holdout or ())
+    onset_scores = []
+    frame_scores = []
+    for path in sorted(Path(raw_dir).glob("*.json")):
+        if path.name in holdout:
+            continue
+        X, labels = load_recording(path, window_size)
+        if len(labels) == 0:
+            continue
+        scores = X[:, columns] @ weights + offset
+        edges = np.diff(np.concatenate([[0], labels, [0]]))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        onset_scores.extend(scores[a:b].max() for a, b in zip(starts, ends))
+        frame_scores.append(scores)
+    if not onset_scores:
+        raise ValueError(f"No labelled recordings in {raw_dir} to tune gate")
+    onset_scores = np.asarray(onset_scores)
+    frame_scores = np.concatenate(frame_scores)
+
+    cut = float(np.quantile(onset_scores, 1 - target_recall))
+    return {
+        "features": list(GATE_FEATURES),
+        "columns": columns,
+        "weights": [float(value) for value in weights],
+        "bias": offset - cut,
+        "targetRecall": target_recall,
+        "onsetRecall": float((onset_scores >= cut).mean()),
+        "passRate": float((frame_scores >= cut).mean()),
+    }
+
+
+def gate_mask(gate: dict, X: np.ndarray) -> np.ndarray:
+    """Which full-width, unscaled windows the gate passes to the model."""
+    score = X[:, gate["columns"]] @ np.asarray(gate["weights"]) + gate["bias"]
+    return score >= 0
+
+
+def cascade_predict(model, X: np.ndarray) -> tuple:
+    """
+    Gate, then score the passed windows with the model.
+
+    Returns:
+        (probabilities with 0 for gated-out windows, gate mask)
+    """
+    gate = model.config.get("gate")
+    if gate is None:
+        return model.predict(X), np.ones(len(X), dtype=bool)
+    passed = gate_mask(gate, X)
+    probabilities = np.zeros(len(X), dtype=np.float32)
+    if passed.any():
+        probabilities[passed] = model.predict(X[passed])
+    return probabilities, passed
+
+
+def _onsets_reached(
+    probabilities: np.ndarray,
+    labels: np.ndarray,
+    threshold: float,
+    tolerance: int,
+) -> int:
+    """
+    Labelled onsets with a frame above the threshold within ``tolerance``.
+
+    Each onset counts once, however the frames around it are split into
+    runs, so gating frames out can only lower this count.
+    """
+    above = np.asarray(probabilities) > threshold
+    return sum(
+        bool(above[max(0, event - tolerance) : event + tolerance + 1].any())
+        for event in label_events(labels)
+    )
+
+
+def cascade_report(
+    tfjs_path: Path,
+    raw_dir: Path,
+    tolerance: int = 2,
+    recordings: list | None = None,
+) -> dict:
+    """
+    Frames skipped and recall lost by the gate on full recordings.
+
+    Every window (extract_features, no balancing) is scored once by the
+    model alone and once through the cascade. ``recordings`` limits this to
+    the held-out recordings (preprocess.holdout_recordings), which neither
+    the model nor the gate bias saw; without it every recording is scored
+    and the numbers are in-sample.
+
+    ``event_recall_loss`` compares the share of labelled onsets with any
+    frame above the threshold within ``tolerance``, one per onset. The
+    gate only zeroes probabilities, so the loss is never negative. The
+    event F1 of rising edges is reported too, but gating can split one run
+    above the threshold into several edges, so its recall may even rise.
+    """
+    model = load_tfjs_model(tfjs_path)
+    threshold = model.config["optimalThreshold"]
+    counts = {"model": np.zeros(3, int), "cascade": np.zeros(3, int)}
+    reached = {"model": 0, "cascade": 0}
+    n_windows = n_passed = n_onset_frames = n_onset_passed = 0
+    n_recordings = n_onsets = 0
+    for path in sorted(Path(raw_dir).glob("*.json")):
+        if recordings is not None and path.name not in recordings:
+            continue
+        X, y = load_recording(path)
+        if len(y) == 0:
+            continue
+        n_recordings += 1
+        gated, passed = cascade_predict(model, X)
+        full = model.predict(X)
+        counts["model"] += recording_event_counts(
+            full, y, threshold, tolerance
+        )
+        counts["cascade"] += recording_event_counts(
+            gated, y, threshold, tolerance
+        )
+        reached["model"] += _onsets_reached(full, y, threshold, tolerance)
+        reached["cascade"] += _onsets_reached(gated, y, threshold, tolerance)
+        n_onsets += len(label_events(y))
+        n_windows += len(y)
+        n_passed += int(passed.sum())
+        n_onset_frames += int(y.sum())
+        n_onset_passed += int(passed[y == 1].sum())
+
+    model_events = event_scores(*map(int, counts["model"]))
+    cascade_events = event_scores(*map(int, counts["cascade"]))
+    onset_recall = {
+        key: value / n_onsets if n_onsets else 0.0
+        for key, value in reached.items()
+    }
+    return {
+        "recordings": n_recordings,
+        "held_out": recordings is not None,
+        "windows": n_windows,
+        "skipped_fraction": 1 - n_passed / n_windows if n_windows else 0.0,
+        "onset_frame_recall": (
+            n_onset_passed / n_onset_frames if n_onset_frames else 0.0
+        ),
+        "model_events": model_events,
+        "cascade_events": cascade_events,
+        "onset_recall": onset_recall,
+        "event_recall_loss": onset_recall["model"] - onset_recall["cascade"],
+    }
+
+
+def print_cascade_report(report: dict) -> None:
+    model = report["model_events"]
+    cascade = report["cascade_events"]
+    onset_recall = report["onset_recall"]
+    scope = "held-out" if report["held_out"] else "in-sample"
+    print(
+        f"\nCascade gate on {report['recordings']} {scope} full recordings "
+        f"({report['windows']} windows):"
+    )
+    print(f"  Frames skipped: {report['skipped_fraction']:.1%}")
+    print(f"  Onset frames kept by gate: {report['onset_frame_recall']:.2%}")
+    print(
+        f"  Onset recall: {onset_recall['model']:.4f} -> "
+        f"{onset_recall['cascade']:.4f} "
+        f"(loss {report['event_recall_loss']:.4f})"
+    )
+    print(f"  Event F1: {model['f1']:.4f} -> {cascade['f1']:.4f}")
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Measure the cascade gate of an exported model"
+    )
+    parser.add_argument(
+        "--model-dir",
+        default=str(training_dir / "models" / "saved" / "tfjs_model"),
+    )
+    parser.add_argument(
+        "--raw-dir", default=str(training_dir / "data" / "raw")
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=str(training_dir / "data" / "processed"),
+        help="Processed dataset whose metadata lists the held-out "
+        "recordings",
+    )
+    parser.add_argument("--tolerance", type=int, default=2)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    report = cascade_report(
+        Path(args.model_dir),
+        Path(args.raw_dir),
+        args.tolerance,
+        holdout_recordings(args.data_dir) or None,
+    )
+    print_cascade_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
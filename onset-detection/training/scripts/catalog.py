@@ -0,0 +1,285 @@
+"""
+Per-recording statistics catalog of the raw corpus (SQLite).
+
+Selecting a training subset ("recordings with at least 50 onsets and
+little silence") used to mean parsing every JSON file. The catalog keeps
+one row per recording:
+
+- name, instrument (from the file name), size, mtime_ns, content_hash
+- n_frames, duration_s, hop_mean_ms, hop_std_ms (timestamp deltas)
+- n_onsets (manual onsets, i.e. runs of hasManualOnset frames),
+  onset_frames (positive-label frames)
+- active_frames and silent_fraction (frames removed by the
+  MIN_AMPLITUDE/MIN_ACTIVITY filter of extract_features)
+
+Updates are incremental: only files whose size or mtime changed are read,
+in parallel worker processes; rows of deleted files are removed. A query
+is a SQL ``WHERE`` expression over these columns, for example::
+
+    python scripts/catalog.py --query "n_onsets >= 50 AND hop_std_ms < 1"
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+
+from preprocess import MIN_ACTIVITY, MIN_AMPLITUDE, instrument_from_filename
+
+CATALOG_NAME = "catalog.sqlite"
+
+COLUMNS = {
+    "path": "TEXT PRIMARY KEY",
+    "directory": "TEXT NOT NULL",
+    "name": "TEXT NOT NULL",
+    "instrument": "TEXT",
+    "size": "INTEGER",
+    "mtime_ns": "INTEGER",
+    "content_hash": "TEXT",
+    "n_frames": "INTEGER",
+    "duration_s": "REAL",
+    "hop_mean_ms": "REAL",
+    "hop_std_ms": "REAL",
+    "n_onsets": "INTEGER",
+    "onset_frames": "INTEGER",
+    "active_frames": "INTEGER",
+    "silent_fraction": "REAL",
+}
+
+
+def default_catalog_path(raw_dir) -> Path:
+    """data/raw -> data/catalog.sqlite (shared by sibling directories)."""
+    return Path(raw_dir).resolve().parent / CATALOG_NAME
+
+
+def recording_stats(path) -> dict:
+    """Read one recording and compute its catalog row."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    with open(path, "rb") as f:
+        raw = f.read()
+    data = json.loads(raw)
+
+    n_frames = len(data)
+    timestamps = np.array([frame["timestamp"] for frame in data], np.float64)
+    hops = np.diff(timestamps)
+    onset = np.array(
+        [bool(frame.get("hasManualOnset", False)) for frame in data]
+    )
+    active = onset | np.array(
+        [
+            frame["amplitude"] > MIN_AMPLITUDE
+            or frame["spectralFlux"] > MIN_ACTIVITY
+            or frame["phaseDeviation"] > MIN_ACTIVITY
+            for frame in data
+        ],
+        dtype=bool,
+    )
+    onset_starts = onset & ~np.concatenate([[False], onset[:-1]])
+
+    return {
+        "path": str(path),
+        "directory": str(path.parent),
+        "name": path.name,
+        "instrument": instrument_from_filename(path.name),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "content_hash": hashlib.sha256(raw).hexdigest(),
+        "n_frames": n_frames,
+        "duration_s": (
+            float(timestamps[-1] - timestamps[0]) / 1000 if n_frames else 0.0
+        ),
+        "hop_mean_ms": float(hops.mean()) if len(hops) else None,
+        "hop_std_ms": float(hops.std()) if len(hops) else None,
+        "n_onsets": int(onset_starts.sum()),
+        "onset_frames": int(onset.sum()),
+        "active_frames": int(active.sum()),
+        "silent_fraction": (1 - float(active.mean()) if n_frames else 1.0),
+    }
+
+
+def connect(catalog_path) -> sqlite3.Connection:
+    """Open (and create if needed) the catalog database."""
+    Path(catalog_path).parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(catalog_path))
+    columns = ", ".join(f"{name} {kind}" for name, kind in COLUMNS.items())
+    connection.execute(f"CREATE TABLE IF NOT EXISTS recordings ({columns})")
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS recordings_directory "
+        "ON recordings (directory)"
+    )
+    return connection
+
+
+def update_catalog(
+    raw_dir,
+    catalog_path=None,
+    jobs: int | None = None,
+    verbose: bool = True,
+) -> dict:
+    """
+    Bring the catalog rows of raw_dir up to date.
+
+    Args:
+        raw_dir: Directory of raw JSON recordings
+        catalog_path: SQLite file (default: default_catalog_path(raw_dir))
+        jobs: Worker processes for changed files (default: CPU count)
+        verbose: Print a one-line summary
+
+    Returns:
+        Counts of "scanned", "unchanged" and "removed" files
+    """
+    raw_path = Path(raw_dir).resolve()
+    catalog_path = catalog_path or default_catalog_path(raw_path)
+    connection = connect(catalog_path)
+    try:
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in connection.execute(
+                "SELECT path, size, mtime_ns FROM recordings "
+                "WHERE directory = ?",
+                (str(raw_path),),
+            )
+        }
+        current = set()
+        changed = []
+        for json_file in sorted(raw_path.glob("*.json")):
+            stat = json_file.stat()
+            current.add(str(json_file))
+            if known.get(str(json_file)) != (stat.st_size, stat.st_mtime_ns):
+                changed.append(str(json_file))
+
+        rows = []
+        if len(changed) > 1 and (jobs or os.cpu_count() or 1) > 1:
+            ctx = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+                rows = list(
+                    pool.map(
+                        recording_stats,
+                        changed,
+                        chunksize=max(1, len(changed) // 64),
+                    )
+                )
+        else:
+            rows = [recording_stats(path) for path in changed]
+
+        removed = [path for path in known if path not in current]
+        with connection:
+            connection.executemany(
+                "DELETE FROM recordings WHERE path = ?",
+                [(path,) for path in removed],
+            )
+            placeholders = ", ".join("?" for _ in COLUMNS)
+            connection.executemany(
+                f"INSERT OR REPLACE INTO recordings ({', '.join(COLUMNS)}) "
+                f"VALUES ({placeholders})",
+                [tuple(row[name] for name in COLUMNS) for row in rows],
+            )
+    finally:
+        connection.close()
+
+    counts = {
+        "scanned": len(changed),
+        "unchanged": len(current) - len(changed),
+        "removed": len(removed),
+    }
+    if verbose:
+        print(
+            f"Catalog {catalog_path}: {counts['scanned']} scanned, "
+            f"{counts['unchanged']} unchanged, {counts['removed']} removed"
+        )
+    return counts
+
+
+def query_catalog(
+    raw_dir,
+    query: str | None = None,
+    catalog_path=None,
+    update: bool = True,
+) -> list:
+    """
+    Catalog rows of raw_dir matching a SQL WHERE expression.
+
+    Args:
+        raw_dir: Directory of raw JSON recordings
+        query: WHERE expression over the catalog columns (None: all rows)
+        catalog_path: SQLite file (default: default_catalog_path(raw_dir))
+        update: Refresh the catalog first (reads only changed files)
+
+    Returns:
+        Matching rows as dicts, ordered by file name
+    """
+    raw_path = Path(raw_dir).resolve()
+    catalog_path = catalog_path or default_catalog_path(raw_path)
+    if update:
+        update_catalog(raw_path, catalog_path)
+    connection = connect(catalog_path)
+    connection.row_factory = sqlite3.Row
+    try:
+        rows = connection.execute(
+            "SELECT * FROM recordings WHERE directory = ? "
+            f"AND ({query or '1'}) ORDER BY name",
+            (str(raw_path),),
+        ).fetchall()
+    except sqlite3.OperationalError as err:
+        raise ValueError(f"Invalid catalog query {query!r}: {err}") from err
+    finally:
+        connection.close()
+    return [dict(row) for row in rows]
+
+
+def select_recordings(raw_dir, query: str, catalog_path=None) -> list:
+    """Paths of the recordings in raw_dir matching a catalog query."""
+    return [
+        Path(row["path"])
+        for row in query_catalog(raw_dir, query, catalog_path)
+    ]
+
+
+def print_rows(rows: list) -> None:
+    print(
+        f"{'name':<40} {'frames':>7} {'dur s':>7} {'onsets':>6} "
+        f"{'silent':>7} {'hop ms':>7} {'± ms':>6}"
+    )
+    for row in rows:
+        hop_mean = row["hop_mean_ms"] or 0.0
+        hop_std = row["hop_std_ms"] or 0.0
+        print(
+            f"{row['name']:<40} {row['n_frames']:>7} "
+            f"{row['duration_s']:>7.1f} {row['n_onsets']:>6} "
+            f"{row['silent_fraction']:>7.1%} {hop_mean:>7.2f} "
+            f"{hop_std:>6.2f}"
+        )
+    print(f"{len(rows)} recordings")
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Build and query the raw recording catalog"
+    )
+    parser.add_argument(
+        "raw_dir", nargs="?", default=str(training_dir / "data" / "raw")
+    )
+    parser.add_argument(
+        "--catalog", help="SQLite file (default: <raw_dir>/../catalog.sqlite)"
+    )
+    parser.add_argument("--jobs", type=int, help="Worker processes")
+    parser.add_argument(
+        "--query",
+        help='SQL WHERE expression, e.g. "n_onsets >= 50 AND '
+        'silent_fraction < 0.3"',
+    )
+    args = parser.parse_args()
+
+    update_catalog(args.raw_dir, args.catalog, jobs=args.jobs)
+    print_rows(
+        query_catalog(args.raw_dir, args.query, args.catalog, update=False)
+    )
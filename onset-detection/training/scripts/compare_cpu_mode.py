@@ -0,0 +1,207 @@
+"""
+Compare default training against the CPU performance mode.
+
+Trains the model twice on the same preprocessed data and split: once with
+the current defaults (batch 256, default thread pools) and once with
+train.py --cpu-mode, which compiles with XLA. With --no-xla a third run
+trains the CPU mode without XLA. Each run is a separate process because
+TensorFlow thread pools can only be configured once per process.
+
+Reports epoch time and the validation metrics of the kept (best) weights,
+and flags the CPU mode if its validation AUC drops by more than the
+tolerance. Nothing is published to the app.
+"""
+
+import argparse
+import json
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+
+def _train_once(data_dir: str, output_dir: str, options: dict) -> dict:
+    from profiling import Profiler
+    from train import train_model
+
+    profiler = Profiler(enabled=True)
+    train_model(
+        data_dir,
+        output_dir,
+        profiler=profiler,
+        publish=False,
+        plot_history=False,
+        **options,
+    )
+    with open(Path(output_dir) / "training_metadata.json", "r") as f:
+        metadata = json.load(f)
+    metadata["epoch_wall_s"] = [epoch["wall_s"] for epoch in profiler.epochs]
+    return metadata
+
+
+def _summarize(metadata: dict) -> dict:
+    epoch_times = metadata["epoch_wall_s"]
+    # The first epoch includes tracing/XLA compilation
+    steady = epoch_times[1:] or epoch_times
+    return {
+        "batch_size": metadata["batch_size"],
+        "epochs": metadata["epochs"],
+        "fit_seconds": metadata["fit_seconds"],
+        "first_epoch_s": epoch_times[0] if epoch_times else None,
+        "steady_epoch_s": sum(steady) / len(steady) if steady else None,
+        "val_loss": metadata["best_val_metrics"]["loss"],
+        "val_auc": metadata["best_val_metrics"]["auc"],
+        "val_precision": metadata["best_val_metrics"]["precision"],
+        "val_recall": metadata["best_val_metrics"]["recall"],
+    }
+
+
+def compare_cpu_mode(
+    data_dir: str,
+    epochs: int = 30,
+    cpu_options: dict | None = None,
+    auc_tolerance: float = 0.01,
+    no_xla: bool = False,
+) -> dict:
+    """
+    Train with the defaults and with cpu_mode, and compare.
+
+    Args:
+        data_dir: Directory containing preprocessed data
+        epochs: Maximum epochs for both runs (early stopping still applies)
+        cpu_options: Extra train_model arguments for the CPU mode run
+        auc_tolerance: Allowed drop in validation AUC for the CPU mode
+        no_xla: Also train the CPU mode with XLA disabled
+
+    Returns:
+        Comparison dictionary
+    """
+    from train import BASE_BATCH_SIZE, CPU_MODE_BATCH_SIZE
+
+    runs = {
+        "default": {"epochs": epochs, "batch_size": BASE_BATCH_SIZE},
+        "cpu_mode": {
+            "epochs": epochs,
+            "batch_size": CPU_MODE_BATCH_SIZE,
+            "cpu_mode": True,
+            **(cpu_options or {}),
+        },
+    }
+    if no_xla:
+        runs["cpu_mode_no_xla"] = {**runs["cpu_mode"], "xla": False}
+
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="onset-cpu-mode-") as tmp:
+        for name, options in runs.items():
+            print(f"\n=== Training: {name} ===")
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                metadata = pool.submit(
+                    _train_once, data_dir, str(Path(tmp) / name), options
+                ).result()
+            results[name] = _summarize(metadata)
+
+    default = results["default"]
+    comparison = {"runs": results}
+    for name, fast in results.items():
+        if name == "default":
+            continue
+        val_auc_delta = fast["val_auc"] - default["val_auc"]
+        comparison[name] = {
+            "steady_epoch_speedup": (
+                default["steady_epoch_s"] / fast["steady_epoch_s"]
+                if fast["steady_epoch_s"]
+                else None
+            ),
+            "fit_speedup": default["fit_seconds"] / fast["fit_seconds"],
+            "val_auc_delta": val_auc_delta,
+            "accuracy_ok": val_auc_delta >= -auc_tolerance,
+        }
+    return comparison
+
+
+def print_comparison(comparison: dict) -> None:
+    runs = comparison["runs"]
+    names = list(runs)
+    print("\nCPU mode comparison:")
+    print(f"  {'':<16} " + " ".join(f"{name:>12}" for name in names))
+    for key in (
+        "batch_size",
+        "epochs",
+        "fit_seconds",
+        "first_epoch_s",
+        "steady_epoch_s",
+        "val_loss",
+        "val_auc",
+        "val_precision",
+        "val_recall",
+    ):
+        values = [runs[name][key] for name in names]
+        fmt = "{:>12}" if isinstance(values[0], int) else "{:>12.4f}"
+        print(f"  {key:<16} " + " ".join(fmt.format(v) for v in values))
+    for name in names[1:]:
+        result = comparison[name]
+        print(f"\n  {name} vs default:")
+        if result["steady_epoch_speedup"]:
+            print(
+                "    Steady-state epoch speedup: "
+                f"{result['steady_epoch_speedup']:.2f}x"
+            )
+        print(f"    Total fit speedup: {result['fit_speedup']:.2f}x")
+        print(f"    Validation AUC delta: {result['val_auc_delta']:+.4f}")
+        if not result["accuracy_ok"]:
+            print("    ⚠️  Lost accuracy beyond the tolerance")
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Compare default training against --cpu-mode"
+    )
+    parser.add_argument(
+        "--data-dir", default=str(training_dir / "data" / "processed")
+    )
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--cpu-batch-size", type=int)
+    parser.add_argument("--intra-op-threads", type=int)
+    parser.add_argument("--inter-op-threads", type=int)
+    parser.add_argument("--warmup-epochs", type=int)
+    parser.add_argument("--auc-tolerance", type=float, default=0.01)
+    parser.add_argument(
+        "--no-xla",
+        action="store_true",
+        help="Also compare CPU mode without XLA",
+    )
+    parser.add_argument(
+        "--output",
+        default=str(training_dir / "models" / "saved" / "cpu_mode.json"),
+    )
+    args = parser.parse_args()
+
+    cpu_options = {
+        key: value
+        for key, value in {
+            "batch_size": args.cpu_batch_size,
+            "intra_op_threads": args.intra_op_threads,
+            "inter_op_threads": args.inter_op_threads,
+            "warmup_epochs": args.warmup_epochs,
+        }.items()
+        if value is not None
+    }
+
+    comparison = compare_cpu_mode(
+        args.data_dir,
+        args.epochs,
+        cpu_options,
+        args.auc_tolerance,
+        args.no_xla,
+    )
+    print_comparison(comparison)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(comparison, f, indent=2)
+    print(f"\nComparison saved to {output_path}")
@@ -0,0 +1,178 @@
+"""
+On-disk format of the preprocessed dataset.
+
+Two formats are supported:
+
+- "npy": X.npy (scaled float64), y.npy (int64), instruments.npy (int8).
+  This is the original layout and still the default.
+- "compact": dataset.json plus shards/shard-NNNNN.npz, written with
+  np.savez_compressed in chunks of ``shard_rows`` windows. Each shard
+  holds X, the labels bit-packed into uint8 (np.packbits), and the
+  instrument ids. X is stored as scaled float32, or as unscaled float16
+  with ``feature_dtype="float16"``. In that case the loader applies the
+  scaler from scaler.json in float32. Scaled features cover several
+  orders of magnitude around zero, while the raw features are bounded, so
+  half precision is only used before scaling.
+
+load_dataset() reads either format. Compact shards are decompressed in a
+thread pool (zlib releases the GIL) straight into one preallocated array.
+"""
+
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+
+DATASET_FORMATS = ("npy", "compact")
+FEATURE_DTYPES = ("float32", "float16")
+MANIFEST_NAME = "dataset.json"
+SHARDS_DIR = "shards"
+SHARD_ROWS = 65536
+NPY_FILES = ("X.npy", "y.npy", "instruments.npy")
+
+
+def _remove_stale(output_dir: Path, dataset_format: str) -> None:
+    """Delete the other format's files so loaders never see both."""
+    if dataset_format == "compact":
+        for name in NPY_FILES:
+            (output_dir / name).unlink(missing_ok=True)
+    else:
+        (output_dir / MANIFEST_NAME).unlink(missing_ok=True)
+    shutil.rmtree(output_dir / SHARDS_DIR, ignore_errors=True)
+
+
+def save_dataset(
+    output_dir,
+    X_scaled: np.ndarray,
+    y: np.ndarray,
+    instruments: np.ndarray,
+    dataset_format: str = "npy",
+    X_raw: np.ndarray | None = None,
+    feature_dtype: str = "float32",
+    shard_rows: int = SHARD_ROWS,
+) -> dict:
+    """
+    Write the preprocessed dataset.
+
+    Args:
+        output_dir: Processed data directory
+        X_scaled: Scaled features
+        y: Binary labels
+        instruments: Instrument id per window
+        dataset_format: One of DATASET_FORMATS
+        X_raw: Unscaled features (required for float16)
+        feature_dtype: Feature dtype of the compact format
+        shard_rows: Windows per compact shard
+
+    Returns:
+        {"format", "files", "bytes"} of what was written
+    """
+    if dataset_format not in DATASET_FORMATS:
+        raise ValueError(f"Unknown dataset format: {dataset_format}")
+    if feature_dtype not in FEATURE_DTYPES:
+        raise ValueError(f"Unknown feature dtype: {feature_dtype}")
+    output_dir = Path(output_dir)
+    _remove_stale(output_dir, dataset_format)
+
+    if dataset_format == "npy":
+        files = [output_dir / name for name in NPY_FILES]
+        for path, array in zip(files, (X_scaled, y, instruments)):
+            np.save(path, array)
+    else:
+        scaled = feature_dtype == "float32"
+        if not scaled and X_raw is None:
+            raise ValueError("float16 storage needs the unscaled features")
+        X = (X_scaled if scaled else X_raw).astype(feature_dtype)
+        shards_dir = output_dir / SHARDS_DIR
+        shards_dir.mkdir(parents=True)
+        shards = []
+        for index, start in enumerate(range(0, len(y), shard_rows)):
+            end = min(start + shard_rows, len(y))
+            name = f"{SHARDS_DIR}/shard-{index:05d}.npz"
+            np.savez_compressed(
+                output_dir / name,
+                X=X[start:end],
+                y=np.packbits(y[start:end].astype(bool)),
+                instruments=instruments[start:end].astype(np.int8),
+            )
+            shards.append({"file": name, "rows": end - start})
+        manifest = {
+            "format": "compact",
+            "n_samples": int(len(y)),
+            "n_features": int(X.shape[1]),
+            "feature_dtype": feature_dtype,
+            "scaled": scaled,
+            "shards": shards,
+        }
+        with open(output_dir / MANIFEST_NAME, "w") as f:
+            json.dump(manifest, f, indent=2)
+        files = [output_dir / MANIFEST_NAME] + [
+            output_dir / shard["file"] for shard in shards
+        ]
+
+    return {
+        "format": dataset_format,
+        "files": [path.relative_to(output_dir).as_posix() for path in files],
+        "bytes": sum(path.stat().st_size for path in files),
+    }
+
+
+def load_dataset(
+    data_dir, with_instruments: bool = False, jobs: int | None = None
+) -> tuple:
+    """
+    Load the preprocessed dataset in either format.
+
+    Args:
+        data_dir: Processed data directory
+        with_instruments: Also return the instrument id per window
+        jobs: Decompression threads for compact shards (default: CPU count)
+
+    Returns:
+        (X, y) or (X, y, instruments); X is scaled. The compact format
+        returns float32 X and uint8 y
+    """
+    data_dir = Path(data_dir)
+    manifest_path = data_dir / MANIFEST_NAME
+    if not manifest_path.exists():
+        X = np.load(data_dir / "X.npy")
+        y = np.load(data_dir / "y.npy")
+        if with_instruments:
+            return X, y, np.load(data_dir / "instruments.npy")
+        return X, y
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    n_samples = manifest["n_samples"]
+    X = np.empty((n_samples, manifest["n_features"]), dtype=np.float32)
+    y = np.empty(n_samples, dtype=np.uint8)
+    instruments = np.empty(n_samples, dtype=np.int8)
+
+    mean = std = None
+    if not manifest["scaled"]:
+        with open(data_dir / "scaler.json", "r") as f:
+            scaler_data = json.load(f)
+        mean = np.asarray(scaler_data["mean"], dtype=np.float32)
+        std = np.asarray(scaler_data["std"], dtype=np.float32)
+
+    offsets = np.cumsum([0] + [shard["rows"] for shard in manifest["shards"]])
+
+    def load_shard(index):
+        shard = manifest["shards"][index]
+        start, end = offsets[index], offsets[index + 1]
+        with np.load(data_dir / shard["file"]) as data:
+            X[start:end] = data["X"]
+            y[start:end] = np.unpackbits(data["y"], count=shard["rows"])
+            instruments[start:end] = data["instruments"]
+        if mean is not None:
+            X[start:end] -= mean
+            X[start:end] /= std
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        list(pool.map(load_shard, range(len(manifest["shards"]))))
+
+    if with_instruments:
+        return X, y, instruments
+    return X, y
@@ -0,0 +1,324 @@
+"""
+Find near-duplicate recordings in the raw corpus.
+
+The same exercise is often recorded many times. Such takes produce nearly
+the same windows, which costs training time and puts copies of one take
+on both sides of the train/validation split.
+
+Each recording gets a compact MinHash signature:
+
+1. Amplitude, spectral flux and phase deviation are divided by their
+   ``LEVEL_PERCENTILE`` percentile in the recording, so input gain cancels
+   out. The silence filter is then applied relative to that level
+   (``RELATIVE_FLOOR``), with the same hasManualOnset override as
+   extract_features, so the same frames survive at any gain.
+2. Onset events are found on the normalized flux of the active frames with
+   hysteresis: an event fires when flux rises above ``ONSET_ON`` and the
+   detector re-arms only after it drops below ``ONSET_OFF``. Frame noise
+   does not add or remove events.
+3. Each event becomes a token: the log2-quantized number of active frames
+   since the previous event, whether the frame two after it is pitched,
+   and whether silence was removed in between.
+4. Runs of ``shingle_size`` consecutive tokens are hashed into shingles.
+   Shingles do not depend on where a passage starts, so takes with
+   different lead-in silence still match.
+5. ``n_perm`` salted 64-bit hashes of the shingle set give the MinHash
+   signature. The share of equal positions estimates the Jaccard
+   similarity of two recordings.
+
+Locality-sensitive hashing (``bands`` x ``rows`` of the signature) only
+compares recordings that share a band bucket, so finding duplicates is
+roughly linear in the corpus size. Candidate pairs at or above the
+similarity threshold are merged into clusters.
+"""
+
+import argparse
+import json
+from pathlib import Path
+import numpy as np
+
+from preprocess import load_json_file
+
+DEDUP_MODES = ("off", "report", "drop", "downweight")
+# Measured on synthetic corpora (see the "Deduplication" README section):
+# unrelated takes reach at most 0.03; the same take scores 1.0 at any gain,
+# >= 0.89 with 10% and >= 0.6 with 20% per-frame noise
+DEFAULT_THRESHOLD = 0.5
+
+LEVEL_PERCENTILE = 99.0
+RELATIVE_FLOOR = 0.05
+ONSET_ON = 0.4
+ONSET_OFF = 0.2
+INTERVAL_STEP = 0.25  # log2 units per interval token level
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    """Vectorized splitmix64 finalizer (uint64 in, uint64 out)."""
+    with np.errstate(over="ignore"):
+        x = (x + np.uint64(0x9E3779B97F4A7C15)) & _MASK64
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def onset_tokens(data: list) -> np.ndarray:
+    """
+    Gain-independent token per onset event of a recording.
+
+    Args:
+        data: Frames in the recording format
+
+    Returns:
+        uint64 token per event after the first (see module docstring)
+    """
+
+    def normalized(name):
+        values = np.array([frame[name] for frame in data], np.float64)
+        level = np.percentile(values, LEVEL_PERCENTILE) if len(values) else 0
+        return values / level if level > 0 else values
+
+    amplitude = normalized("amplitude")
+    flux = normalized("spectralFlux")
+    phase = normalized("phaseDeviation")
+    pitch = np.array([bool(frame["hasPitch"]) for frame in data])
+    onset = np.array(
+        [bool(frame.get("hasManualOnset", False)) for frame in data]
+    )
+    active = (
+        (amplitude > RELATIVE_FLOOR)
+        | (flux > RELATIVE_FLOOR)
+        | (phase > RELATIVE_FLOOR)
+        # Always keep onset frames, as extract_features does
+        | onset
+    )
+    positions = np.flatnonzero(active)
+    flux = flux[active]
+
+    # Hysteresis: among frames above ONSET_ON or below ONSET_OFF, an event
+    # is a rise whose previous such frame was a fall (or the first one)
+    marked = np.flatnonzero((flux > ONSET_ON) | (flux < ONSET_OFF))
+    rising = flux[marked] > ONSET_ON
+    events = marked[rising & ~np.concatenate([[False], rising[:-1]])]
+    if len(events) < 2:
+        return np.empty(0, dtype=np.uint64)
+
+    interval = np.round(np.log2(np.diff(events)) / INTERVAL_STEP)
+    pitched = pitch[positions[np.minimum(events[1:] + 2, len(flux) - 1)]]
+    after_silence = np.diff(positions[events]) > np.diff(events)
+    tokens = (interval.astype(np.int64) * 2 + pitched) * 2 + after_silence
+    return tokens.astype(np.uint64)
+
+
+def shingles(tokens: np.ndarray, shingle_size: int = 3) -> np.ndarray:
+    """Unique hashes of every run of ``shingle_size`` consecutive tokens."""
+    if len(tokens) < shingle_size:
+        return np.unique(_splitmix64(tokens))
+    runs = np.lib.stride_tricks.sliding_window_view(tokens, shingle_size)
+    hashes = np.zeros(len(runs), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for i in range(shingle_size):
+            hashes = _splitmix64(hashes ^ runs[:, i])
+    return np.unique(hashes)
+
+
+def minhash(shingle_set: np.ndarray, n_perm: int = 128, seed: int = 1):
+    """
+    MinHash signature of a shingle set.
+
+    Returns:
+        uint64 array of n_perm minimum hash values (all ones if empty)
+    """
+    salts = _splitmix64(np.arange(seed, seed + n_perm, dtype=np.uint64))
+    if len(shingle_set) == 0:
+        return np.full(n_perm, _MASK64, dtype=np.uint64)
+    return _splitmix64(shingle_set[:, None] ^ salts[None, :]).min(axis=0)
+
+
+def recording_signature(
+    data: list,
+    n_perm: int = 128,
+    shingle_size: int = 3,
+) -> np.ndarray:
+    """MinHash signature of one recording (see module docstring)."""
+    return minhash(shingles(onset_tokens(data), shingle_size), n_perm)
+
+
+def lsh_bands(n_perm: int, threshold: float) -> tuple:
+    """
+    (bands, rows) with bands * rows == n_perm whose LSH curve is steepest
+    closest to ``threshold`` ((1 / bands) ** (1 / rows) ~ threshold).
+    """
+    options = [
+        (n_perm // rows, rows)
+        for rows in range(1, n_perm + 1)
+        if n_perm % rows == 0
+    ]
+    return min(
+        options,
+        key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold),
+    )
+
+
+def find_duplicates(
+    signatures: np.ndarray, threshold: float = DEFAULT_THRESHOLD
+) -> tuple:
+    """
+    Cluster recordings whose estimated Jaccard similarity >= threshold.
+
+    Args:
+        signatures: (n_recordings, n_perm) MinHash signatures
+        threshold: Minimum estimated similarity of a duplicate pair
+
+    Returns:
+        (clusters, pairs): clusters as lists of recording indices (only
+        clusters with more than one member), and the confirmed pairs as
+        (i, j, similarity)
+    """
+    n_recordings, n_perm = signatures.shape
+    bands, rows = lsh_bands(n_perm, threshold)
+    # Recordings without any shingle (no onsets) match nothing
+    has_shingles = ~(signatures == _MASK64).all(axis=1)
+
+    candidates = set()
+    for band in range(bands):
+        buckets = {}
+        block = signatures[:, band * rows : (band + 1) * rows]
+        for index in np.flatnonzero(has_shingles):
+            buckets.setdefault(block[index].tobytes(), []).append(int(index))
+        for members in buckets.values():
+            for a in range(len(members)):
+                for b in range(a + 1, len(members)):
+                    candidates.add((members[a], members[b]))
+
+    parent = list(range(n_recordings))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    pairs = []
+    for i, j in sorted(candidates):
+        similarity = float(np.mean(signatures[i] == signatures[j]))
+        if similarity >= threshold:
+            pairs.append((i, j, similarity))
+            parent[root(j)] = root(i)
+
+    groups = {}
+    for index in range(n_recordings):
+        groups.setdefault(root(index), []).append(index)
+    clusters = [members for members in groups.values() if len(members) > 1]
+    return clusters, pairs
+
+
+def dedup_plan(
+    clusters: list,
+    window_counts: list,
+    mode: str,
+    seed: int = 42,
+) -> list:
+    """
+    Per-recording boolean masks of the windows to keep.
+
+    - "report" / "off": keep everything.
+    - "drop": keep the recording with the most windows in each cluster
+      and drop the others.
+    - "downweight": keep each window of a k-member cluster with
+      probability 1/k, so the cluster contributes about one recording's
+      worth of windows.
+
+    Args:
+        clusters: Duplicate clusters from find_duplicates
+        window_counts: Windows per recording
+        mode: One of DEDUP_MODES
+        seed: Random seed for "downweight"
+
+    Returns:
+        List of boolean arrays, one per recording
+    """
+    if mode not in DEDUP_MODES:
+        raise ValueError(f"Unknown dedup mode: {mode}")
+    rng = np.random.default_rng(seed)
+    masks = [np.ones(count, dtype=bool) for count in window_counts]
+    if mode in ("off", "report"):
+        return masks
+    for members in clusters:
+        if mode == "drop":
+            keep = max(members, key=lambda index: window_counts[index])
+            for index in members:
+                if index != keep:
+                    masks[index][:] = False
+        else:
+            for index in members:
+                masks[index] = rng.random(window_counts[index]) < 1 / len(
+                    members
+                )
+    return masks
+
+
+def print_clusters(names: list, clusters: list, pairs: list) -> None:
+    similarity = {}
+    for i, j, value in pairs:
+        similarity[i] = max(similarity.get(i, 0.0), value)
+        similarity[j] = max(similarity.get(j, 0.0), value)
+    print(
+        f"Found {len(clusters)} near-duplicate clusters covering "
+        f"{sum(len(members) for members in clusters)} recordings"
+    )
+    for members in clusters:
+        print("  - " + ", ".join(names[index] for index in members))
+        print(
+            "    max similarity: "
+            + ", ".join(f"{similarity[index]:.2f}" for index in members)
+        )
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Find near-duplicate raw recordings"
+    )
+    parser.add_argument(
+        "raw_dir", nargs="?", default=str(training_dir / "data" / "raw")
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--n-perm", type=int, default=128)
+    parser.add_argument("--shingle-size", type=int, default=3)
+    parser.add_argument("--output", help="Write clusters as JSON")
+    args = parser.parse_args()
+
+    json_files = sorted(Path(args.raw_dir).glob("*.json"))
+    names = [path.name for path in json_files]
+    signatures = np.stack(
+        [
+            recording_signature(
+                load_json_file(str(path)), args.n_perm, args.shingle_size
+            )
+            for path in json_files
+        ]
+    )
+    clusters, pairs = find_duplicates(signatures, args.threshold)
+    print_clusters(names, clusters, pairs)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "threshold": args.threshold,
+                    "clusters": [
+                        [names[index] for index in members]
+                        for members in clusters
+                    ],
+                    "pairs": [
+                        {"a": names[i], "b": names[j], "similarity": value}
+                        for i, j, value in pairs
+                    ],
+                },
+                f,
+                indent=2,
+            )
@@ -2,8 +2,8 @@
 Evaluate the trained onset detection model and convert to TensorFlow.js format.
 """
 
+import argparse
 import json
-import shutil
 from datetime import datetime
 from pathlib import Path
 import numpy as np
@@ -18,6 +18,12 @@ import tensorflowjs as tfjs
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from dataset import load_dataset
+from profiling import Profiler, add_profiling_args, profiler_from_args
+from pack_bundle import pack_bundle, print_report
+from preprocess import holdout_recordings, input_spec, select_scaler
+from publish_model import publish_bundle
+
 
 def _fix_tfjs_input_layer(tfjs_model_json: Path, input_shape) -> None:
     """Ensure tfjs model.json has batch_input_shape for the InputLayer."""
@@ -42,24 +48,13 @@ def _fix_tfjs_input_layer(tfjs_model_json: Path, input_shape) -> None:
             json.dump(data, f, separators=(",", ":"))
 
 
-def _copy_to_static(tfjs_dir: Path) -> None:
-    """Copy exported tfjs model into the app static path."""
-    repo_root = Path(__file__).resolve().parents[3]
-    static_dir = repo_root / "static" / "models" / "onset-model-v1"
-    static_dir.mkdir(parents=True, exist_ok=True)
-    # Copy files individually to avoid stale leftovers
-    for fname in ["model.json", "group1-shard1of1.bin", "config.json"]:
-        src = tfjs_dir / fname
-        if src.exists():
-            shutil.copy2(src, static_dir / fname)
-            print(f"Copied {fname} -> {static_dir}")
-
-
 def evaluate_model(
     model_path: str,
     data_dir: str,
     output_dir: str,
-    copy_to_static: bool = True,
+    publish: bool = True,
+    profiler: Profiler | None = None,
+    merge_metadata: bool = False,
 ):
     """Evaluate the trained model and export a TF.js bundle.
 
@@ -67,8 +62,11 @@ def evaluate_model(
         model_path: Path to the saved Keras model
         data_dir: Directory containing preprocessed data
         output_dir: Directory to save evaluation results and TF.js bundle
-        copy_to_static: Copy the TF.js bundle into the app static folder
+        publish: Publish the TF.js bundle to the app static folder
+        profiler: Optional profiler timing load/predict/export/pack
+        merge_metadata: Merge config.json and scaler.json into model.json
     """
+    profiler = profiler or Profiler()
     model_file = Path(model_path)
     data_path = Path(data_dir)
     output_path = Path(output_dir)
@@ -81,12 +79,26 @@ def evaluate_model(
 
     # Load data
     print("\nLoading data...")
-    X = np.load(data_path / "X.npy")
-    y = np.load(data_path / "y.npy")
+    with profiler.stage("load") as stage:
+        X, y = load_dataset(data_path)
+        stage.set_samples(len(X))
+
+    # Models trained on a feature/lag subset record it next to the weights,
+    # as do models trained with a cascade gate (train.py --cascade)
+    inputs = input_spec()
+    gate = None
+    training_metadata_path = model_file.parent / "training_metadata.json"
+    if training_metadata_path.exists():
+        with open(training_metadata_path, "r") as f:
+            training_metadata = json.load(f)
+        inputs = training_metadata.get("inputs", inputs)
+        gate = training_metadata.get("cascade", {}).get("gate")
+    X = X[:, inputs["columns"]]
 
     # Make predictions
     print("\nMaking predictions...")
-    y_pred_proba = model.predict(X)
+    with profiler.stage("predict", n_samples=len(X)):
+        y_pred_proba = model.predict(X)
     y_pred = (y_pred_proba > 0.5).astype(int).flatten()
 
     # Classification report
@@ -160,7 +172,8 @@ def evaluate_model(
     # Convert to TensorFlow.js format
     print("\nConverting model to TensorFlow.js format...")
     tfjs_path = output_path / "tfjs_model"
-    tfjs.converters.save_keras_model(model, str(tfjs_path))
+    with profiler.stage("export"):
+        tfjs.converters.save_keras_model(model, str(tfjs_path))
     print(f"TensorFlow.js model saved to {tfjs_path}")
 
     # Save model configuration for browser
@@ -170,7 +183,10 @@ def evaluate_model(
         "optimalThreshold": float(optimal_threshold),
         "version": "1.0.0",
         "created": datetime.utcnow().strftime("%Y-%m-%d"),
+        "inputs": inputs,
     }
+    if gate is not None:
+        model_config["gate"] = gate
 
     with open(tfjs_path / "config.json", "w") as f:
         json.dump(model_config, f, indent=2)
@@ -178,14 +194,54 @@ def evaluate_model(
     # Patch tfjs manifest so batch_input_shape is present for tfjs loader
     _fix_tfjs_input_layer(tfjs_path / "model.json", model.input_shape)
 
-    # Copy into app static folder for immediate use
-    if copy_to_static:
-        _copy_to_static(tfjs_path)
+    # Ship the scaler the model was trained with, so the bundle is complete
+    scaler_src = data_path / "scaler.json"
+    if scaler_src.exists():
+        with open(scaler_src, "r") as f:
+            scaler_data = select_scaler(json.load(f), inputs)
+        with open(tfjs_path / "scaler.json", "w") as f:
+            json.dump(scaler_data, f, indent=2)
+    else:
+        print(f"Warning: scaler.json not found at {scaler_src}")
+
+    # Frames skipped and recall lost by the gate on full recordings
+    raw_path = data_path.parent / "raw"
+    if gate is not None and raw_path.exists():
+        from cascade import cascade_report, print_cascade_report
+
+        eval_metadata["cascade"] = cascade_report(
+            tfjs_path,
+            raw_path,
+            recordings=holdout_recordings(data_path) or None,
+        )
+        print_cascade_report(eval_metadata["cascade"])
+        with open(output_path / "evaluation_metadata.json", "w") as f:
+            json.dump(eval_metadata, f, indent=2)
+
+    # Minify and precompress for the browser
+    with profiler.stage("pack"):
+        print_report(pack_bundle(tfjs_path, merge_metadata=merge_metadata))
+
+    # Publish to the app static folder for immediate use
+    if publish:
+        publish_bundle(tfjs_path, reference_model=model)
 
     print("\nEvaluation complete!")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evaluate the onset detection model"
+    )
+    parser.add_argument(
+        "--merge-metadata",
+        action="store_true",
+        help="Merge config.json and scaler.json into model.json",
+    )
+    add_profiling_args(parser)
+    args = parser.parse_args()
+    profiler = profiler_from_args(args)
+
     # Get the directory where this script is located
     script_dir = Path(__file__).parent.resolve()
     training_dir = script_dir.parent
@@ -194,4 +250,11 @@ if __name__ == "__main__":
     data_dir = str(training_dir / "data" / "processed")
     output_dir = str(training_dir / "models" / "saved")
 
-    evaluate_model(model_path, data_dir, output_dir)
+    evaluate_model(
+        model_path,
+        data_dir,
+        output_dir,
+        profiler=profiler,
+        merge_metadata=args.merge_metadata,
+    )
+    profiler.finish(args.trace, args.chrome_trace)
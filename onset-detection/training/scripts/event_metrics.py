@@ -0,0 +1,95 @@
+"""
+Event-level onset metrics on full, unbalanced recordings.
+
+Frame metrics on the balanced training windows say little about how the
+detector behaves in the app, where it sees every frame of a recording. Here
+a recording is windowed in order (preprocess.extract_features, without
+balancing), frame probabilities are turned into onset events and matched
+against the manual onsets:
+
+- A true onset is a run of consecutive positive labels (the ±1 frame
+  tolerance window around each manual onset); its event frame is the run
+  centre.
+- A detected onset is the first frame of a run of probabilities above the
+  threshold.
+- A detection matches a true onset within ``tolerance`` frames; each true
+  onset can be matched once.
+"""
+
+from pathlib import Path
+import numpy as np
+
+from preprocess import extract_features, load_json_file
+
+
+def label_events(labels: np.ndarray) -> np.ndarray:
+    """Frame indices of true onsets (centres of positive label runs)."""
+    labels = np.asarray(labels).astype(bool)
+    edges = np.diff(np.concatenate([[0], labels.astype(np.int8), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return (starts + ends - 1) // 2
+
+
+def detect_events(probabilities: np.ndarray, threshold: float) -> np.ndarray:
+    """Frame indices where probability first rises above the threshold."""
+    above = np.asarray(probabilities) > threshold
+    return np.flatnonzero(above & ~np.concatenate([[False], above[:-1]]))
+
+
+def match_events(
+    detected: np.ndarray, truth: np.ndarray, tolerance: int = 2
+) -> tuple:
+    """
+    Greedily match detections to true onsets in time order.
+
+    Returns:
+        (true_positives, false_positives, false_negatives)
+    """
+    tp = 0
+    j = 0
+    for event in truth:
+        while j < len(detected) and detected[j] < event - tolerance:
+            j += 1
+        if j < len(detected) and detected[j] <= event + tolerance:
+            tp += 1
+            j += 1
+    return tp, len(detected) - tp, len(truth) - tp
+
+
+def event_scores(tp: int, fp: int, fn: int) -> dict:
+    """Precision, recall and F1 from event counts."""
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = (
+        2 * precision * recall / (precision + recall)
+        if precision + recall
+        else 0.0
+    )
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "tp": tp,
+        "fp": fp,
+        "fn": fn,
+    }
+
+
+def load_recording(path, window_size: int = 5) -> tuple:
+    """All windows of one recording in time order: (X, y), unscaled."""
+    return extract_features(load_json_file(str(Path(path))), window_size)
+
+
+def recording_event_counts(
+    probabilities: np.ndarray,
+    labels: np.ndarray,
+    threshold: float,
+    tolerance: int = 2,
+) -> tuple:
+    """(tp, fp, fn) for one recording's frame probabilities."""
+    return match_events(
+        detect_events(probabilities, threshold),
+        label_events(labels),
+        tolerance,
+    )
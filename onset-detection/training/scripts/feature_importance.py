@@ -0,0 +1,263 @@
+"""
+Permutation feature importance for the onset model.
+
+Each window holds 5 features for each of 5 frames. This measures how much
+validation AUC drops when a group of inputs is shuffled across samples:
+
+- per feature (that feature at every lag),
+- per lag (every feature of that frame),
+- per (feature, lag) cell.
+
+Every permuted copy of the validation set is built up front and scored in
+a single batched NumPy forward pass over the exported TF.js bundle, so no
+TensorFlow is needed. Features with no measurable importance are
+candidates for train.py --features/--lags, which lets the browser skip
+their extractors.
+"""
+
+import argparse
+import json
+from pathlib import Path
+import numpy as np
+from scipy.stats import rankdata
+from sklearn.model_selection import train_test_split
+
+from dataset import load_dataset
+from numpy_model import load_tfjs_model
+from preprocess import FEATURE_NAMES, input_spec
+
+
+def batched_auc(probabilities: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """ROC AUC of each row of ``probabilities`` against the same labels."""
+    positives = y == 1
+    n_pos = int(positives.sum())
+    n_neg = len(y) - n_pos
+    ranks = rankdata(probabilities, axis=1)
+    rank_sum = ranks[:, positives].sum(axis=1)
+    return (rank_sum - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg)
+
+
+def batched_log_loss(probabilities: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Binary cross-entropy of each row of ``probabilities``."""
+    p = np.clip(probabilities, 1e-7, 1 - 1e-7)
+    return -np.mean(y * np.log(p) + (1 - y) * np.log(1 - p), axis=1)
+
+
+def permutation_groups(inputs: dict) -> dict:
+    """
+    Map group names to model input positions.
+
+    Positions index the model's own inputs, which may be a subset of the
+    full window (see preprocess.input_spec).
+    """
+    window_size = inputs["windowSize"]
+    positions = {column: i for i, column in enumerate(inputs["columns"])}
+    n_base = len(FEATURE_NAMES)
+
+    def position(feature, lag):
+        feature_index = FEATURE_NAMES.index(feature)
+        return positions[(window_size - 1 - lag) * n_base + feature_index]
+
+    groups = {}
+    for feature in inputs["features"]:
+        groups[f"feature:{feature}"] = [
+            position(feature, lag) for lag in inputs["lags"]
+        ]
+    for lag in inputs["lags"]:
+        groups[f"lag:{lag}"] = [
+            position(feature, lag) for feature in inputs["features"]
+        ]
+    for feature in inputs["features"]:
+        for lag in inputs["lags"]:
+            groups[f"cell:{feature}@{lag}"] = [position(feature, lag)]
+    return groups
+
+
+def permutation_importance(
+    model,
+    X: np.ndarray,
+    y: np.ndarray,
+    groups: dict,
+    n_repeats: int = 5,
+    seed: int = 42,
+) -> dict:
+    """
+    Score every (group, repeat) permutation in one batched predict.
+
+    Args:
+        model: NumpyOnsetModel
+        X: Scaled validation features in the model's input layout
+        y: Validation labels
+        groups: {name: [input positions]} to permute jointly
+        n_repeats: Permutations per group
+        seed: Random seed
+
+    Returns:
+        {"baseline": {...}, "groups": {name: {...}}}
+    """
+    rng = np.random.default_rng(seed)
+    names = list(groups)
+    n_samples, n_inputs = X.shape
+    permutations = np.stack(
+        [rng.permutation(n_samples) for _ in range(n_repeats)]
+    )
+
+    # Block 0 is the unpermuted baseline
+    n_blocks = 1 + len(names) * n_repeats
+    stacked = np.empty((n_blocks, n_samples, n_inputs), dtype=np.float32)
+    stacked[:] = X
+    block = 1
+    for name in names:
+        columns = groups[name]
+        for permutation in permutations:
+            stacked[block][:, columns] = X[permutation][:, columns]
+            block += 1
+
+    probabilities = model.predict(
+        stacked.reshape(-1, n_inputs), scaled=True
+    ).reshape(n_blocks, n_samples)
+    aucs = batched_auc(probabilities, y)
+    losses = batched_log_loss(probabilities, y)
+
+    baseline = {"auc": float(aucs[0]), "log_loss": float(losses[0])}
+    results = {}
+    for i, name in enumerate(names):
+        rows = slice(1 + i * n_repeats, 1 + (i + 1) * n_repeats)
+        auc_drop = aucs[0] - aucs[rows]
+        loss_increase = losses[rows] - losses[0]
+        results[name] = {
+            "auc_drop": float(auc_drop.mean()),
+            "auc_drop_std": float(auc_drop.std()),
+            "log_loss_increase": float(loss_increase.mean()),
+        }
+    return {"baseline": baseline, "groups": results}
+
+
+def compute_feature_importance(
+    model_dir: str,
+    data_dir: str,
+    n_repeats: int = 5,
+    max_samples: int = 5000,
+    seed: int = 42,
+) -> dict:
+    """
+    Permutation importance of an exported model on the validation split.
+
+    Args:
+        model_dir: Exported TF.js bundle
+        data_dir: Directory containing preprocessed data
+        n_repeats: Permutations per group
+        max_samples: Validation samples to use (bounds memory: every
+            permutation of them is held at once)
+        seed: Random seed
+
+    Returns:
+        Importance report
+    """
+    model = load_tfjs_model(model_dir)
+    data_path = Path(data_dir)
+    X, y = load_dataset(data_path)
+    with open(data_path / "metadata.json", "r") as f:
+        window_size = json.load(f)["window_size"]
+
+    # Same split as train.py, so this is data the model did not train on
+    _, X_val, _, y_val = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+    if len(X_val) > max_samples:
+        _, X_val, _, y_val = train_test_split(
+            X_val,
+            y_val,
+            test_size=max_samples,
+            random_state=seed,
+            stratify=y_val,
+        )
+
+    inputs = model.config.get("inputs") or input_spec(window_size)
+    X_val = model.select_inputs(X_val.astype(np.float32))
+    groups = permutation_groups(inputs)
+    print(
+        f"Scoring {len(groups)} groups x {n_repeats} permutations "
+        f"on {len(X_val)} validation samples"
+    )
+
+    report = permutation_importance(
+        model, X_val, y_val, groups, n_repeats, seed
+    )
+    report["inputs"] = inputs
+    report["n_samples"] = len(X_val)
+    report["n_repeats"] = n_repeats
+    return report
+
+
+def print_importance(report: dict) -> None:
+    groups = report["groups"]
+    inputs = report["inputs"]
+    baseline = report["baseline"]
+    print(
+        f"\nBaseline: AUC {baseline['auc']:.4f}, "
+        f"log loss {baseline['log_loss']:.4f}"
+    )
+
+    for kind in ("feature", "lag"):
+        print(f"\nPer {kind} (AUC drop when shuffled):")
+        ranked = sorted(
+            (name for name in groups if name.startswith(f"{kind}:")),
+            key=lambda name: groups[name]["auc_drop"],
+            reverse=True,
+        )
+        for name in ranked:
+            result = groups[name]
+            print(
+                f"  {name.split(':', 1)[1]:<20} "
+                f"{result['auc_drop']:+.4f} ± {result['auc_drop_std']:.4f}"
+            )
+
+    print("\nPer cell (AUC drop, lag 0 = current frame):")
+    lags = inputs["lags"]
+    header = " ".join(f"{'lag ' + str(lag):>8}" for lag in lags)
+    print(f"  {'':<20} {header}")
+    for feature in inputs["features"]:
+        drops = [groups[f"cell:{feature}@{lag}"]["auc_drop"] for lag in lags]
+        print(f"  {feature:<20} " + " ".join(f"{d:>+8.4f}" for d in drops))
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Permutation feature importance per feature and lag"
+    )
+    parser.add_argument(
+        "--model-dir",
+        default=str(training_dir / "models" / "saved" / "tfjs_model"),
+    )
+    parser.add_argument(
+        "--data-dir", default=str(training_dir / "data" / "processed")
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-samples", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--output",
+        default=str(
+            training_dir / "models" / "saved" / "feature_importance.json"
+        ),
+    )
+    args = parser.parse_args()
+
+    report = compute_feature_importance(
+        args.model_dir,
+        args.data_dir,
+        n_repeats=args.repeats,
+        max_samples=args.max_samples,
+        seed=args.seed,
+    )
+    print_importance(report)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nImportance saved to {output_path}")
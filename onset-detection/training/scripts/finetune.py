@@ -0,0 +1,589 @@
+"""
+Warm-start fine-tuning of the onset model on newly added recordings.
+
+Instead of retraining from scratch over the whole corpus, fine-tuning
+continues from models/saved/best_model.keras:
+
+1. New recordings are windowed and balanced exactly like preprocess.py.
+2. They are mixed with windows drawn from a replay buffer, a reservoir
+   sample over every window trained on so far, so the model does not
+   forget older recordings.
+3. The scaler stays fixed (default) or is updated incrementally with the
+   new windows.
+4. Training stops at a time or epoch budget, or early when the validation
+   loss stops improving.
+5. The fine-tuned model is only kept and exported if its AUC on a fixed
+   holdout set is no worse than the previous model's (within a tolerance).
+
+Fine-tuning state (replay buffer, holdout, current scaler and the list of
+recordings already used) lives in data/finetune/ and is created from
+data/processed/ on first use.
+"""
+
+import argparse
+import json
+import pickle
+import shutil
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+from sklearn.model_selection import train_test_split
+from sklearn.utils.class_weight import compute_class_weight
+from tensorflow import keras  # type: ignore
+from tensorflow.keras import callbacks  # type: ignore
+
+from preprocess import (
+    INSTRUMENTS,
+    balance_dataset,
+    extract_features,
+    input_spec,
+    instrument_from_filename,
+    load_json_file,
+    scaler_json,
+)
+from dataset import load_dataset
+from profiling import Profiler, add_profiling_args, profiler_from_args
+from train import export_tfjs_model
+
+
+class ReplayBuffer:
+    """Fixed-size uniform sample of every window added (reservoir sampling).
+
+    Windows are stored unscaled so the buffer survives scaler updates, with
+    their instrument index for multi-head models (0, "generic", if unknown).
+
+    Args:
+        capacity: Maximum number of windows kept
+        n_features: Features per window
+        seed: Random seed
+    """
+
+    def __init__(self, capacity: int, n_features: int, seed: int = 42):
+        self.capacity = capacity
+        self.X = np.empty((0, n_features), dtype=np.float32)
+        self.y = np.empty(0, dtype=np.int64)
+        self.instruments = np.empty(0, dtype=np.int8)
+        self.n_seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return len(self.y)
+
+    def add(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        instruments: np.ndarray | None = None,
+    ) -> None:
+        """Offer windows to the reservoir (Algorithm R)."""
+        X = np.asarray(X, dtype=np.float32)
+        if instruments is None:
+            instruments = np.zeros(len(y), dtype=np.int8)
+        n_fill = min(self.capacity - len(self), len(X))
+        if n_fill > 0:
+            self.X = np.concatenate([self.X, X[:n_fill]])
+            self.y = np.concatenate([self.y, y[:n_fill]])
+            self.instruments = np.concatenate(
+                [self.instruments, instruments[:n_fill]]
+            )
+        self.n_seen += n_fill
+
+        rest = np.arange(n_fill, len(X))
+        # Window i replaces a random slot with probability capacity/(seen+1)
+        slots = self.rng.integers(0, self.n_seen + rest - n_fill + 1)
+        replace = slots < self.capacity
+        for index, slot in zip(rest[replace], slots[replace]):
+            self.X[slot] = X[index]
+            self.y[slot] = y[index]
+            self.instruments[slot] = instruments[index]
+        self.n_seen += len(rest)
+
+    def sample(self, n: int) -> tuple:
+        """Draw up to n windows without replacement: (X, y, instruments)."""
+        n = min(n, len(self))
+        indices = self.rng.choice(len(self), size=n, replace=False)
+        return self.X[indices], self.y[indices], self.instruments[indices]
+
+    def save(self, path: Path) -> None:
+        np.savez(
+            path,
+            X=self.X,
+            y=self.y,
+            instruments=self.instruments,
+            n_seen=self.n_seen,
+            capacity=self.capacity,
+            rng_state=json.dumps(self.rng.bit_generator.state),
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "ReplayBuffer":
+        data = np.load(path)
+        buffer = cls(int(data["capacity"]), data["X"].shape[1])
+        buffer.X = data["X"]
+        buffer.y = data["y"]
+        buffer.instruments = _instruments(data)
+        buffer.n_seen = int(data["n_seen"])
+        buffer.rng.bit_generator.state = json.loads(str(data["rng_state"]))
+        return buffer
+
+
+def _instruments(data) -> np.ndarray:
+    """Instrument indices of a saved buffer or holdout ("generic" for
+    state created before they were stored)."""
+    if "instruments" in data.files:
+        return data["instruments"]
+    return np.zeros(len(data["y"]), dtype=np.int8)
+
+
+class TimeBudget(callbacks.Callback):
+    """Stop training once a wall-clock budget is spent."""
+
+    def __init__(self, seconds: float):
+        super().__init__()
+        self.seconds = seconds
+        self.start = None
+        self.exhausted = False
+
+    def on_train_begin(self, logs=None):
+        self.start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        if time.perf_counter() - self.start > self.seconds:
+            self.exhausted = True
+            self.model.stop_training = True
+
+
+def init_state(
+    state_dir: Path,
+    data_dir: Path,
+    replay_capacity: int = 50000,
+    seed: int = 42,
+) -> None:
+    """
+    Create the fine-tuning state from the preprocessed training data.
+
+    The holdout is train.py's validation split, so it is data the initial
+    model was never fitted on; the replay buffer samples the training split.
+    """
+    state_dir.mkdir(parents=True, exist_ok=True)
+    with open(data_dir / "scaler.pkl", "rb") as f:
+        scaler = pickle.load(f)
+    X, y, instruments = load_dataset(data_dir, with_instruments=True)
+    X = scaler.inverse_transform(X)
+
+    (
+        X_train,
+        X_holdout,
+        y_train,
+        y_holdout,
+        instruments_train,
+        instruments_holdout,
+    ) = train_test_split(
+        X, y, instruments, test_size=0.2, random_state=42, stratify=y
+    )
+    np.savez(
+        state_dir / "holdout.npz",
+        X=X_holdout.astype(np.float32),
+        y=y_holdout,
+        instruments=instruments_holdout,
+    )
+    buffer = ReplayBuffer(replay_capacity, X.shape[1], seed)
+    buffer.add(X_train, y_train, instruments_train)
+    buffer.save(state_dir / "replay.npz")
+
+    shutil.copy2(data_dir / "scaler.pkl", state_dir / "scaler.pkl")
+    shutil.copy2(data_dir / "scaler.json", state_dir / "scaler.json")
+    with open(state_dir / "state.json", "w") as f:
+        json.dump({"recordings": [], "runs": []}, f, indent=2)
+    print(
+        f"Initialized fine-tuning state in {state_dir}: "
+        f"{len(y_holdout)} holdout windows, {len(buffer)} replay windows"
+    )
+
+
+def _holdout_metrics(model, scaler, inputs: dict, holdout, net=None) -> dict:
+    X_scaled = scaler.transform(holdout["X"])[:, inputs["columns"]]
+    if net is None:
+        return model.evaluate(
+            X_scaled,
+            holdout["y"],
+            batch_size=4096,
+            verbose=0,
+            return_dict=True,
+        )
+    metrics = net.model.evaluate(
+        net.inputs(X_scaled, _instruments(holdout)),
+        net.targets(holdout["y"]),
+        batch_size=4096,
+        verbose=0,
+        return_dict=True,
+    )
+    return net.history(metrics)
+
+
+def finetune_model(
+    new_files: list,
+    model_dir: str,
+    data_dir: str,
+    state_dir: str,
+    replay_ratio: float = 1.0,
+    scaler_mode: str = "fixed",
+    learning_rate: float = 1e-4,
+    max_epochs: int = 20,
+    budget_seconds: float = 300.0,
+    batch_size: int = 256,
+    target_positive_ratio: float = 0.20,
+    tolerance: float = 0.002,
+    replay_capacity: int = 50000,
+    publish: bool = True,
+    merge_metadata: bool = False,
+    profiler: Profiler | None = None,
+) -> dict | None:
+    """
+    Fine-tune the saved model on new recordings.
+
+    Args:
+        new_files: Recording JSON files; ones already used are skipped
+        model_dir: Directory with best_model.keras and
+            training_metadata.json (updated in place when accepted)
+        data_dir: Preprocessed data, used to create the state on first run
+        state_dir: Fine-tuning state directory
+        replay_ratio: Replay windows per new window
+        scaler_mode: "fixed" or "incremental" (partial_fit on new windows)
+        learning_rate: Fine-tuning learning rate
+        max_epochs: Epoch budget
+        budget_seconds: Wall-clock training budget
+        batch_size: Batch size
+        target_positive_ratio: Balancing target for the new windows
+        tolerance: Allowed holdout AUC drop versus the previous model
+        replay_capacity: Replay buffer size when creating the state
+        publish: Publish the accepted bundle to the app static folder
+        merge_metadata: Merge config.json and scaler.json into model.json
+        profiler: Optional profiler timing load/fit/predict/export
+
+    Models trained with --cascade keep their gate, and multi-head models
+    (train.py --multi-head) are fine-tuned and exported with all heads,
+    each window training the head of its recording's instrument.
+
+    Returns:
+        Run report, or None if there were no new recordings
+    """
+    profiler = profiler or Profiler()
+    model_path = Path(model_dir)
+    state_path = Path(state_dir)
+    if not (state_path / "state.json").exists():
+        init_state(state_path, Path(data_dir), replay_capacity)
+
+    with open(state_path / "state.json", "r") as f:
+        state = json.load(f)
+    with open(model_path / "training_metadata.json", "r") as f:
+        training_metadata = json.load(f)
+    with open(Path(data_dir) / "metadata.json", "r") as f:
+        metadata = json.load(f)
+    window_size = metadata["window_size"]
+    instrument_names = metadata.get("instruments", INSTRUMENTS)
+    inputs = training_metadata.get("inputs") or input_spec(window_size)
+    # The gate is in raw feature units, so it survives fine-tuning as is
+    gate = (training_metadata.get("cascade") or {}).get("gate")
+    multi_head = "multi_head" in training_metadata
+
+    new_files = [Path(path) for path in new_files]
+    new_files = [p for p in new_files if p.name not in state["recordings"]]
+    if not new_files:
+        print("No new recordings to fine-tune on")
+        return None
+
+    # Window and balance the new recordings like preprocess.py
+    print(f"Fine-tuning on {len(new_files)} new recordings")
+    with profiler.stage("load") as stage:
+        shards_X, shards_y, shards_instruments = [], [], []
+        for path in new_files:
+            features, labels = extract_features(
+                load_json_file(str(path)), window_size
+            )
+            if len(features) > 0:
+                shards_X.append(features)
+                shards_y.append(labels)
+                instrument = instrument_names.index(
+                    instrument_from_filename(path.name)
+                )
+                shards_instruments.append(
+                    np.full(len(labels), instrument, np.int8)
+                )
+        if not shards_X:
+            print("New recordings contain no usable windows")
+            return None
+        X_new, y_new, keep_indices = balance_dataset(
+            np.vstack(shards_X),
+            np.concatenate(shards_y),
+            target_positive_ratio,
+            return_indices=True,
+        )
+        instruments_new = np.concatenate(shards_instruments)[keep_indices]
+        stage.set_samples(len(X_new))
+
+    with open(state_path / "scaler.pkl", "rb") as f:
+        previous_scaler = pickle.load(f)
+    scaler = pickle.loads(pickle.dumps(previous_scaler))
+    if scaler_mode == "incremental":
+        scaler.partial_fit(X_new)
+        print(f"Scaler updated with {len(X_new)} windows")
+
+    buffer = ReplayBuffer.load(state_path / "replay.npz")
+    X_replay, y_replay, instruments_replay = buffer.sample(
+        int(replay_ratio * len(X_new))
+    )
+    print(
+        f"Training mix: {len(X_new)} new + {len(X_replay)} replay windows "
+        f"(buffer {len(buffer)} of {buffer.n_seen} seen)"
+    )
+    X_mix = scaler.transform(np.vstack([X_new, X_replay]))
+    X_mix = X_mix[:, inputs["columns"]]
+    y_mix = np.concatenate([y_new, y_replay])
+    instruments_mix = np.concatenate([instruments_new, instruments_replay])
+    (
+        X_train,
+        X_val,
+        y_train,
+        y_val,
+        instruments_train,
+        instruments_val,
+    ) = train_test_split(
+        X_mix,
+        y_mix,
+        instruments_mix,
+        test_size=0.1,
+        random_state=42,
+        stratify=y_mix,
+    )
+    class_weights = compute_class_weight(
+        "balanced", classes=np.unique(y_train), y=y_train
+    )
+    class_weight_dict = {0: class_weights[0], 1: class_weights[1]}
+
+    previous_net = net = None
+    if multi_head:
+        # Local import: multi_head imports the export helpers from train
+        from multi_head import MultiHeadModel
+
+        def load_net():
+            return MultiHeadModel.load(
+                model_path / "multi_head_model.keras",
+                len(inputs["columns"]),
+                list(training_metadata["multi_head"]["heads"]),
+                instrument_names,
+                learning_rate=learning_rate,
+            )
+
+        previous_net = load_net()
+        net = load_net()
+        previous_model = previous_net.model
+        model = net.model
+        train_data = {
+            "x": net.inputs(X_train, instruments_train),
+            "y": net.targets(y_train),
+            "sample_weight": net.sample_weight(y_train, class_weight_dict),
+        }
+        val_data = (
+            net.inputs(X_val, instruments_val),
+            net.targets(y_val),
+        )
+    else:
+        previous_model = keras.models.load_model(
+            model_path / "best_model.keras"
+        )
+        model = keras.models.load_model(model_path / "best_model.keras")
+        model.optimizer.learning_rate.assign(learning_rate)
+        train_data = {
+            "x": X_train,
+            "y": y_train,
+            "class_weight": class_weight_dict,
+        }
+        val_data = (X_val, y_val)
+
+    budget = TimeBudget(budget_seconds)
+    fit_start = time.perf_counter()
+    with profiler.stage("fit") as stage:
+        history = model.fit(
+            **train_data,
+            validation_data=val_data,
+            epochs=max_epochs,
+            batch_size=batch_size,
+            callbacks=[
+                callbacks.EarlyStopping(
+                    monitor="val_loss",
+                    patience=3,
+                    restore_best_weights=True,
+                    verbose=1,
+                ),
+                budget,
+            ],
+            verbose=1,
+        )
+        stage.set_samples(len(X_train) * len(history.history["loss"]))
+    fit_seconds = time.perf_counter() - fit_start
+
+    # Guard: never replace the model with a worse one
+    holdout = np.load(state_path / "holdout.npz")
+    with profiler.stage("predict", n_samples=2 * len(holdout["y"])):
+        before = _holdout_metrics(
+            previous_model, previous_scaler, inputs, holdout, previous_net
+        )
+        after = _holdout_metrics(model, scaler, inputs, holdout, net)
+    accepted = after["auc"] >= before["auc"] - tolerance
+
+    print("\nHoldout comparison:")
+    print(f"  {'':<10} {'previous':>10} {'finetuned':>10}")
+    for key in ("loss", "auc", "precision", "recall"):
+        print(f"  {key:<10} {before[key]:>10.4f} {after[key]:>10.4f}")
+
+    report = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "recordings": [path.name for path in new_files],
+        "new_windows": int(len(X_new)),
+        "replay_windows": int(len(X_replay)),
+        "scaler_mode": scaler_mode,
+        "epochs": len(history.history["loss"]),
+        "fit_seconds": fit_seconds,
+        "budget_exhausted": budget.exhausted,
+        "holdout_before": {k: float(v) for k, v in before.items()},
+        "holdout_after": {k: float(v) for k, v in after.items()},
+        "accepted": bool(accepted),
+    }
+    state["runs"].append(report)
+
+    if not accepted:
+        print(
+            f"\n❌ Rejected: holdout AUC {after['auc']:.4f} < previous "
+            f"{before['auc']:.4f} - {tolerance}; model not exported"
+        )
+        with open(state_path / "state.json", "w") as f:
+            json.dump(state, f, indent=2)
+        return report
+
+    print(f"\n✅ Accepted after {fit_seconds:.1f}s of training")
+    shutil.copy2(
+        model_path / "best_model.keras", model_path / "previous_model.keras"
+    )
+    if multi_head:
+        shutil.copy2(
+            model_path / "multi_head_model.keras",
+            model_path / "previous_multi_head_model.keras",
+        )
+        model.save(model_path / "multi_head_model.keras")
+        # Trunk + generic head, as train.py saves it
+        net.reference_model().save(model_path / "best_model.keras")
+    else:
+        model.save(model_path / "best_model.keras")
+
+    with open(state_path / "scaler.pkl", "wb") as f:
+        pickle.dump(scaler, f)
+    with open(state_path / "scaler.json", "w") as f:
+        json.dump(scaler_json(scaler, window_size), f, indent=2)
+
+    buffer.add(X_new, y_new, instruments_new)
+    buffer.save(state_path / "replay.npz")
+    state["recordings"].extend(path.name for path in new_files)
+    with open(state_path / "state.json", "w") as f:
+        json.dump(state, f, indent=2)
+
+    if multi_head:
+        _, head_stats = net.export(
+            model_path,
+            X_val,
+            y_val,
+            instruments_val,
+            instrument_names,
+            profiler=profiler,
+            scaler_src=state_path / "scaler.json",
+            publish=publish,
+            merge_metadata=merge_metadata,
+            inputs=inputs,
+            gate=gate,
+        )
+        training_metadata["multi_head"]["heads"] = head_stats
+    else:
+        export_tfjs_model(
+            model,
+            model_path,
+            X_train.shape,
+            X_val,
+            y_val,
+            profiler=profiler,
+            scaler_src=state_path / "scaler.json",
+            publish=publish,
+            merge_metadata=merge_metadata,
+            inputs=inputs,
+            gate=gate,
+        )
+
+    training_metadata.setdefault("finetune_runs", []).append(report)
+    with open(model_path / "training_metadata.json", "w") as f:
+        json.dump(training_metadata, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Fine-tune the onset model on new recordings"
+    )
+    parser.add_argument(
+        "recordings",
+        nargs="+",
+        help="New recording JSON files or directories",
+    )
+    parser.add_argument(
+        "--model-dir", default=str(training_dir / "models" / "saved")
+    )
+    parser.add_argument(
+        "--data-dir", default=str(training_dir / "data" / "processed")
+    )
+    parser.add_argument(
+        "--state-dir", default=str(training_dir / "data" / "finetune")
+    )
+    parser.add_argument("--replay-ratio", type=float, default=1.0)
+    parser.add_argument(
+        "--scaler", choices=["fixed", "incremental"], default="fixed"
+    )
+    parser.add_argument("--learning-rate", type=float, default=1e-4)
+    parser.add_argument("--max-epochs", type=int, default=20)
+    parser.add_argument("--budget-seconds", type=float, default=300.0)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--tolerance", type=float, default=0.002)
+    parser.add_argument("--replay-capacity", type=int, default=50000)
+    parser.add_argument("--no-publish", action="store_true")
+    parser.add_argument("--merge-metadata", action="store_true")
+    add_profiling_args(parser)
+    args = parser.parse_args()
+    profiler = profiler_from_args(args)
+
+    files = []
+    for entry in map(Path, args.recordings):
+        files.extend(
+            sorted(entry.glob("*.json")) if entry.is_dir() else [entry]
+        )
+
+    report = finetune_model(
+        files,
+        args.model_dir,
+        args.data_dir,
+        args.state_dir,
+        replay_ratio=args.replay_ratio,
+        scaler_mode=args.scaler,
+        learning_rate=args.learning_rate,
+        max_epochs=args.max_epochs,
+        budget_seconds=args.budget_seconds,
+        batch_size=args.batch_size,
+        tolerance=args.tolerance,
+        replay_capacity=args.replay_capacity,
+        publish=not args.no_publish,
+        merge_metadata=args.merge_metadata,
+        profiler=profiler,
+    )
+    profiler.finish(args.trace, args.chrome_trace)
+    if report is not None and not report["accepted"]:
+        raise SystemExit(1)
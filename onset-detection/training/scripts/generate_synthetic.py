@@ -0,0 +1,205 @@
+"""
+Generate synthetic onset detection recordings for benchmarking.
+
+Writes JSON files in the same schema as the onset-training page export
+(see TRAINING_DATA_FORMAT.md): a list of ~10ms frames with amplitude,
+spectralFlux, phaseDeviation, highFrequencyEnergy, hasPitch and
+hasManualOnset (expanded to ±1 frame around each onset).
+
+The signal model is deliberately simple but has the properties the
+pipeline cares about:
+- notes start with a flux/phase/high-frequency burst and an amplitude
+  attack, then decay towards a pitched sustain
+- silent gaps sit below the MIN_AMPLITUDE/MIN_ACTIVITY filter so the
+  silence filter has realistic work to do
+- timestamps jitter around the nominal hop like real browser timers
+
+This data is for performance testing only; never train a shipped model on
+it.
+"""
+
+import argparse
+import json
+from pathlib import Path
+import numpy as np
+
+
+def generate_recording(
+    n_frames: int,
+    onset_density: float = 2.0,
+    silent_fraction: float = 0.3,
+    hop_ms: float = 10.0,
+    hop_jitter_ms: float = 0.5,
+    rng: np.random.Generator | None = None,
+) -> list:
+    """
+    Generate one synthetic recording.
+
+    Args:
+        n_frames: Number of frames in the recording
+        onset_density: Average onsets per second of non-silent audio
+        silent_fraction: Fraction of frames that are silence
+        hop_ms: Nominal hop size in milliseconds
+        hop_jitter_ms: Standard deviation of the hop size in milliseconds
+        rng: Random generator (a fresh unseeded one if omitted)
+
+    Returns:
+        List of frame dictionaries in the training data format
+    """
+    rng = rng or np.random.default_rng()
+    frames_per_second = 1000.0 / hop_ms
+
+    # Lay out alternating silence / note segments. Each note segment
+    # contains one or more onsets.
+    silent = np.zeros(n_frames, dtype=bool)
+    onset_frames = []
+    mean_note_frames = max(3.0, frames_per_second / max(onset_density, 1e-3))
+    mean_silence_frames = (
+        mean_note_frames * 4 * silent_fraction / max(1e-3, 1 - silent_fraction)
+    )
+
+    t = 0
+    while t < n_frames:
+        if silent_fraction > 0:
+            gap = int(rng.exponential(mean_silence_frames))
+            silent[t : t + gap] = True
+            t += gap
+        # Phrase of a few notes without silence between them
+        for _ in range(rng.integers(1, 8)):
+            if t >= n_frames:
+                break
+            onset_frames.append(t)
+            t += max(3, int(rng.exponential(mean_note_frames)))
+
+    onset_frames = np.array(onset_frames, dtype=int)
+
+    # Per-frame envelopes, filled in note by note
+    amplitude = rng.uniform(0.0005, 0.006, n_frames)
+    flux = rng.uniform(0.0, 0.008, n_frames)
+    phase = rng.uniform(0.0, 0.008, n_frames)
+    hf_energy = rng.uniform(0.0, 0.004, n_frames)
+    has_pitch = np.zeros(n_frames, dtype=bool)
+
+    note_ends = np.append(onset_frames[1:], n_frames)
+    for start, end in zip(onset_frames, note_ends):
+        # A note runs until the next onset or the next silent frame
+        silent_after = np.flatnonzero(silent[start:end])
+        if len(silent_after):
+            end = start + int(silent_after[0])
+        length = end - start
+        if length <= 0:
+            continue
+
+        k = np.arange(length)
+        peak = rng.uniform(0.08, 0.6)
+        attack = np.minimum(1.0, (k + 1) / rng.integers(1, 4))
+        decay = 0.6 + 0.4 * np.exp(-k / rng.uniform(5, 30))
+        amplitude[start:end] = (
+            peak
+            * attack
+            * decay
+            * rng.normal(1.0, 0.05, length).clip(0.5, 1.5)
+        )
+
+        burst = np.exp(-k / rng.uniform(1.0, 3.0))
+        flux[start:end] = rng.uniform(0.05, 0.3, length) + burst * (
+            rng.uniform(0.5, 2.0)
+        )
+        phase[start:end] = rng.uniform(0.3, 0.9, length) + burst * (
+            rng.uniform(1.0, 2.5)
+        )
+        hf_energy[start:end] = rng.uniform(0.02, 0.08, length) + burst * (
+            rng.uniform(0.1, 0.4)
+        )
+        pitch_delay = int(rng.integers(1, 3))
+        has_pitch[start + pitch_delay : end] = True
+
+    # Labels: ±1 frame around each onset, with occasional labeling jitter
+    labels = np.zeros(n_frames, dtype=bool)
+    label_jitter = rng.choice([-1, 0, 0, 0, 1], size=len(onset_frames))
+    for centre in onset_frames + label_jitter:
+        labels[max(0, centre - 1) : min(n_frames, centre + 2)] = True
+
+    hops = rng.normal(hop_ms, hop_jitter_ms, n_frames).clip(hop_ms / 2)
+    timestamps = rng.uniform(1_000, 100_000) + np.cumsum(hops)
+
+    return [
+        {
+            "timestamp": round(float(timestamps[i]), 1),
+            "amplitude": round(float(amplitude[i]), 6),
+            "spectralFlux": round(float(flux[i]), 6),
+            "phaseDeviation": round(float(phase[i]), 6),
+            "highFrequencyEnergy": round(float(hf_energy[i]), 6),
+            "hasPitch": bool(has_pitch[i]),
+            "hasManualOnset": bool(labels[i]),
+        }
+        for i in range(n_frames)
+    ]
+
+
+def generate_corpus(
+    output_dir: str,
+    n_files: int = 10,
+    n_frames: int = 6000,
+    onset_density: float = 2.0,
+    silent_fraction: float = 0.3,
+    seed: int = 42,
+) -> list:
+    """
+    Write a synthetic corpus of JSON recordings.
+
+    Args:
+        output_dir: Directory to write the JSON files into
+        n_files: Number of recordings
+        n_frames: Frames per recording (6000 = 60s at 10ms hop)
+        onset_density: Average onsets per second of non-silent audio
+        silent_fraction: Fraction of frames that are silence
+        seed: Random seed for reproducible corpora
+
+    Returns:
+        List of written file paths
+    """
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    paths = []
+    for i in range(n_files):
+        frames = generate_recording(
+            n_frames,
+            onset_density=onset_density,
+            silent_fraction=silent_fraction,
+            rng=rng,
+        )
+        path = output_path / f"synthetic_{i:04d}.json"
+        with open(path, "w") as f:
+            json.dump(frames, f)
+        paths.append(path)
+
+    print(
+        f"Wrote {n_files} synthetic recordings "
+        f"({n_files * n_frames} frames) to {output_path}"
+    )
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic onset detection recordings"
+    )
+    parser.add_argument("output_dir", help="Directory for the JSON files")
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--frames", type=int, default=6000)
+    parser.add_argument("--onset-density", type=float, default=2.0)
+    parser.add_argument("--silent-fraction", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    generate_corpus(
+        args.output_dir,
+        n_files=args.files,
+        n_frames=args.frames,
+        onset_density=args.onset_density,
+        silent_fraction=args.silent_fraction,
+        seed=args.seed,
+    )
@@ -0,0 +1,479 @@
+"""
+Per-instrument onset heads on a shared trunk (train.py --multi-head).
+
+Onsets look different on a plucked guitar, a bowed cello and a flute, but
+most of what the network learns (amplitude and flux shapes) is shared. The
+multi-head model keeps the Dense trunk of create_model and gives every
+instrument with enough training windows its own small head; windows of the
+remaining instruments, and every window through a second output, train the
+"generic" head.
+
+The export splits the bundle so the browser only downloads what it uses:
+
+    tfjs_model/model.json, group1-shard1of1.bin   trunk (features -> 32)
+    tfjs_model/heads/<name>/model.json, shard     one head (32 -> 1) each
+
+config.json lists the heads, the default head and a threshold per head.
+The NumPy loader (numpy_model.load_tfjs_model(..., instrument=...)) and
+OnsetModel in the app chain the trunk with one head.
+"""
+
+import json
+import shutil
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+from sklearn.metrics import roc_auc_score, roc_curve
+from tensorflow import keras  # type: ignore
+from tensorflow.keras import layers, models  # type: ignore
+
+from event_metrics import event_scores, load_recording, recording_event_counts
+from numpy_model import HEADS_DIR, load_tfjs_model, read_bundle_metadata
+from pack_bundle import pack_bundle, print_report
+from preprocess import instrument_from_filename, select_scaler
+from profiling import Profiler
+from publish_model import publish_bundle
+from train import _create_tfjs_from_keras, _fix_tfjs_input_layer
+
+DEFAULT_HEAD = "generic"
+MIN_HEAD_WINDOWS = 500
+TRUNK_UNITS = 32
+
+
+def head_layout(
+    train_instruments: np.ndarray,
+    instrument_names: list,
+    min_head_windows: int = MIN_HEAD_WINDOWS,
+) -> list:
+    """
+    Heads to train: "generic" plus every instrument with enough windows.
+
+    Args:
+        train_instruments: Instrument index of each training window
+            (instruments.npy, indices into instrument_names)
+        instrument_names: preprocess.INSTRUMENTS as saved in metadata.json
+        min_head_windows: Training windows an instrument needs for its own
+            head
+
+    Returns:
+        Head names, "generic" first
+    """
+    counts = np.bincount(train_instruments, minlength=len(instrument_names))
+    return [DEFAULT_HEAD] + [
+        name
+        for index, name in enumerate(instrument_names)
+        if name != DEFAULT_HEAD and counts[index] >= min_head_windows
+    ]
+
+
+def _layer_name(head: str) -> str:
+    return "head_" + head.replace("-", "_")
+
+
+def _youden_threshold(y: np.ndarray, probabilities: np.ndarray) -> float:
+    """Threshold maximizing TPR - FPR, as in train.export_tfjs_model."""
+    if len(np.unique(y)) < 2:
+        return 0.5
+    fpr, tpr, thresholds = roc_curve(y, probabilities)
+    return float(thresholds[np.argmax(tpr - fpr)])
+
+
+class MultiHeadModel:
+    """
+    Shared trunk with one sigmoid head per instrument.
+
+    The Keras model takes {"features", "head"} where "head" is a one-hot
+    mask selecting each window's head, and has two outputs: "onset" (the
+    selected head) and "generic" (the generic head, trained on every
+    window so it stays a good fallback).
+
+    Args:
+        n_inputs: Model inputs per window
+        head_names: Heads from head_layout
+        instrument_names: preprocess.INSTRUMENTS as saved in metadata.json
+        learning_rate: Adam learning rate
+        jit_compile: Compile with XLA (see train.create_model)
+        steps_per_execution: Batches per compiled call
+    """
+
+    def __init__(
+        self,
+        n_inputs: int,
+        head_names: list,
+        instrument_names: list,
+        learning_rate: float = 0.001,
+        jit_compile="auto",
+        steps_per_execution: int = 1,
+    ):
+        self.n_inputs = n_inputs
+        self.head_names = head_names
+        # Instrument index -> head position; instruments without a head
+        # use the generic one
+        self.head_of_instrument = np.array(
+            [
+                head_names.index(name) if name in head_names else 0
+                for name in instrument_names
+            ]
+        )
+
+        # Same stack as train.create_model, split after the 32-unit layer
+        self.trunk = models.Sequential(
+            [
+                layers.Input(shape=(n_inputs,)),
+                layers.Dense(128, activation="relu"),
+                layers.Dropout(0.3),
+                layers.Dense(64, activation="relu"),
+                layers.Dropout(0.3),
+                layers.Dense(TRUNK_UNITS, activation="relu"),
+                layers.Dropout(0.2),
+            ],
+            name="trunk",
+        )
+        self.heads = {
+            name: models.Sequential(
+                [
+                    layers.Input(shape=(TRUNK_UNITS,)),
+                    layers.Dense(16, activation="relu"),
+                    layers.Dense(1, activation="sigmoid"),
+                ],
+                name=_layer_name(name),
+            )
+            for name in head_names
+        }
+
+        features = keras.Input(shape=(n_inputs,), name="features")
+        mask = keras.Input(shape=(len(head_names),), name="head")
+        shared = self.trunk(features)
+        outputs = [self.heads[name](shared) for name in head_names]
+        stacked = (
+            layers.Concatenate(name="heads")(outputs)
+            if len(outputs) > 1
+            else outputs[0]
+        )
+        onset = layers.Dot(axes=1, name="onset")([stacked, mask])
+        generic = layers.Identity(name="generic")(outputs[0])
+        self.model = keras.Model(
+            {"features": features, "head": mask},
+            {"onset": onset, "generic": generic},
+        )
+        self.model.compile(
+            optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+            loss={
+                "onset": "binary_crossentropy",
+                "generic": "binary_crossentropy",
+            },
+            metrics={
+                "onset": [
+                    "accuracy",
+                    keras.metrics.Precision(name="precision"),
+                    keras.metrics.Recall(name="recall"),
+                    keras.metrics.AUC(name="auc"),
+                ]
+            },
+            jit_compile=jit_compile,
+            steps_per_execution=steps_per_execution,
+        )
+
+    @classmethod
+    def load(
+        cls,
+        path: Path,
+        n_inputs: int,
+        head_names: list,
+        instrument_names: list,
+        **kwargs,
+    ) -> "MultiHeadModel":
+        """Rebuild a trained model from multi_head_model.keras."""
+        net = cls(n_inputs, head_names, instrument_names, **kwargs)
+        net.model.load_weights(path)
+        return net
+
+    def inputs(self, X: np.ndarray, instruments: np.ndarray) -> dict:
+        """Model inputs for windows of the given instrument indices."""
+        mask = np.eye(len(self.head_names), dtype=np.float32)[
+            self.head_of_instrument[instruments]
+        ]
+        return {"features": X, "head": mask}
+
+    @staticmethod
+    def targets(y: np.ndarray) -> dict:
+        return {"onset": y, "generic": y}
+
+    @staticmethod
+    def sample_weight(y: np.ndarray, class_weight: dict) -> dict:
+        """Class weights as per-sample weights (Keras only supports
+        class_weight for single-output models)."""
+        weights = np.where(y == 1, class_weight[1], class_weight[0])
+        return {"onset": weights, "generic": weights}
+
+    @staticmethod
+    def history(history: dict) -> dict:
+        """Rename "onset_*" metrics to the single-model names, so history
+        plots and training metadata read the same for both models."""
+        renamed = {}
+        for key, values in history.items():
+            prefix = "val_" if key.startswith("val_") else ""
+            name = key.removeprefix("val_")
+            if name.startswith("onset_") and name != "onset_loss":
+                key = prefix + name.removeprefix("onset_")
+            renamed[key] = values
+        return renamed
+
+    def reference_model(self, name: str = DEFAULT_HEAD):
+        """Trunk chained with one head as a plain single-output model."""
+        return models.Sequential(
+            [
+                layers.Input(shape=(self.n_inputs,)),
+                self.trunk,
+                self.heads[name],
+            ]
+        )
+
+    def export(
+        self,
+        output_dir: Path,
+        X_val: np.ndarray,
+        y_val: np.ndarray,
+        instruments_val: np.ndarray,
+        instrument_names: list,
+        profiler: Profiler | None = None,
+        scaler_src: Path | None = None,
+        publish: bool = True,
+        merge_metadata: bool = False,
+        inputs: dict | None = None,
+        gate: dict | None = None,
+    ) -> tuple:
+        """
+        Export the trunk and every head as a split TF.js bundle.
+
+        Thresholds are tuned per head on the validation windows of that
+        head's instrument (all windows for the generic head). ``gate`` (see
+        cascade.py) is shared by all heads.
+
+        Returns:
+            (tfjs_path, {head: {"threshold", "val_auc", "val_windows"}})
+        """
+        profiler = profiler or Profiler()
+        tfjs_path = Path(output_dir) / "tfjs_model"
+        tfjs_path.mkdir(parents=True, exist_ok=True)
+        heads_path = tfjs_path / HEADS_DIR
+        if heads_path.exists():
+            shutil.rmtree(heads_path)
+
+        print("\nConverting multi-head model to TensorFlow.js format...")
+        input_shape = (None, self.n_inputs)
+        with profiler.stage("export"):
+            _create_tfjs_from_keras(self.trunk, tfjs_path, input_shape)
+            _fix_tfjs_input_layer(tfjs_path / "model.json", input_shape)
+            for name, head in self.heads.items():
+                head_path = heads_path / name
+                _create_tfjs_from_keras(head, head_path, (None, TRUNK_UNITS))
+                _fix_tfjs_input_layer(
+                    head_path / "model.json", (None, TRUNK_UNITS)
+                )
+
+        print("Calculating per-head thresholds from validation data...")
+        with profiler.stage("predict", n_samples=len(X_val)):
+            shared = self.trunk.predict(X_val, batch_size=4096, verbose=0)
+        head_of_window = self.head_of_instrument[instruments_val]
+        head_stats = {}
+        for position, name in enumerate(self.head_names):
+            rows = (
+                slice(None)
+                if name == DEFAULT_HEAD
+                else head_of_window == position
+            )
+            probabilities = (
+                self.heads[name]
+                .predict(shared[rows], batch_size=4096, verbose=0)
+                .reshape(-1)
+            )
+            y_head = y_val[rows]
+            head_stats[name] = {
+                "threshold": _youden_threshold(y_head, probabilities),
+                "val_auc": (
+                    float(roc_auc_score(y_head, probabilities))
+                    if len(np.unique(y_head)) > 1
+                    else None
+                ),
+                "val_windows": int(len(y_head)),
+            }
+            print(
+                f"  {name:<12} threshold {head_stats[name]['threshold']:.4f} "
+                f"on {len(y_head)} windows"
+            )
+
+        model_config = {
+            "inputShape": [self.n_inputs],
+            "outputShape": [1],
+            "optimalThreshold": head_stats[DEFAULT_HEAD]["threshold"],
+            "version": "3.0.0",
+            "created": datetime.utcnow().strftime("%Y-%m-%d"),
+            "inputs": inputs,
+            "heads": {
+                "names": self.head_names,
+                "default": DEFAULT_HEAD,
+                "inputShape": [TRUNK_UNITS],
+                "thresholds": {
+                    name: stats["threshold"]
+                    for name, stats in head_stats.items()
+                },
+            },
+        }
+        if gate is not None:
+            model_config["gate"] = gate
+        with open(tfjs_path / "config.json", "w") as f:
+            json.dump(model_config, f, indent=2)
+
+        if scaler_src is not None and scaler_src.exists():
+            with open(scaler_src, "r") as f:
+                scaler_data = select_scaler(json.load(f), inputs)
+            with open(tfjs_path / "scaler.json", "w") as f:
+                json.dump(scaler_data, f, indent=2)
+        else:
+            print(f"Warning: scaler.json not found at {scaler_src}")
+
+        with profiler.stage("pack"):
+            print_report(pack_bundle(tfjs_path, merge_metadata=merge_metadata))
+
+        if publish:
+            publish_bundle(tfjs_path, reference_model=self.reference_model())
+
+        print(f"TensorFlow.js multi-head model saved to {tfjs_path}")
+        return tfjs_path, head_stats
+
+
+def _part_bytes(directory: Path) -> dict:
+    """Transfer bytes of one model.json and its shards (raw and gzip)."""
+    with open(directory / "model.json", "r") as f:
+        model_json = json.load(f)
+    names = ["model.json"] + [
+        path
+        for group in model_json["weightsManifest"]
+        for path in group["paths"]
+    ]
+    sizes = {"identity": 0, "gz": 0}
+    for name in names:
+        path = directory / name
+        sizes["identity"] += path.stat().st_size
+        gz_path = path.with_name(path.name + ".gz")
+        sizes["gz"] += (gz_path if gz_path.exists() else path).stat().st_size
+    return sizes
+
+
+def size_report(tfjs_path: Path) -> dict:
+    """
+    Bytes a browser downloads for one instrument, compared to fetching every
+    head or shipping a separate full model per instrument.
+    """
+    tfjs_path = Path(tfjs_path)
+    with open(tfjs_path / "model.json", "r") as f:
+        config, _ = read_bundle_metadata(tfjs_path, json.load(f))
+    head_names = config["heads"]["names"]
+    trunk = _part_bytes(tfjs_path)
+    heads = {
+        name: _part_bytes(tfjs_path / HEADS_DIR / name) for name in head_names
+    }
+    report = {"trunk": trunk, "heads": heads}
+    for encoding in ("identity", "gz"):
+        largest = max(head[encoding] for head in heads.values())
+        all_heads = sum(head[encoding] for head in heads.values())
+        report[encoding] = {
+            "trunk_plus_one_head": trunk[encoding] + largest,
+            "trunk_plus_all_heads": trunk[encoding] + all_heads,
+            "separate_models": len(head_names) * (trunk[encoding] + largest),
+        }
+    return report
+
+
+def instrument_event_report(
+    tfjs_path: Path,
+    raw_dir: Path,
+    recordings: list | None = None,
+    tolerance: int = 2,
+) -> dict:
+    """
+    Event-level metrics per instrument on full recordings: the instrument's
+    own head against the generic head.
+
+    Recordings are grouped by file name (preprocess.instrument_from_filename)
+    and scored through the exported bundle with the per-head thresholds.
+
+    Args:
+        tfjs_path: Exported multi-head bundle
+        raw_dir: Raw recordings
+        recordings: File names to score, normally the held-out split of
+            preprocess.py (preprocess.holdout_recordings). None scores every
+            recording, training ones included, so the numbers are in-sample.
+        tolerance: Matching tolerance in frames
+    """
+    by_instrument = {}
+    for path in sorted(Path(raw_dir).glob("*.json")):
+        if recordings is not None and path.name not in recordings:
+            continue
+        by_instrument.setdefault(
+            instrument_from_filename(path.name), []
+        ).append(path)
+
+    generic = load_tfjs_model(tfjs_path)
+    report = {}
+    for instrument, paths in sorted(by_instrument.items()):
+        model = load_tfjs_model(tfjs_path, instrument=instrument)
+        counts = {"head": np.zeros(3, int), "generic": np.zeros(3, int)}
+        for path in paths:
+            X, y = load_recording(path)
+            if len(y) == 0:
+                continue
+            for key, scorer in (("head", model), ("generic", generic)):
+                counts[key] += recording_event_counts(
+                    scorer.predict(X),
+                    y,
+                    scorer.config["optimalThreshold"],
+                    tolerance,
+                )
+        report[instrument] = {
+            "head": model.config["head"],
+            "recordings": len(paths),
+            "held_out": recordings is not None,
+            "head_events": event_scores(*map(int, counts["head"])),
+            "generic_events": event_scores(*map(int, counts["generic"])),
+        }
+    return report
+
+
+def print_multi_head_report(
+    head_stats: dict, events: dict, sizes: dict
+) -> None:
+    print("\nPer-head validation AUC:")
+    for name, stats in head_stats.items():
+        auc = stats["val_auc"]
+        auc_text = f"{auc:.4f}" if auc is not None else "n/a"
+        print(f"  {name:<12} {auc_text} ({stats['val_windows']} windows)")
+
+    if events:
+        held_out = all(result["held_out"] for result in events.values())
+        print(
+            "\nEvent F1 per instrument (own head vs generic head, "
+            f"{'held-out' if held_out else 'in-sample'} recordings):"
+        )
+        for instrument, result in events.items():
+            head = result["head_events"]
+            base = result["generic_events"]
+            print(
+                f"  {instrument:<12} head {result['head']:<12} "
+                f"F1 {head['f1']:.3f} vs {base['f1']:.3f} "
+                f"(P {head['precision']:.3f}/{base['precision']:.3f}, "
+                f"R {head['recall']:.3f}/{base['recall']:.3f}, "
+                f"{result['recordings']} recordings)"
+            )
+
+    print("\nDownload size per instrument (bytes, raw / gzip):")
+    for key, label in (
+        ("trunk_plus_one_head", "trunk + active head"),
+        ("trunk_plus_all_heads", "trunk + all heads"),
+        ("separate_models", "one full model per head"),
+    ):
+        print(
+            f"  {label:<24} {sizes['identity'][key]:>9} / "
+            f"{sizes['gz'][key]:>9}"
+        )
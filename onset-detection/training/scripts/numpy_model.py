@@ -0,0 +1,227 @@
+"""
+Run an exported TF.js onset model with NumPy.
+
+Loads the same bundle the browser loads (model.json, weight shards and
+scaler.json, or the scaler merged into model.json by pack_bundle.py) and
+evaluates the Dense stack directly, so scripts can score data with a
+previous model without importing TensorFlow.
+
+Only the layer types create_model uses are supported: InputLayer, Dense
+and Dropout (a no-op at inference).
+
+Multi-head bundles (train.py --multi-head) hold a shared trunk in
+model.json and one small head per instrument in heads/<name>/; the loader
+chains the trunk with one of them.
+"""
+
+import json
+from pathlib import Path
+import numpy as np
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    None: lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "tanh": np.tanh,
+}
+
+HEADS_DIR = "heads"
+
+
+def _topology_layers(model_json: dict) -> list:
+    """Return the layer list from either manifest layout.
+
+    train.py writes modelTopology.config.layers; the tensorflowjs converter
+    used by evaluate.py writes modelTopology.model_config.config.layers.
+    """
+    topology = model_json["modelTopology"]
+    if "model_config" in topology:
+        topology = topology["model_config"]
+    return topology["config"]["layers"]
+
+
+def load_weights(model_dir: Path, model_json: dict) -> dict:
+    """Read all weight shards into a {name: array} dictionary."""
+    weights = {}
+    for group in model_json["weightsManifest"]:
+        buffer = b"".join(
+            (model_dir / path).read_bytes() for path in group["paths"]
+        )
+        offset = 0
+        for spec in group["weights"]:
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            array = np.frombuffer(
+                buffer, dtype=dtype, count=count, offset=offset
+            )
+            weights[spec["name"]] = array.reshape(spec["shape"])
+            offset += count * dtype.itemsize
+    return weights
+
+
+def _dense_layers(model_dir: Path, model_json: dict) -> list:
+    """(kernel, bias, activation) for every Dense layer of a manifest."""
+    weights = load_weights(model_dir, model_json)
+    layers = []
+    for layer in _topology_layers(model_json):
+        class_name = layer["class_name"]
+        config = layer["config"]
+        if class_name in ("InputLayer", "Dropout"):
+            continue
+        if class_name != "Dense":
+            raise ValueError(f"Unsupported layer type for NumPy: {class_name}")
+        name = config["name"]
+        kernel = weights[f"{name}/kernel"].astype(np.float32)
+        bias = weights.get(f"{name}/bias")
+        if bias is None:
+            bias = np.zeros(kernel.shape[1], dtype=np.float32)
+        layers.append(
+            (kernel, bias.astype(np.float32), config.get("activation"))
+        )
+    return layers
+
+
+def head_files(model_dir: Path, config: dict | None) -> list:
+    """
+    Relative paths of the per-instrument head files of a multi-head bundle.
+
+    Returns:
+        heads/<name>/model.json and its weight shards for every head listed
+        in config["heads"] (empty for single-model bundles)
+    """
+    names = []
+    for head in (config or {}).get("heads", {}).get("names", []):
+        head_dir = f"{HEADS_DIR}/{head}"
+        names.append(f"{head_dir}/model.json")
+        with open(Path(model_dir) / head_dir / "model.json", "r") as f:
+            head_json = json.load(f)
+        for group in head_json["weightsManifest"]:
+            names.extend(f"{head_dir}/{path}" for path in group["paths"])
+    return names
+
+
+class NumpyOnsetModel:
+    """Dense-stack forward pass over an exported TF.js bundle.
+
+    Args:
+        layers: List of (kernel, bias, activation) tuples
+        scaler_mean: Feature means from scaler.json (optional)
+        scaler_std: Feature scales from scaler.json (optional)
+        config: Parsed config.json (optional)
+    """
+
+    def __init__(self, layers, scaler_mean=None, scaler_std=None, config=None):
+        self.layers = layers
+        self.scaler_mean = scaler_mean
+        self.scaler_std = scaler_std
+        self.config = config or {}
+
+    @property
+    def n_features(self) -> int:
+        return self.layers[0][0].shape[0]
+
+    def select_inputs(self, X: np.ndarray) -> np.ndarray:
+        """Pick the model's columns from full-width windows.
+
+        Models trained on a feature/lag subset list their columns in
+        config.json ``inputs``; narrower X is assumed to be selected already.
+        """
+        columns = self.config.get("inputs", {}).get("columns")
+        if columns is None or X.shape[1] == self.n_features:
+            return X
+        return X[:, columns]
+
+    def scale(self, X: np.ndarray) -> np.ndarray:
+        """Apply the bundle's StandardScaler parameters to raw features."""
+        if self.scaler_mean is None:
+            return X
+        std = np.where(self.scaler_std == 0, 1.0, self.scaler_std)
+        return (X - self.scaler_mean) / std
+
+    def predict(
+        self, X: np.ndarray, batch_size: int = 65536, scaled: bool = False
+    ) -> np.ndarray:
+        """
+        Predict onset probabilities.
+
+        Args:
+            X: Features of shape (n_samples, n_features), or full-width
+                windows for models trained on an input subset
+            batch_size: Rows per forward pass (bounds temporary memory)
+            scaled: True if X is already normalized with the bundle scaler
+
+        Returns:
+            float32 probabilities of shape (n_samples,)
+        """
+        out = np.empty(len(X), dtype=np.float32)
+        for start in range(0, len(X), batch_size):
+            batch = self.select_inputs(
+                np.asarray(X[start : start + batch_size], np.float32)
+            )
+            if not scaled:
+                batch = self.scale(batch)
+            for kernel, bias, activation in self.layers:
+                batch = ACTIVATIONS[activation](batch @ kernel + bias)
+            out[start : start + len(batch)] = batch[:, 0]
+        return out
+
+
+def read_bundle_metadata(model_dir: Path, model_json: dict) -> tuple:
+    """Return (config, scaler) from the side files or the merged metadata.
+
+    pack_bundle.py --merge-metadata moves config.json and scaler.json into
+    model.json's userDefinedMetadata; either may be missing.
+    """
+    merged = model_json.get("userDefinedMetadata", {})
+    result = []
+    for name in ("config", "scaler"):
+        path = model_dir / f"{name}.json"
+        if path.exists():
+            with open(path, "r") as f:
+                result.append(json.load(f))
+        else:
+            result.append(merged.get(name))
+    return tuple(result)
+
+
+def load_tfjs_model(
+    model_dir, instrument: str | None = None
+) -> NumpyOnsetModel:
+    """
+    Load an exported TF.js bundle for NumPy inference.
+
+    Args:
+        model_dir: Directory containing model.json, the weight shards and
+            optionally scaler.json / config.json (separate or merged)
+        instrument: Head to chain after the trunk of a multi-head bundle
+            (default: the bundle's default head; ignored otherwise)
+
+    Returns:
+        NumpyOnsetModel
+    """
+    model_dir = Path(model_dir)
+    with open(model_dir / "model.json", "r") as f:
+        model_json = json.load(f)
+
+    layers = _dense_layers(model_dir, model_json)
+
+    config, scaler = read_bundle_metadata(model_dir, model_json)
+    heads = (config or {}).get("heads")
+    if heads:
+        head = instrument if instrument in heads["names"] else heads["default"]
+        head_dir = model_dir / HEADS_DIR / head
+        with open(head_dir / "model.json", "r") as f:
+            layers += _dense_layers(head_dir, json.load(f))
+        config = {
+            **config,
+            "head": head,
+            "optimalThreshold": heads["thresholds"][head],
+        }
+
+    scaler_mean = scaler_std = None
+    if scaler is not None:
+        scaler_mean = np.asarray(scaler["mean"], dtype=np.float32)
+        scaler_std = np.asarray(scaler["std"], dtype=np.float32)
+
+    return NumpyOnsetModel(layers, scaler_mean, scaler_std, config)
@@ -0,0 +1,236 @@
+"""
+Pack an exported TF.js onset model bundle for faster browser cold start.
+
+Packing rewrites the bundle in place:
+
+1. model.json (and each head's model.json in multi-head bundles),
+   config.json and scaler.json are minified.
+2. Optionally, config.json and scaler.json are merged into model.json's
+   ``userDefinedMetadata`` so the browser needs two requests (model.json
+   and the weight shard) instead of four. tf.loadLayersModel exposes the
+   merged data through ``model.getUserDefinedMetadata()``.
+3. Every file gets precompressed ``.gz`` (and ``.br`` when the ``brotli``
+   module is installed) siblings for static hosts that serve them directly.
+
+The packed bundle is loaded again through the manifest loader and its
+predictions must match the bundle before packing exactly.
+"""
+
+import argparse
+import gzip
+import json
+from pathlib import Path
+import numpy as np
+
+from numpy_model import (
+    HEADS_DIR,
+    head_files,
+    load_tfjs_model,
+    read_bundle_metadata,
+)
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # optional dependency
+    brotli = None
+
+METADATA_FILES = ("config.json", "scaler.json")
+COMPRESSED_SUFFIXES = (".br", ".gz")
+
+
+class PackError(Exception):
+    """Raised when a packed bundle no longer matches the original."""
+
+
+def _compress(data: bytes, suffix: str) -> bytes:
+    if suffix == ".gz":
+        # mtime=0 keeps the output (and the published content hash) stable
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def _bundle_paths(bundle_dir: Path) -> list:
+    """Bundle files, excluding precompressed siblings."""
+    with open(bundle_dir / "model.json", "r") as f:
+        model_json = json.load(f)
+    names = ["model.json"]
+    names += [name for name in METADATA_FILES if (bundle_dir / name).exists()]
+    for group in model_json["weightsManifest"]:
+        names.extend(group["paths"])
+    config, _ = read_bundle_metadata(bundle_dir, model_json)
+    names += head_files(bundle_dir, config)
+    return [bundle_dir / name for name in names]
+
+
+def transfer_bytes(bundle_dir: Path) -> dict:
+    """
+    Bytes a browser downloads for the bundle, per content encoding.
+
+    Returns:
+        Dictionary with "identity" and one entry per available
+        precompressed encoding (falling back to the raw size per file)
+    """
+    bundle_dir = Path(bundle_dir)
+    sizes = {"identity": 0}
+    for path in _bundle_paths(bundle_dir):
+        raw = path.stat().st_size
+        sizes["identity"] += raw
+        for suffix in COMPRESSED_SUFFIXES:
+            sibling = path.with_name(path.name + suffix)
+            if sibling.exists():
+                key = suffix.lstrip(".")
+                sizes[key] = sizes.get(key, 0) + sibling.stat().st_size
+    return sizes
+
+
+def _write_minified(path: Path, data) -> None:
+    with open(path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+
+
+def pack_bundle(bundle_dir, merge_metadata: bool = False) -> dict:
+    """
+    Minify, optionally merge and precompress a TF.js bundle in place.
+
+    Args:
+        bundle_dir: Exported bundle (model.json, shards, config.json,
+            scaler.json)
+        merge_metadata: Move config.json and scaler.json into model.json's
+            userDefinedMetadata
+
+    Returns:
+        Report with transfer bytes before and after packing
+    """
+    bundle_dir = Path(bundle_dir)
+    # Remove stale siblings so the size report reflects uncompressed files
+    for path in _bundle_paths(bundle_dir):
+        for suffix in COMPRESSED_SUFFIXES:
+            path.with_name(path.name + suffix).unlink(missing_ok=True)
+    before = transfer_bytes(bundle_dir)
+
+    reference = load_tfjs_model(bundle_dir)
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(256, reference.n_features)).astype(np.float32)
+    if reference.scaler_mean is not None:
+        # Sample around the training distribution so the scaler is exercised
+        X = X * reference.scaler_std + reference.scaler_mean
+    expected = reference.predict(X)
+
+    with open(bundle_dir / "model.json", "r") as f:
+        model_json = json.load(f)
+    metadata = {}
+    for name in METADATA_FILES:
+        path = bundle_dir / name
+        if not path.exists():
+            continue
+        with open(path, "r") as f:
+            metadata[name.removesuffix(".json")] = json.load(f)
+        if merge_metadata:
+            path.unlink()
+        else:
+            _write_minified(path, metadata[name.removesuffix(".json")])
+    if merge_metadata:
+        model_json["userDefinedMetadata"] = {
+            **model_json.get("userDefinedMetadata", {}),
+            **metadata,
+        }
+    _write_minified(bundle_dir / "model.json", model_json)
+    for path in _bundle_paths(bundle_dir):
+        if path.name == "model.json" and path.parent != bundle_dir:
+            # Per-instrument heads of a multi-head bundle
+            with open(path, "r") as f:
+                _write_minified(path, json.load(f))
+
+    suffixes = [".gz"]
+    if brotli is not None:
+        suffixes.insert(0, ".br")
+    else:
+        print("Warning: brotli not installed, skipping .br files")
+    for path in _bundle_paths(bundle_dir):
+        data = path.read_bytes()
+        for suffix in suffixes:
+            path.with_name(path.name + suffix).write_bytes(
+                _compress(data, suffix)
+            )
+
+    verify_packed_bundle(bundle_dir, X, expected)
+    after = transfer_bytes(bundle_dir)
+    return {
+        "merged_metadata": merge_metadata,
+        "files": [
+            path.relative_to(bundle_dir).as_posix()
+            for path in _bundle_paths(bundle_dir)
+        ],
+        "before": before,
+        "after": after,
+    }
+
+
+def verify_packed_bundle(bundle_dir: Path, X: np.ndarray, expected) -> None:
+    """
+    Check a packed bundle against predictions made before packing.
+
+    Raises:
+        PackError: If a compressed sibling does not decode to its source
+            file, or the bundle no longer reproduces the predictions
+    """
+    for path in _bundle_paths(bundle_dir):
+        data = path.read_bytes()
+        gz_path = path.with_name(path.name + ".gz")
+        if gz_path.exists() and gzip.decompress(gz_path.read_bytes()) != data:
+            raise PackError(f"{gz_path.name} does not match {path.name}")
+        br_path = path.with_name(path.name + ".br")
+        if (
+            brotli is not None
+            and br_path.exists()
+            and brotli.decompress(br_path.read_bytes()) != data
+        ):
+            raise PackError(f"{br_path.name} does not match {path.name}")
+
+    packed = load_tfjs_model(bundle_dir)
+    if packed.scaler_mean is None or not packed.config:
+        raise PackError("Packed bundle lost its scaler or config")
+    if not np.array_equal(packed.predict(X), expected):
+        raise PackError("Packed bundle predictions differ from the original")
+
+
+def print_report(report: dict) -> None:
+    before, after = report["before"], report["after"]
+    print("\nBundle transfer size:")
+    print(f"  {'':<10} {'before':>10} {'after':>10}")
+    for key in after:
+        # Unpacked bundles have no precompressed siblings
+        old = before.get(key, before["identity"])
+        print(f"  {key:<10} {old:>10,} {after[key]:>10,}")
+    # Multi-head bundles: the browser fetches the trunk and one head
+    shared = [
+        name
+        for name in report["files"]
+        if not name.startswith(f"{HEADS_DIR}/")
+    ]
+    loaded = list(shared)
+    if len(shared) < len(report["files"]):
+        loaded += ["heads/<name>/model.json", "its shard"]
+    print(f"  Requests: {len(loaded)} ({', '.join(loaded)})")
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Minify and precompress a TF.js onset model bundle"
+    )
+    parser.add_argument(
+        "bundle_dir",
+        nargs="?",
+        default=str(training_dir / "models" / "saved" / "tfjs_model"),
+    )
+    parser.add_argument(
+        "--merge-metadata",
+        action="store_true",
+        help="Merge config.json and scaler.json into model.json",
+    )
+    args = parser.parse_args()
+
+    print_report(pack_bundle(args.bundle_dir, args.merge_metadata))
@@ -0,0 +1,750 @@
+"""
+Run the onset detection training pipeline as a small DAG.
+
+Stages:
+    preprocess -> train -> plot
+                        -> evaluate
+                        -> postprocess -> publish (versioned bundle in static/)
+
+The postprocess stage tunes the onset post-processing into a copy of the
+trained bundle (models/saved/tuned_model); train's own outputs are never
+modified, and publish ships the tuned copy.
+
+Each stage has an input fingerprint built from the stage name, the source
+of the scripts it runs, its parameters and the content hashes of its input
+files (including upstream outputs). A stage is skipped when its
+fingerprint matches the last successful run and its recorded outputs are
+still on disk unchanged. File hashes are cached by (size, mtime), so a
+no-op rerun only stats files and finishes in well under a second.
+
+Stages whose dependencies are done run concurrently, each in its own
+process (TensorFlow and matplotlib stay out of the runner itself).
+Only the publish stage writes to static/models/onset-model.
+
+Hard negative mining (--negative-mining hard) scores with a pinned bundle
+in models/mining_model rather than the train stage's tfjs_model, so
+training does not invalidate preprocessing. --pin-mining-model copies the
+current model there; the pin is fingerprinted like any other input.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+TRAINING_DIR = SCRIPT_DIR.parent
+REPO_ROOT = TRAINING_DIR.parents[1]
+
+RAW_DIR = TRAINING_DIR / "data" / "raw"
+PROCESSED_DIR = TRAINING_DIR / "data" / "processed"
+SAVED_DIR = TRAINING_DIR / "models" / "saved"
+# Hard negative mining scores with a pinned copy of an earlier bundle, never
+# with the train stage's own output (that would invalidate every rerun)
+MINING_MODEL_DIR = TRAINING_DIR / "models" / "mining_model"
+EVALUATION_DIR = SAVED_DIR / "evaluation"
+TUNED_MODEL_DIR = SAVED_DIR / "tuned_model"
+STATIC_DIR = REPO_ROOT / "static" / "models" / "onset-model"
+STATE_PATH = TRAINING_DIR / ".pipeline" / "state.json"
+
+# Defaults of train.py and preprocess.py, repeated so the runner imports
+# neither TensorFlow nor scikit-learn
+BASE_BATCH_SIZE = 256
+CPU_MODE_BATCH_SIZE = 4096
+CPU_MODE_WARMUP_EPOCHS = 5
+REPORT_HOLDOUT_FRACTION = 0.2
+
+# Set by --trace-dir; read by the workers (kept out of the fingerprints)
+TRACE_DIR_ENV = "ONSET_PIPELINE_TRACE_DIR"
+
+
+@dataclass
+class Stage:
+    """One pipeline step.
+
+    Attributes:
+        name: Stage name used on the command line and in the state file
+        run: Top-level function run in a worker process with ``params``
+        deps: Upstream stage names
+        code: Scripts whose source is part of the fingerprint
+        inputs: Input files/directories (globs allowed) besides upstream
+            outputs
+        outputs: Files/directories the stage produces
+        params: Keyword arguments passed to ``run``
+    """
+
+    name: str
+    run: object
+    deps: list = field(default_factory=list)
+    code: list = field(default_factory=list)
+    inputs: list = field(default_factory=list)
+    outputs: list = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+
+
+# ---------------------------------------------------------------------------
+# Stage bodies (run in worker processes, so imports stay local)
+# ---------------------------------------------------------------------------
+
+
+def _stage_profiler():
+    from profiling import Profiler
+
+    return Profiler(enabled=bool(os.environ.get(TRACE_DIR_ENV)))
+
+
+def _finish_profiler(profiler, name: str) -> None:
+    trace_dir = os.environ.get(TRACE_DIR_ENV)
+    if trace_dir:
+        profiler.finish(
+            Path(trace_dir) / f"{name}.json",
+            Path(trace_dir) / f"{name}.trace.json",
+        )
+
+
+def _run_preprocess(**params):
+    from preprocess import preprocess_data
+
+    profiler = _stage_profiler()
+    preprocess_data(
+        str(RAW_DIR),
+        str(PROCESSED_DIR),
+        profiler=profiler,
+        **params,
+    )
+    _finish_profiler(profiler, "preprocess")
+
+
+def _run_train(**params):
+    from train import train_model
+
+    profiler = _stage_profiler()
+    train_model(
+        str(PROCESSED_DIR),
+        str(SAVED_DIR),
+        publish=False,
+        plot_history=False,
+        profiler=profiler,
+        **params,
+    )
+    _finish_profiler(profiler, "train")
+
+
+def _run_plot():
+    from train import plot_training_history
+
+    with open(SAVED_DIR / "history.json", "r") as f:
+        history = json.load(f)
+    plot_training_history(history, SAVED_DIR)
+
+
+def _run_evaluate():
+    from evaluate import evaluate_model
+
+    profiler = _stage_profiler()
+    evaluate_model(
+        str(SAVED_DIR / "best_model.keras"),
+        str(PROCESSED_DIR),
+        str(EVALUATION_DIR),
+        publish=False,
+        profiler=profiler,
+    )
+    _finish_profiler(profiler, "evaluate")
+
+
+def _run_postprocess(**params):
+    from postprocess import tune_postprocessing
+    from preprocess import holdout_recordings
+
+    tune_postprocessing(
+        SAVED_DIR / "tfjs_model",
+        RAW_DIR,
+        holdout=holdout_recordings(PROCESSED_DIR),
+        output_dir=TUNED_MODEL_DIR,
+        **params,
+    )
+
+
+def _run_publish():
+    from publish_model import publish_bundle
+
+    publish_bundle(TUNED_MODEL_DIR)
+
+
+def build_stages(args: argparse.Namespace) -> dict:
+    """Define the pipeline DAG for the given command-line parameters."""
+    preprocess_params = {
+        "window_size": args.window_size,
+        "target_positive_ratio": args.target_positive_ratio,
+        "negative_mining": args.negative_mining,
+        "hard_fraction": args.hard_fraction,
+        "dedup": args.dedup,
+        "dedup_threshold": args.dedup_threshold,
+        "query": args.query,
+        "dataset_format": args.dataset_format,
+        "feature_dtype": args.feature_dtype,
+        "holdout_fraction": (
+            args.holdout_fraction
+            if args.holdout_fraction is not None
+            # Per-instrument event reports need held-out recordings
+            else REPORT_HOLDOUT_FRACTION if args.multi_head else 0.0
+        ),
+    }
+    # See dataset.py
+    if args.dataset_format == "compact":
+        dataset_files = ("dataset.json", "shards")
+    else:
+        dataset_files = ("X.npy", "y.npy", "instruments.npy")
+    preprocess_inputs = [RAW_DIR / "*.json"]
+    if args.negative_mining == "hard":
+        # The pinned model decides which negatives are kept
+        mining_model = Path(args.mining_model)
+        preprocess_params["mining_model_dir"] = str(mining_model)
+        preprocess_inputs.append(mining_model)
+
+    stages = [
+        Stage(
+            "preprocess",
+            _run_preprocess,
+            code=[
+                "preprocess.py",
+                "numpy_model.py",
+                "dedup.py",
+                "catalog.py",
+                "dataset.py",
+                "profiling.py",
+            ],
+            inputs=preprocess_inputs,
+            outputs=[
+                PROCESSED_DIR / name
+                for name in (
+                    "scaler.json",
+                    "scaler.pkl",
+                    "metadata.json",
+                    *dataset_files,
+                )
+            ],
+            params=preprocess_params,
+        ),
+        Stage(
+            "train",
+            _run_train,
+            deps=["preprocess"],
+            code=[
+                "train.py",
+                "preprocess.py",
+                "dataset.py",
+                "pack_bundle.py",
+                "publish_model.py",
+                "profiling.py",
+                "numpy_model.py",
+                "multi_head.py",
+                "event_metrics.py",
+                "cascade.py",
+            ],
+            # The cascade gate is tuned on the full recordings, and the
+            # multi-head report scores the held-out ones
+            inputs=(
+                [RAW_DIR / "*.json"] if args.cascade or args.multi_head else []
+            ),
+            outputs=[
+                SAVED_DIR / "best_model.keras",
+                SAVED_DIR / "final_model.keras",
+                SAVED_DIR / "history.json",
+                SAVED_DIR / "training_metadata.json",
+                SAVED_DIR / "tfjs_model",
+            ],
+            params={
+                "epochs": args.epochs,
+                "batch_size": args.batch_size
+                or (CPU_MODE_BATCH_SIZE if args.cpu_mode else BASE_BATCH_SIZE),
+                "cpu_mode": args.cpu_mode,
+                "intra_op_threads": args.intra_op_threads,
+                "inter_op_threads": args.inter_op_threads,
+                "warmup_epochs": args.warmup_epochs,
+                "xla": args.xla,
+                "merge_metadata": args.merge_metadata,
+                "features": args.features,
+                "lags": args.lags,
+                "multi_head": args.multi_head,
+                "cascade": args.cascade,
+                "gate_recall": args.gate_recall,
+            },
+        ),
+        Stage(
+            "plot",
+            _run_plot,
+            deps=["train"],
+            code=["train.py"],
+            outputs=[SAVED_DIR / "training_history.png"],
+        ),
+        Stage(
+            "evaluate",
+            _run_evaluate,
+            deps=["train"],
+            code=[
+                "evaluate.py",
+                "preprocess.py",
+                "dataset.py",
+                "pack_bundle.py",
+                "publish_model.py",
+                "profiling.py",
+                "numpy_model.py",
+                "cascade.py",
+                "event_metrics.py",
+            ],
+            outputs=[EVALUATION_DIR],
+        ),
+        Stage(
+            "postprocess",
+            _run_postprocess,
+            # preprocess: metadata.json lists the held-out recordings
+            deps=["train", "preprocess"],
+            code=[
+                "postprocess.py",
+                "preprocess.py",
+                "cascade.py",
+                "event_metrics.py",
+                "numpy_model.py",
+                "pack_bundle.py",
+            ],
+            inputs=[RAW_DIR / "*.json"],
+            outputs=[TUNED_MODEL_DIR],
+            params={"tolerance": args.tolerance, "jobs": args.tune_jobs},
+        ),
+        Stage(
+            "publish",
+            _run_publish,
+            deps=["postprocess"],
+            code=["publish_model.py", "pack_bundle.py", "numpy_model.py"],
+            outputs=[STATIC_DIR],
+        ),
+    ]
+    return {stage.name: stage for stage in stages}
+
+
+# ---------------------------------------------------------------------------
+# Fingerprinting
+# ---------------------------------------------------------------------------
+
+
+class HashCache:
+    """Content hashes keyed by (size, mtime_ns) so unchanged files are
+    never re-read."""
+
+    def __init__(self, entries: dict):
+        self.entries = entries
+
+    def file_hash(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path)
+        cached = self.entries.get(key)
+        if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        value = digest.hexdigest()
+        self.entries[key] = [stat.st_size, stat.st_mtime_ns, value]
+        return value
+
+    def path_hashes(self, pattern: Path) -> dict:
+        """Hash a file, every file under a directory, or a glob."""
+        if any(ch in pattern.name for ch in "*?["):
+            paths = sorted(pattern.parent.glob(pattern.name))
+        elif pattern.is_dir():
+            paths = sorted(p for p in pattern.rglob("*") if p.is_file())
+        elif pattern.exists():
+            paths = [pattern]
+        else:
+            paths = []
+        return {_relative(p): self.file_hash(p) for p in paths}
+
+
+def _relative(path: Path) -> str:
+    try:
+        return str(path.relative_to(REPO_ROOT))
+    except ValueError:
+        return str(path)
+
+
+def _digest(value) -> str:
+    blob = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def input_fingerprint(stage: Stage, cache: HashCache, state: dict) -> str:
+    """Fingerprint everything that determines a stage's outputs."""
+    inputs = {}
+    for pattern in stage.inputs:
+        inputs.update(cache.path_hashes(pattern))
+    upstream = {
+        dep: state["stages"].get(dep, {}).get("outputs", {})
+        for dep in stage.deps
+    }
+    return _digest(
+        {
+            "stage": stage.name,
+            "code": {
+                name: cache.file_hash(SCRIPT_DIR / name) for name in stage.code
+            },
+            "params": stage.params,
+            "inputs": inputs,
+            "upstream": upstream,
+        }
+    )
+
+
+def output_hashes(stage: Stage, cache: HashCache) -> dict:
+    hashes = {}
+    for path in stage.outputs:
+        hashes.update(cache.path_hashes(path))
+    return hashes
+
+
+def is_up_to_date(
+    stage: Stage, fingerprint: str, cache: HashCache, state: dict
+) -> bool:
+    record = state["stages"].get(stage.name)
+    if not record or record.get("fingerprint") != fingerprint:
+        return False
+    recorded = record.get("outputs", {})
+    return bool(recorded) and output_hashes(stage, cache) == recorded
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+
+def load_state(path: Path) -> dict:
+    if path.exists():
+        with open(path, "r") as f:
+            state = json.load(f)
+        state.setdefault("stages", {})
+        state.setdefault("hash_cache", {})
+        return state
+    return {"stages": {}, "hash_cache": {}}
+
+
+def save_state(path: Path, state: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def pin_mining_model(
+    source: Path = SAVED_DIR / "tfjs_model", target: Path = MINING_MODEL_DIR
+) -> None:
+    """
+    Copy a trained bundle to where hard negative mining reads it.
+
+    The copy replaces the previous pin in one rename, so a crash never
+    leaves a half-copied mining model behind.
+    """
+    if not (source / "model.json").exists():
+        raise SystemExit(f"No exported model to pin in {source}")
+    staging = target.with_name(f".{target.name}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    shutil.copytree(source, staging)
+    if target.exists():
+        retired = target.with_name(f".{target.name}.old")
+        shutil.rmtree(retired, ignore_errors=True)
+        os.replace(target, retired)
+        os.replace(staging, target)
+        shutil.rmtree(retired)
+    else:
+        os.replace(staging, target)
+    print(
+        f"Pinned {_relative(source)} as the mining model {_relative(target)}"
+    )
+
+
+def _select(stages: dict, targets: list) -> list:
+    """Return the targets plus all their upstream stages, in DAG order."""
+    selected = set()
+
+    def visit(name):
+        if name not in stages:
+            raise SystemExit(f"Unknown stage: {name}")
+        if name in selected:
+            return
+        for dep in stages[name].deps:
+            visit(dep)
+        selected.add(name)
+
+    for name in targets or stages:
+        visit(name)
+    return [name for name in stages if name in selected]
+
+
+def run_pipeline(
+    stages: dict,
+    targets: list | None = None,
+    force: list | None = None,
+    jobs: int = 2,
+    dry_run: bool = False,
+    state_path: Path = STATE_PATH,
+) -> bool:
+    """
+    Run the selected stages, skipping those that are up to date.
+
+    Args:
+        stages: Stage definitions from build_stages
+        targets: Stage names to bring up to date (default: all)
+        force: Stage names to rerun regardless of fingerprints
+        jobs: Maximum stages running at once
+        dry_run: Only report what would run
+        state_path: Where fingerprints and the hash cache are stored
+
+    Returns:
+        True if every selected stage is up to date afterwards
+    """
+    start = time.perf_counter()
+    force = set(force or [])
+    state = load_state(state_path)
+    cache = HashCache(state["hash_cache"])
+    order = _select(stages, targets)
+
+    pending = list(order)
+    done = set()
+    failed = set()
+    would_run = set()
+    running = {}
+    ctx = multiprocessing.get_context("spawn")
+    pool = None
+
+    try:
+        while pending or running:
+            # Schedule every stage whose dependencies are finished
+            for name in list(pending):
+                stage = stages[name]
+                if any(dep in failed for dep in stage.deps):
+                    print(f"[{name}] skipped: upstream stage failed")
+                    pending.remove(name)
+                    failed.add(name)
+                    continue
+                if not all(dep in done for dep in stage.deps):
+                    continue
+                if len(running) >= jobs:
+                    break
+
+                pending.remove(name)
+                fingerprint = input_fingerprint(stage, cache, state)
+                # In a dry run upstream outputs are stale, so anything
+                # downstream of a stage that would run would run too
+                upstream_dirty = any(dep in would_run for dep in stage.deps)
+                if (
+                    name not in force
+                    and not upstream_dirty
+                    and is_up_to_date(stage, fingerprint, cache, state)
+                ):
+                    print(f"[{name}] up to date")
+                    done.add(name)
+                    continue
+                if dry_run:
+                    print(f"[{name}] would run")
+                    would_run.add(name)
+                    done.add(name)
+                    continue
+
+                print(f"[{name}] running...")
+                if pool is None:
+                    pool = ProcessPoolExecutor(
+                        max_workers=jobs, mp_context=ctx
+                    )
+                future = pool.submit(stage.run, **stage.params)
+                running[future] = (name, fingerprint, time.perf_counter())
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, fingerprint, stage_start = running.pop(future)
+                elapsed = time.perf_counter() - stage_start
+                try:
+                    future.result()
+                except Exception as err:  # noqa: BLE001
+                    print(f"[{name}] FAILED after {elapsed:.1f}s: {err}")
+                    state["stages"].pop(name, None)
+                    failed.add(name)
+                    continue
+
+                state["stages"][name] = {
+                    "fingerprint": fingerprint,
+                    "outputs": output_hashes(stages[name], cache),
+                    "completed": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "duration_s": round(elapsed, 3),
+                }
+                save_state(state_path, state)
+                print(f"[{name}] done in {elapsed:.1f}s")
+                done.add(name)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if not dry_run:
+            save_state(state_path, state)
+
+    print(f"Pipeline finished in {time.perf_counter() - start:.2f}s")
+    return not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the onset detection training pipeline"
+    )
+    parser.add_argument(
+        "targets",
+        nargs="*",
+        help="Stages to bring up to date (default: all). "
+        "Upstream stages are included automatically.",
+    )
+    parser.add_argument(
+        "--force",
+        action="append",
+        default=[],
+        metavar="STAGE",
+        help="Rerun STAGE even if it is up to date (repeatable)",
+    )
+    parser.add_argument("--jobs", type=int, default=2)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--trace-dir",
+        help="Write JSON and Chrome traces for each stage that runs",
+    )
+    parser.add_argument("--window-size", type=int, default=5)
+    parser.add_argument("--target-positive-ratio", type=float, default=0.20)
+    parser.add_argument(
+        "--negative-mining", choices=["random", "hard"], default="random"
+    )
+    parser.add_argument("--hard-fraction", type=float, default=0.5)
+    parser.add_argument(
+        "--mining-model",
+        default=str(MINING_MODEL_DIR),
+        help="Pinned bundle that scores negatives with --negative-mining "
+        "hard (default: models/mining_model)",
+    )
+    parser.add_argument(
+        "--pin-mining-model",
+        action="store_true",
+        help="Copy models/saved/tfjs_model to --mining-model first",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=["off", "report", "drop", "downweight"],
+        default="off",
+    )
+    parser.add_argument("--dedup-threshold", type=float)
+    parser.add_argument(
+        "--dataset-format", choices=["npy", "compact"], default="npy"
+    )
+    parser.add_argument(
+        "--feature-dtype", choices=["float32", "float16"], default="float32"
+    )
+    parser.add_argument(
+        "--query", help="Catalog query selecting recordings (catalog.py)"
+    )
+    parser.add_argument(
+        "--holdout-fraction",
+        type=float,
+        help="Share of recordings kept out of training for the event-level "
+        f"reports (default: {REPORT_HOLDOUT_FRACTION} with --multi-head, "
+        "0 otherwise)",
+    )
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help=f"Default {BASE_BATCH_SIZE}, or {CPU_MODE_BATCH_SIZE} with "
+        "--cpu-mode",
+    )
+    parser.add_argument(
+        "--cpu-mode",
+        action="store_true",
+        help="Train with train.py's CPU performance mode",
+    )
+    parser.add_argument("--intra-op-threads", type=int)
+    parser.add_argument("--inter-op-threads", type=int)
+    parser.add_argument(
+        "--warmup-epochs", type=int, default=CPU_MODE_WARMUP_EPOCHS
+    )
+    parser.add_argument(
+        "--xla",
+        action=argparse.BooleanOptionalAction,
+        help="Compile with XLA; on by default with --cpu-mode",
+    )
+    parser.add_argument(
+        "--features",
+        type=lambda value: value.split(","),
+        help="Comma-separated per-frame features to train on",
+    )
+    parser.add_argument(
+        "--lags",
+        type=lambda value: [int(lag) for lag in value.split(",")],
+        help="Comma-separated frame lags to train on (0 = current frame)",
+    )
+    parser.add_argument(
+        "--multi-head",
+        action="store_true",
+        help="Shared trunk with one head per instrument",
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="Linear first-stage gate in front of the MLP",
+    )
+    parser.add_argument("--gate-recall", type=float)
+    parser.add_argument(
+        "--tolerance",
+        type=int,
+        default=2,
+        help="Onset matching tolerance in frames for post-processing "
+        "tuning",
+    )
+    parser.add_argument(
+        "--tune-jobs",
+        type=int,
+        help="Worker processes of the post-processing grid search "
+        "(default: all cores)",
+    )
+    parser.add_argument(
+        "--merge-metadata",
+        action="store_true",
+        help="Merge config.json and scaler.json into model.json",
+    )
+    args = parser.parse_args()
+
+    if args.trace_dir:
+        os.environ[TRACE_DIR_ENV] = str(Path(args.trace_dir).resolve())
+    if args.pin_mining_model and not args.dry_run:
+        pin_mining_model(target=Path(args.mining_model))
+    if (
+        args.negative_mining == "hard"
+        and not args.pin_mining_model
+        and not (Path(args.mining_model) / "model.json").exists()
+    ):
+        raise SystemExit(
+            f"No mining model in {args.mining_model}; pin the current one "
+            "with --pin-mining-model"
+        )
+
+    ok = run_pipeline(
+        build_stages(args),
+        targets=args.targets,
+        force=args.force,
+        jobs=args.jobs,
+        dry_run=args.dry_run,
+    )
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,701 @@
+"""
+Tune the onset post-processing of an exported model for event-level F1.
+
+The app turns frame probabilities into onsets with more than a threshold.
+This script scores every raw recording once, caches the probabilities, and
+grid-searches these post-processing parameters:
+
+- threshold: a frame is a candidate when its probability exceeds it
+- hysteresis: after an onset, the probability must drop below
+  ``threshold - hysteresis`` before the next onset can fire
+- min_interval: minimum frames between onsets (refractory period)
+- peak_window: a candidate must also be the maximum of the probabilities
+  within ±peak_window frames. Deciding this needs peak_window frames of
+  lookahead, so it adds peak_window hops of latency.
+
+With hysteresis, min_interval and peak_window at 0, onsets are exactly the
+rising edges of event_metrics.detect_events. detect_onsets applies the
+same rule to one recording (the scoring service uses it).
+
+All recordings are padded into one (recordings x frames) matrix. The
+detector state of every parameter combination and recording is advanced
+together, one frame at a time. Parameter combinations are split across
+worker processes.
+
+Detections are scored as in event_metrics: a true onset is hit when a
+detection falls within ``tolerance`` frames of it. Each true onset counts
+once, and every other detection is a false positive.
+
+The grid is searched on the recordings the model was trained on. The
+winner's eventF1 is measured on the held-out recordings that preprocess.py
+kept out of the dataset (labelled in-sample when there are none).
+Multi-head bundles get one tuned block per head, since every head has its
+own threshold.
+
+The winning parameters are written to config.json as ``postprocessing``
+(``heads.postprocessing`` for multi-head bundles) of a copy of the bundle,
+models/saved/tuned_model by default. The trained bundle is left as the
+train stage exported it, so its fingerprint stays valid; the pipeline's
+publish stage ships the tuned copy.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+
+from cascade import cascade_predict
+from event_metrics import (
+    detect_events,
+    event_scores,
+    label_events,
+    load_recording,
+)
+from numpy_model import load_tfjs_model, read_bundle_metadata
+from pack_bundle import pack_bundle, print_report
+from preprocess import holdout_recordings, instrument_from_filename
+
+CACHE_NAME = "probability_cache.npz"
+
+DEFAULT_GRID = {
+    "threshold": [round(value, 2) for value in np.arange(0.2, 0.951, 0.05)],
+    "hysteresis": [0.0, 0.05, 0.1, 0.2, 0.3],
+    "min_interval": [0, 3, 5, 8, 12, 20],
+    "peak_window": [0, 1, 2],
+}
+
+
+def _fingerprint(model_dir: Path, paths: list) -> str:
+    """
+    Hash of what the probabilities depend on: topology, weights, scaler and
+    config (minus the ``postprocessing`` blocks, which this script
+    rewrites), plus the recordings' size/mtime.
+    """
+    with open(model_dir / "model.json", "r") as f:
+        model_json = json.load(f)
+    config, scaler = read_bundle_metadata(model_dir, model_json)
+    config = {k: v for k, v in config.items() if k != "postprocessing"}
+    if "heads" in config:
+        config["heads"] = {
+            k: v for k, v in config["heads"].items() if k != "postprocessing"
+        }
+    digest = hashlib.sha256(
+        json.dumps(
+            [model_json["modelTopology"], config, scaler], sort_keys=True
+        ).encode()
+    )
+    for group in model_json["weightsManifest"]:
+        for name in group["paths"]:
+            digest.update((model_dir / name).read_bytes())
+    for path in paths:
+        stat = path.stat()
+        digest.update(
+            f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+        )
+    return digest.hexdigest()
+
+
+def cache_probabilities(model_dir, raw_dir, cache_path=None) -> dict:
+    """
+    Frame probabilities and true onsets of every recording, cached.
+
+    The cache is reused while the bundle and the recordings are unchanged.
+    Probabilities go through the cascade gate when the bundle has one, as
+    in the app. Multi-head bundles score each recording with the head the
+    app would pick for its instrument.
+
+    Returns:
+        Dictionary with "names", "heads" (head per recording, "" for
+        single-head bundles), "probabilities" (list of float32 arrays) and
+        "events" (list of true onset frame indices)
+    """
+    model_dir = Path(model_dir)
+    cache_path = Path(cache_path or model_dir.parent / CACHE_NAME)
+    paths = sorted(Path(raw_dir).glob("*.json"))
+    fingerprint = _fingerprint(model_dir, paths)
+
+    if cache_path.exists():
+        cached = np.load(cache_path, allow_pickle=False)
+        if (
+            str(cached["fingerprint"]) == fingerprint
+            and "heads" in cached.files
+        ):
+            print(f"Using cached probabilities from {cache_path}")
+            offsets = cached["offsets"]
+            event_offsets = cached["event_offsets"]
+            return {
+                "names": list(cached["names"]),
+                "heads": list(cached["heads"]),
+                "probabilities": np.split(
+                    cached["probabilities"], offsets[1:-1]
+                ),
+                "events": np.split(cached["events"], event_offsets[1:-1]),
+            }
+
+    print(f"Scoring {len(paths)} recordings...")
+    models = {"": load_tfjs_model(model_dir)}
+    bundle_heads = models[""].config.get("heads")
+    names, heads, probabilities, events = [], [], [], []
+    for path in paths:
+        X, y = load_recording(path)
+        if len(y) == 0:
+            continue
+        head = ""
+        if bundle_heads:
+            head = instrument_from_filename(path.name)
+            if head not in bundle_heads["names"]:
+                head = bundle_heads["default"]
+        if head not in models:
+            models[head] = load_tfjs_model(model_dir, instrument=head)
+        names.append(path.name)
+        heads.append(head)
+        probabilities.append(cascade_predict(models[head], X)[0])
+        events.append(label_events(y))
+
+    np.savez(
+        cache_path,
+        fingerprint=fingerprint,
+        names=np.array(names),
+        heads=np.array(heads),
+        probabilities=np.concatenate(probabilities),
+        offsets=np.cumsum([0] + [len(p) for p in probabilities]),
+        events=np.concatenate(events),
+        event_offsets=np.cumsum([0] + [len(e) for e in events]),
+    )
+    print(f"Cached probabilities in {cache_path}")
+    return {
+        "names": names,
+        "heads": heads,
+        "probabilities": probabilities,
+        "events": events,
+    }
+
+
+def _subset(cache: dict, rows: list) -> dict:
+    return {
+        key: [cache[key][row] for row in rows]
+        for key in ("names", "heads", "probabilities", "events")
+    }
+
+
+def _pad(probabilities: list) -> np.ndarray:
+    """(recordings, frames) matrix, padded with -1 (never a candidate)."""
+    P = np.full(
+        (len(probabilities), max(len(p) for p in probabilities)),
+        -1.0,
+        dtype=np.float32,
+    )
+    for row, values in enumerate(probabilities):
+        P[row, : len(values)] = values
+    return P
+
+
+def _peak_mask(P: np.ndarray, window: int) -> np.ndarray:
+    """True where a frame is the maximum within ±window frames."""
+    if window == 0:
+        return np.ones(P.shape, dtype=bool)
+    padded = np.pad(P, ((0, 0), (window, window)), constant_values=-1.0)
+    windows = np.lib.stride_tricks.sliding_window_view(
+        padded, 2 * window + 1, axis=1
+    )
+    return P >= windows.max(axis=-1)
+
+
+def detect_onsets(
+    probabilities: np.ndarray, threshold: float, postprocessing: dict | None
+) -> np.ndarray:
+    """
+    Onset frames of one recording, decided as OnsetModel.detect does.
+
+    Args:
+        probabilities: Frame probabilities (0 for gated-out frames)
+        threshold: Candidate threshold
+        postprocessing: config.json ``postprocessing`` block; without it,
+            onsets are the rising edges above the threshold
+
+    Returns:
+        Frame indices of the onsets
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    if not postprocessing:
+        return detect_events(probabilities, threshold)
+    peaks = _peak_mask(probabilities[None], postprocessing["peakWindow"])[0]
+    candidates = np.flatnonzero((probabilities > threshold) & peaks)
+    # The detector re-arms once a frame drops below the release level
+    released = np.cumsum(
+        probabilities < threshold - postprocessing["hysteresis"]
+    )
+    onsets = []
+    for frame in candidates:
+        if onsets and (
+            released[frame] == released[onsets[-1]]
+            or frame - onsets[-1] - 1 < postprocessing["minIntervalFrames"]
+        ):
+            continue
+        onsets.append(frame)
+    return np.asarray(onsets, dtype=np.int64)
+
+
+def active_postprocessing(config: dict, head: str | None = None) -> tuple:
+    """
+    Threshold and post-processing the app uses with a bundle and head.
+
+    Mirrors OnsetModel.load and setInstrument: multi-head bundles use the
+    head's own tuned block (``heads.postprocessing``) or, without one, a
+    plain threshold at the head's threshold. Other bundles use the
+    top-level ``postprocessing`` block.
+
+    Returns:
+        (threshold, postprocessing block or None)
+    """
+    heads = config.get("heads")
+    if heads:
+        name = head if head in heads["names"] else heads["default"]
+        postprocessing = heads.get("postprocessing", {}).get(name)
+        threshold = heads["thresholds"].get(name)
+    else:
+        postprocessing = config.get("postprocessing")
+        threshold = None
+    if postprocessing:
+        threshold = postprocessing["threshold"]
+    if threshold is None:
+        threshold = config.get("optimalThreshold", 0.5)
+    return threshold, postprocessing
+
+
+def _event_ids(events: list, shape: tuple, tolerance: int) -> tuple:
+    """
+    Map each frame to the true onset it would hit (-1 if none).
+
+    Returns:
+        (ids of shape (recordings, frames), number of true onsets)
+    """
+    ids = np.full(shape, -1, dtype=np.int64)
+    next_id = 0
+    for row, frames in enumerate(events):
+        for frame in frames:
+            start = max(0, frame - tolerance)
+            end = min(shape[1], frame + tolerance + 1)
+            window = ids[row, start:end]
+            # Overlapping tolerance windows: the earlier onset keeps them
+            window[window < 0] = next_id
+            next_id += 1
+    return ids, next_id
+
+
+def evaluate_grid(
+    probabilities: list, events: list, combos: list, tolerance: int = 2
+) -> np.ndarray:
+    """
+    Event counts for each post-processing combination.
+
+    Args:
+        probabilities: Frame probabilities per recording
+        events: True onset frames per recording
+        combos: (threshold, hysteresis, min_interval, peak_window) tuples
+        tolerance: Matching tolerance in frames
+
+    Returns:
+        int array of shape (len(combos), 3): tp, fp, fn
+    """
+    P = _pad(probabilities)
+    ids, n_events = _event_ids(events, P.shape, tolerance)
+    combos = np.asarray(combos, dtype=np.float64)
+    threshold = combos[:, :1].astype(np.float32)
+    release = (combos[:, :1] - combos[:, 1:2]).astype(np.float32)
+    min_interval = combos[:, 2:3].astype(np.int64)
+    windows = sorted(set(combos[:, 3].astype(int)))
+    peaks = np.stack([_peak_mask(P, window) for window in windows])
+    window_index = np.searchsorted(windows, combos[:, 3].astype(int))
+
+    n_combos, n_recordings = len(combos), len(P)
+    armed = np.ones((n_combos, n_recordings), dtype=bool)
+    since = np.full((n_combos, n_recordings), np.iinfo(np.int64).max // 2)
+    detections = np.zeros(n_combos, dtype=np.int64)
+    hit = np.zeros((n_combos, n_events + 1), dtype=bool)
+    for t in range(P.shape[1]):
+        p = P[:, t]
+        armed |= p < release
+        fire = (
+            (p > threshold)
+            & peaks[window_index, :, t]
+            & armed
+            & (since >= min_interval)
+        )
+        armed &= ~fire
+        since += 1
+        since[fire] = 0
+        if fire.any():
+            detections += fire.sum(axis=1)
+            combo, recording = np.nonzero(fire)
+            hit[combo, ids[recording, t]] = True  # -1 lands in the spare
+    tp = hit[:, :n_events].sum(axis=1)
+    return np.stack([tp, detections - tp, n_events - tp], axis=1)
+
+
+def _evaluate_chunk(cache: dict, combos: list, tolerance: int) -> np.ndarray:
+    return evaluate_grid(
+        cache["probabilities"], cache["events"], combos, tolerance
+    )
+
+
+def grid_search(
+    cache: dict,
+    grid: dict | None = None,
+    tolerance: int = 2,
+    jobs: int | None = None,
+) -> list:
+    """
+    Score every post-processing combination, spread across processes.
+
+    Returns:
+        Results sorted by event F1 (best first), each with the parameters
+        and event_scores
+    """
+    grid = {**DEFAULT_GRID, **(grid or {})}
+    combos = list(
+        itertools.product(
+            grid["threshold"],
+            grid["hysteresis"],
+            grid["min_interval"],
+            grid["peak_window"],
+        )
+    )
+    jobs = jobs or os.cpu_count() or 1
+    print(f"Evaluating {len(combos)} combinations on {jobs} processes...")
+    if jobs > 1:
+        chunks = [combos[i::jobs] for i in range(jobs)]
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+            parts = list(
+                pool.map(
+                    _evaluate_chunk,
+                    [cache] * len(chunks),
+                    chunks,
+                    [tolerance] * len(chunks),
+                )
+            )
+        combos = [combo for chunk in chunks for combo in chunk]
+        counts = np.concatenate(parts)
+    else:
+        counts = _evaluate_chunk(cache, combos, tolerance)
+
+    results = []
+    for (threshold, hysteresis, min_interval, peak_window), row in zip(
+        combos, counts
+    ):
+        results.append(
+            {
+                "threshold": float(threshold),
+                "hysteresis": float(hysteresis),
+                "min_interval": int(min_interval),
+                "peak_window": int(peak_window),
+                **event_scores(*map(int, row)),
+            }
+        )
+    # Ties: prefer less latency, then the simpler detector
+    results.sort(
+        key=lambda r: (
+            -r["f1"],
+            r["peak_window"],
+            r["min_interval"],
+            r["hysteresis"],
+        )
+    )
+    return results
+
+
+def postprocessing_config(
+    best: dict, evaluation: dict, hop_ms: float = 10.0
+) -> dict:
+    """
+    config.json ``postprocessing`` block for a grid-search result.
+
+    Args:
+        best: Winning parameters
+        evaluation: Event scores of the winner with "scope" ("held-out"
+            or "in-sample") and "recordings" (see tune_postprocessing)
+        hop_ms: Frame hop
+    """
+    return {
+        "threshold": best["threshold"],
+        "hysteresis": best["hysteresis"],
+        "minIntervalFrames": best["min_interval"],
+        "minIntervalMs": best["min_interval"] * hop_ms,
+        "peakWindow": best["peak_window"],
+        "latencyMs": best["peak_window"] * hop_ms,
+        "eventF1": evaluation["f1"],
+        "eventPrecision": evaluation["precision"],
+        "eventRecall": evaluation["recall"],
+        "eventScope": evaluation["scope"],
+        "eventRecordings": evaluation["recordings"],
+    }
+
+
+def write_postprocessing(model_dir, postprocessing: dict) -> None:
+    """
+    Add the tuned blocks to the bundle's config and re-pack it.
+
+    Args:
+        model_dir: Exported bundle
+        postprocessing: Block per head; key "" is the block of a
+            single-head bundle (config ``postprocessing``), other keys go
+            to ``heads.postprocessing``
+    """
+    model_dir = Path(model_dir)
+    with open(model_dir / "model.json", "r") as f:
+        model_json = json.load(f)
+    config, _ = read_bundle_metadata(model_dir, model_json)
+    config = dict(config)
+    if "heads" in config:
+        # Each head has its own threshold; one shared block does not fit
+        config.pop("postprocessing", None)
+        config["heads"] = {**config["heads"], "postprocessing": postprocessing}
+    else:
+        config["postprocessing"] = postprocessing[""]
+
+    merged = not (model_dir / "config.json").exists()
+    if merged:
+        model_json["userDefinedMetadata"]["config"] = config
+        with open(model_dir / "model.json", "w") as f:
+            json.dump(model_json, f)
+    else:
+        with open(model_dir / "config.json", "w") as f:
+            json.dump(config, f, indent=2)
+    print_report(pack_bundle(model_dir, merge_metadata=merged))
+
+
+def _replace_dir(staging: Path, target: Path) -> None:
+    """Swap a finished directory in as ``target`` with one rename."""
+    if target.exists():
+        retired = target.with_name(f".{target.name}.old")
+        shutil.rmtree(retired, ignore_errors=True)
+        os.replace(target, retired)
+        os.replace(staging, target)
+        shutil.rmtree(retired)
+    else:
+        os.replace(staging, target)
+
+
+def _evaluate(cache: dict, combo: tuple, tolerance: int) -> dict:
+    counts = evaluate_grid(
+        cache["probabilities"], cache["events"], [combo], tolerance
+    )[0]
+    return event_scores(*map(int, counts))
+
+
+def print_results(
+    results: list, baseline: dict, evaluation: dict, top: int = 10
+) -> None:
+    print(
+        f"\n{'threshold':>9} {'hyst':>5} {'min int':>7} {'peak':>4} "
+        f"{'F1':>7} {'P':>7} {'R':>7}"
+    )
+    for result in results[:top]:
+        print(
+            f"{result['threshold']:>9.2f} {result['hysteresis']:>5.2f} "
+            f"{result['min_interval']:>7} {result['peak_window']:>4} "
+            f"{result['f1']:>7.4f} {result['precision']:>7.4f} "
+            f"{result['recall']:>7.4f}"
+        )
+    print(
+        f"\n{evaluation['scope'].capitalize()} event F1 on "
+        f"{evaluation['recordings']} recordings, threshold only "
+        f"({baseline['threshold']:.4f}) -> tuned: "
+        f"{baseline['f1']:.4f} -> {evaluation['f1']:.4f}"
+    )
+
+
+def tune_postprocessing(
+    model_dir,
+    raw_dir,
+    cache_path=None,
+    grid: dict | None = None,
+    tolerance: int = 2,
+    jobs: int | None = None,
+    write: bool = True,
+    holdout: list | None = None,
+    output_dir=None,
+) -> dict:
+    """
+    Cache probabilities, grid-search post-processing, write the winners.
+
+    Multi-head bundles are tuned per head, on the recordings the app would
+    score with that head. The grid search runs on the training recordings;
+    the winner and the threshold-only baseline are then scored on the
+    ``holdout`` recordings (preprocess.holdout_recordings), which the model
+    never trained on. Without held-out recordings both are scored on the
+    tuning recordings and labelled in-sample.
+
+    With ``output_dir``, the winners are written to a copy of the bundle
+    there and ``model_dir`` is not modified. The copy is made even when
+    nothing could be tuned, so it is always the bundle to publish.
+
+    Returns:
+        Per head ("" for single-head bundles): {"best", "evaluation"
+        (held-out or in-sample scores of the winner), "baseline" (the
+        model or head threshold only, on the same recordings), "results"}
+    """
+    model_dir = Path(model_dir)
+    cache = cache_probabilities(model_dir, raw_dir, cache_path)
+    config, _ = read_bundle_metadata(
+        model_dir, json.loads((model_dir / "model.json").read_text())
+    )
+    holdout = set(holdout or ())
+
+    tuned = {}
+    for head in sorted(set(cache["heads"])):
+        rows = [row for row, name in enumerate(cache["heads"]) if name == head]
+        tune_rows = [row for row in rows if cache["names"][row] not in holdout]
+        test_rows = [row for row in rows if cache["names"][row] in holdout]
+        label = f"Head {head}" if head else "Model"
+        if not tune_rows:
+            print(f"\n{label}: no training recordings to tune on, skipped")
+            continue
+        print(
+            f"\n{label}: tuning on {len(tune_rows)} recordings, "
+            f"evaluating on {len(test_rows)} held-out"
+        )
+        results = grid_search(_subset(cache, tune_rows), grid, tolerance, jobs)
+
+        best = results[0]
+        eval_rows = test_rows or tune_rows
+        eval_cache = _subset(cache, eval_rows)
+        evaluation = {
+            **_evaluate(
+                eval_cache,
+                (
+                    best["threshold"],
+                    best["hysteresis"],
+                    best["min_interval"],
+                    best["peak_window"],
+                ),
+                tolerance,
+            ),
+            "scope": "held-out" if test_rows else "in-sample",
+            "recordings": len(eval_rows),
+        }
+        threshold = (
+            config["heads"]["thresholds"][head]
+            if head
+            else config["optimalThreshold"]
+        )
+        baseline = {
+            "threshold": threshold,
+            **_evaluate(eval_cache, (threshold, 0.0, 0, 0), tolerance),
+        }
+        print_results(results, baseline, evaluation)
+        tuned[head] = {
+            "best": best,
+            "evaluation": evaluation,
+            "baseline": baseline,
+            "results": results,
+        }
+
+    if not write:
+        return tuned
+    target = model_dir
+    if output_dir is not None:
+        # Tune a staged copy, so a crash never leaves a half-written bundle
+        output_dir = Path(output_dir)
+        target = output_dir.with_name(f".{output_dir.name}.tmp")
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.copytree(model_dir, target)
+    if tuned:
+        write_postprocessing(
+            target,
+            {
+                head: postprocessing_config(
+                    result["best"], result["evaluation"]
+                )
+                for head, result in tuned.items()
+            },
+        )
+    if output_dir is not None:
+        _replace_dir(target, output_dir)
+        target = output_dir
+    if tuned:
+        print(f"Wrote postprocessing to the config of {target}")
+    return tuned
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    def floats(value):
+        return [float(item) for item in value.split(",")]
+
+    def ints(value):
+        return [int(item) for item in value.split(",")]
+
+    parser = argparse.ArgumentParser(
+        description="Grid-search onset post-processing for event F1"
+    )
+    parser.add_argument(
+        "--model-dir",
+        default=str(training_dir / "models" / "saved" / "tfjs_model"),
+    )
+    parser.add_argument(
+        "--raw-dir", default=str(training_dir / "data" / "raw")
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=str(training_dir / "data" / "processed"),
+        help="Processed dataset whose metadata lists the held-out "
+        "recordings",
+    )
+    parser.add_argument(
+        "--cache",
+        help=f"Probability cache (default: <model-dir>/../{CACHE_NAME})",
+    )
+    parser.add_argument("--thresholds", type=floats)
+    parser.add_argument("--hysteresis", type=floats)
+    parser.add_argument("--min-intervals", type=ints, help="In frames")
+    parser.add_argument("--peak-windows", type=ints, help="In frames")
+    parser.add_argument("--tolerance", type=int, default=2)
+    parser.add_argument("--jobs", type=int, help="Worker processes")
+    parser.add_argument(
+        "--output-dir",
+        default=str(training_dir / "models" / "saved" / "tuned_model"),
+        help="Where the tuned copy of the bundle is written (the bundle "
+        "in --model-dir is left unchanged)",
+    )
+    parser.add_argument(
+        "--no-write",
+        action="store_true",
+        help="Only report, do not write the tuned bundle",
+    )
+    parser.add_argument("--output", help="Write all results as JSON")
+    args = parser.parse_args()
+
+    grid = {
+        name: value
+        for name, value in (
+            ("threshold", args.thresholds),
+            ("hysteresis", args.hysteresis),
+            ("min_interval", args.min_intervals),
+            ("peak_window", args.peak_windows),
+        )
+        if value
+    }
+    tuned = tune_postprocessing(
+        args.model_dir,
+        args.raw_dir,
+        args.cache,
+        grid,
+        args.tolerance,
+        args.jobs,
+        write=not args.no_write,
+        holdout=holdout_recordings(args.data_dir),
+        output_dir=args.output_dir,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(tuned, f, indent=2)
@@ -16,12 +16,162 @@ Each input sample consists of:
 - Label: 1 if frame t is within ±1 frame of an onset, 0 otherwise
 """
 
+import argparse
+import hashlib
 import json
+import re
+import tempfile
 from pathlib import Path
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 import pickle
 
+from dataset import save_dataset
+from profiling import Profiler, add_profiling_args, profiler_from_args
+
+# Per-frame feature order; a window is [t-(window_size-1), ..., t-1, t]
+FEATURE_NAMES = [
+    "amplitude",
+    "spectralFlux",
+    "phaseDeviation",
+    "highFrequencyEnergy",
+    "hasPitch",
+]
+
+
+# Silent-frame filter of extract_features: frames below all thresholds
+# (and not manual onsets) are dropped before windowing
+MIN_AMPLITUDE = 0.01  # Minimum loudness
+MIN_ACTIVITY = 0.01  # Minimum flux or phase deviation
+
+
+# Share of recordings to keep out of the dataset when event-level reports
+# (e.g. multi_head.instrument_event_report) should score recordings the
+# model never saw. Opt-in: by default every recording is used for training.
+REPORT_HOLDOUT_FRACTION = 0.2
+
+
+# Instrument ids from src/lib/config/instruments.ts. "generic" (index 0)
+# covers recordings whose file name does not name a known instrument.
+INSTRUMENTS = [
+    "generic",
+    "violin",
+    "guitar",
+    "viola",
+    "cello",
+    "double-bass",
+    "flute",
+    "french-horn",
+    "recorder",
+]
+
+
+def instrument_from_filename(filename: str) -> str:
+    """
+    Instrument of a recording exported by the onset-training page.
+
+    Exports are named onset-training-<instrument>-<timestamp>.json; anything
+    else is "generic".
+    """
+    match = re.match(r"onset-training-(.+)-\d+$", Path(filename).stem)
+    if match and match.group(1) in INSTRUMENTS:
+        return match.group(1)
+    return "generic"
+
+
+def is_holdout(filename: str, fraction: float) -> bool:
+    """
+    Whether a recording belongs to the held-out split.
+
+    Membership depends only on the file name, so a recording stays on its
+    side of the split as others are added or removed.
+    """
+    digest = hashlib.sha256(filename.encode()).digest()
+    return int.from_bytes(digest[:8], "big") < fraction * 2**64
+
+
+def holdout_recordings(data_dir) -> list | None:
+    """
+    Held-out recording names of a processed dataset, from its metadata.
+
+    Returns:
+        Sorted file names, or None for datasets written without a holdout
+    """
+    metadata_path = Path(data_dir) / "metadata.json"
+    if not metadata_path.exists():
+        return None
+    with open(metadata_path, "r") as f:
+        holdout = json.load(f).get("holdout")
+    return holdout["recordings"] if holdout else None
+
+
+def input_spec(
+    window_size: int = 5,
+    features: list | None = None,
+    lags: list | None = None,
+) -> dict:
+    """
+    Describe which window columns a model consumes.
+
+    Lag 0 is the current frame t, lag 1 is t-1 and so on. The returned
+    spec is written to config.json/scaler.json so the client knows which
+    feature extractors and how much history it needs.
+
+    Args:
+        window_size: Frames per window in the preprocessed data
+        features: Feature names to keep (default: all of FEATURE_NAMES)
+        lags: Lags to keep (default: all)
+
+    Returns:
+        Dictionary with windowSize, features, lags and the X column indices
+    """
+    features = list(features) if features else list(FEATURE_NAMES)
+    lags = sorted(lags) if lags else list(range(window_size))
+    unknown = [name for name in features if name not in FEATURE_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown features {unknown}, use {FEATURE_NAMES}")
+    if lags[0] < 0 or lags[-1] >= window_size:
+        raise ValueError(f"Lags must be in 0..{window_size - 1}, got {lags}")
+
+    # Keep the original window order: oldest frame first, FEATURE_NAMES order
+    columns = [
+        (window_size - 1 - lag) * len(FEATURE_NAMES) + index
+        for lag in sorted(lags, reverse=True)
+        for index, name in enumerate(FEATURE_NAMES)
+        if name in features
+    ]
+    return {
+        "windowSize": window_size,
+        "features": [name for name in FEATURE_NAMES if name in features],
+        "lags": lags,
+        "columns": columns,
+    }
+
+
+def scaler_json(scaler: StandardScaler, window_size: int = 5) -> dict:
+    """scaler.json contents for a fitted StandardScaler."""
+    assert scaler.mean_ is not None
+    assert scaler.scale_ is not None
+    return {
+        "mean": scaler.mean_.tolist(),
+        "std": scaler.scale_.tolist(),  # sklearn uses scale_ (1/std_dev)
+        "n_features": len(scaler.mean_),
+        "feature_names": FEATURE_NAMES * window_size,  # One per frame
+    }
+
+
+def select_scaler(scaler_data: dict, inputs: dict) -> dict:
+    """Restrict scaler.json contents to the columns in an input spec."""
+    columns = inputs["columns"]
+    return {
+        **scaler_data,
+        "mean": [scaler_data["mean"][i] for i in columns],
+        "std": [scaler_data["std"][i] for i in columns],
+        "n_features": len(columns),
+        "feature_names": [scaler_data["feature_names"][i] for i in columns],
+        "inputs": inputs,
+    }
+
 
 def load_json_file(filepath: str) -> list:
     """Load a single JSON training file."""
@@ -29,7 +179,9 @@ def load_json_file(filepath: str) -> list:
         return json.load(f)
 
 
-def extract_features(data: list, window_size: int = 5) -> tuple:
+def extract_features(
+    data: list, window_size: int = 5, profiler: Profiler | None = None
+) -> tuple:
     """
     Extract features and labels using causal windowing.
 
@@ -49,6 +201,7 @@ def extract_features(data: list, window_size: int = 5) -> tuple:
             }
         window_size: Number of frames in causal window (default 5)
                     Frame at index t uses frames [t-4, t-3, t-2, t-1, t]
+        profiler: Optional profiler timing the "filter" and "window" stages
 
     Returns:
         features: numpy array of shape (n_samples, window_size * 5)
@@ -57,25 +210,24 @@ def extract_features(data: list, window_size: int = 5) -> tuple:
     if not isinstance(data, list):
         raise ValueError("Data must be a list of frame dictionaries")
 
+    profiler = profiler or Profiler()
+
     # FILTER OUT SILENT/EMPTY SECTIONS
     # Remove frames where all features are zero or near-zero
     # This prevents the model from learning on empty space
-    MIN_AMPLITUDE = (
-        0.01  # Drop frames below this loudness before model ingestion
-    )
-    MIN_ACTIVITY = 0.01  # Minimum flux or phase deviation
-
     filtered_data = []
-    for frame in data:
-        # Keep frame if it has any significant activity
-        has_activity = (
-            frame["amplitude"] > MIN_AMPLITUDE
-            or frame["spectralFlux"] > MIN_ACTIVITY
-            or frame["phaseDeviation"] > MIN_ACTIVITY
-            or frame.get("hasManualOnset", False)  # Always keep onset frames
-        )
-        if has_activity:
-            filtered_data.append(frame)
+    with profiler.stage("filter", n_samples=len(data)):
+        for frame in data:
+            # Keep frame if it has any significant activity
+            has_activity = (
+                frame["amplitude"] > MIN_AMPLITUDE
+                or frame["spectralFlux"] > MIN_ACTIVITY
+                or frame["phaseDeviation"] > MIN_ACTIVITY
+                # Always keep onset frames
+                or frame.get("hasManualOnset", False)
+            )
+            if has_activity:
+                filtered_data.append(frame)
 
     if len(filtered_data) < window_size:
         print(
@@ -92,36 +244,367 @@ def extract_features(data: list, window_size: int = 5) -> tuple:
     features = []
     labels = []
 
-    # Start from frame (window_size - 1) to have full history
-    # For window_size=5, start from frame 4 (index 4)
-    for t in range(window_size - 1, len(filtered_data)):
-        # Build causal window: [t-4, t-3, t-2, t-1, t]
-        window_features = []
-
-        for offset in range(window_size - 1, -1, -1):
-            frame_idx = t - offset
-            frame = filtered_data[frame_idx]
-
-            # Extract 5 features per frame
-            window_features.extend(
-                [
-                    frame["amplitude"],
-                    frame["spectralFlux"],
-                    frame["phaseDeviation"],
-                    frame["highFrequencyEnergy"],
-                    (
-                        2.0 if frame["hasPitch"] else 0.0
-                    ),  # Boost pitch presence signal
-                ]
+    with profiler.stage(
+        "window", n_samples=len(filtered_data) - window_size + 1
+    ):
+        # Start from frame (window_size - 1) to have full history
+        # For window_size=5, start from frame 4 (index 4)
+        for t in range(window_size - 1, len(filtered_data)):
+            # Build causal window: [t-4, t-3, t-2, t-1, t]
+            window_features = []
+
+            for offset in range(window_size - 1, -1, -1):
+                frame_idx = t - offset
+                frame = filtered_data[frame_idx]
+
+                # Extract 5 features per frame
+                window_features.extend(
+                    [
+                        frame["amplitude"],
+                        frame["spectralFlux"],
+                        frame["phaseDeviation"],
+                        frame["highFrequencyEnergy"],
+                        (
+                            2.0 if frame["hasPitch"] else 0.0
+                        ),  # Boost pitch presence signal
+                    ]
+                )
+
+            features.append(window_features)
+
+            # Label is from the CURRENT frame (t), not future
+            current_frame = filtered_data[t]
+            labels.append(
+                1 if current_frame.get("hasManualOnset", False) else 0
+            )
+
+        features = np.array(features)
+        labels = np.array(labels)
+
+    return features, labels
+
+
+def balance_dataset(
+    X: np.ndarray,
+    y: np.ndarray,
+    target_positive_ratio: float,
+    return_indices: bool = False,
+) -> tuple:
+    """
+    Downsample negatives so positives make up target_positive_ratio.
+
+    Args:
+        X: Feature array of shape (n_samples, n_features)
+        y: Binary labels of shape (n_samples,)
+        target_positive_ratio: Minimum positive ratio after balancing
+        return_indices: Also return the kept row indices
+
+    Returns:
+        (X, y) unchanged if already balanced, otherwise downsampled and
+        shuffled; (X, y, indices) with return_indices
+    """
+    keep_indices = np.arange(len(y))
+    positive_ratio = y.mean()
+    if positive_ratio < target_positive_ratio:
+        print(
+            f"\nPositive ratio ({positive_ratio:.3f}) is below "
+            f"target ({target_positive_ratio:.3f})"
+        )
+        print("Downsampling negatives...")
+
+        # Get indices of positive and negative samples
+        pos_indices = np.where(y == 1)[0]
+        neg_indices = np.where(y == 0)[0]
+
+        n_positives = len(pos_indices)
+        # Calculate how many negatives we need to reach target ratio
+        # target_ratio = n_pos / (n_pos + n_neg_kept)
+        # n_neg_kept = n_pos * (1 - target_ratio) / target_ratio
+        n_negatives_keep = int(
+            n_positives * (1 - target_positive_ratio) / target_positive_ratio
+        )
+
+        # Randomly sample negatives
+        np.random.seed(42)
+        neg_indices_keep = np.random.choice(
+            neg_indices, size=n_negatives_keep, replace=False
+        )
+
+        # Combine and shuffle
+        keep_indices = np.concatenate([pos_indices, neg_indices_keep])
+        np.random.shuffle(keep_indices)
+
+        X = X[keep_indices]
+        y = y[keep_indices]
+
+        print(
+            f"  Kept {len(pos_indices)} positives + "
+            f"{n_negatives_keep} negatives"
+        )
+        print(f"  New ratio: {y.mean():.3f}")
+
+    if return_indices:
+        return X, y, keep_indices
+    return X, y
+
+
+def load_mining_model(model_dir):
+    """
+    Load the previous exported model for hard negative mining.
+
+    Returns None (random downsampling) if no usable bundle is found.
+    """
+    from numpy_model import load_tfjs_model
+
+    if model_dir is None or not (Path(model_dir) / "model.json").exists():
+        print(
+            f"Warning: no previous model at {model_dir}, "
+            f"falling back to random negative downsampling"
+        )
+        return None
+
+    model = load_tfjs_model(model_dir)
+    if model.scaler_mean is None:
+        print(
+            f"Warning: {model_dir} has no scaler.json, "
+            f"falling back to random negative downsampling"
+        )
+        return None
+    print(f"Hard negative mining with model from {model_dir}")
+    return model
+
+
+class SpilledShards:
+    """
+    Per-file feature arrays spilled to .npy files in a directory.
+
+    Indexing memory-maps one file and applies its dedup mask, so a pass
+    over all shards holds one recording's windows at a time instead of
+    the whole unbalanced matrix.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.paths = []
+        self.masks = []
+
+    def append(self, features: np.ndarray) -> None:
+        path = self.directory / f"shard-{len(self.paths):05d}.npy"
+        np.save(path, features)
+        self.paths.append(path)
+        self.masks.append(None)
+
+    def select(self, index: int, mask: np.ndarray) -> None:
+        """Keep only the masked windows of one shard."""
+        self.masks[index] = mask
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        features = np.load(self.paths[index], mmap_mode="r")
+        mask = self.masks[index]
+        return features if mask is None else features[mask]
+
+
+def _stratified_sample(
+    scores: np.ndarray,
+    candidates: np.ndarray,
+    n_samples: int,
+    rng: np.random.Generator,
+    n_strata: int = 10,
+) -> np.ndarray:
+    """Sample candidates evenly across score quantiles."""
+    if n_samples <= 0 or len(candidates) == 0:
+        return np.array([], dtype=np.int64)
+    if n_samples >= len(candidates):
+        return candidates
+
+    cand_scores = scores[candidates]
+    edges = np.quantile(cand_scores, np.linspace(0, 1, n_strata + 1)[1:-1])
+    strata = np.searchsorted(edges, cand_scores, side="right")
+    counts = np.bincount(strata, minlength=n_strata)
+
+    # Proportional allocation, rounding remainder to the largest strata
+    quota = np.floor(counts * n_samples / len(candidates)).astype(np.int64)
+    shortfall = n_samples - quota.sum()
+    quota[np.argsort(-counts)[:shortfall]] += 1
+
+    picked = []
+    for stratum in range(n_strata):
+        members = candidates[strata == stratum]
+        take = min(quota[stratum], len(members))
+        if take:
+            picked.append(rng.choice(members, size=take, replace=False))
+    return np.concatenate(picked) if picked else candidates[:0]
+
+
+def balance_hard_negatives(
+    shards_X,
+    shards_y: list,
+    target_positive_ratio: float,
+    scorer,
+    n_features: int,
+    hard_fraction: float = 0.5,
+    batch_size: int = 65536,
+    seed: int = 42,
+    return_indices: bool = False,
+) -> tuple:
+    """
+    Downsample negatives, keeping the ones the previous model gets wrong.
+
+    Two passes over the shards: the first scores the negatives shard by
+    shard (one float per sample is all that is held for the whole corpus),
+    the second gathers the selected rows. With SpilledShards only one
+    shard's features are in memory at a time, besides the balanced result.
+    The top ``hard_fraction`` of the kept negatives are the highest-scoring
+    false positives; the remainder is a random sample stratified over score
+    quantiles so easy negatives are still represented.
+
+    Args:
+        shards_X: Per-file feature arrays of shape (n_i, n_features), as a
+            list or a SpilledShards
+        shards_y: Per-file label arrays of shape (n_i,)
+        target_positive_ratio: Minimum positive ratio after balancing
+        scorer: Model with predict(X) -> probabilities (raw features)
+        n_features: Columns of the feature arrays
+        hard_fraction: Share of kept negatives chosen by score
+        batch_size: Rows per scoring batch
+        seed: Random seed for the stratified remainder and shuffle
+        return_indices: Also return the kept indices into the concatenated
+            shards
+
+    Returns:
+        (X, y) balanced and shuffled; (X, y, indices) with return_indices
+    """
+    rng = np.random.default_rng(seed)
+    offsets = np.cumsum([0] + [len(shard) for shard in shards_y])
+    y_all = np.concatenate(shards_y)
+
+    pos_indices = np.flatnonzero(y_all == 1)
+    neg_indices = np.flatnonzero(y_all == 0)
+    n_negatives_keep = int(
+        len(pos_indices) * (1 - target_positive_ratio) / target_positive_ratio
+    )
+
+    if y_all.mean() >= target_positive_ratio:
+        keep_neg = neg_indices
+    else:
+        print(
+            f"\nPositive ratio ({y_all.mean():.3f}) is below "
+            f"target ({target_positive_ratio:.3f})"
+        )
+        print("Mining hard negatives...")
+
+        # Score every sample (-1 marks positives so they are never picked)
+        scores = np.full(len(y_all), -1.0, dtype=np.float32)
+        for shard, (shard_y, offset) in enumerate(zip(shards_y, offsets)):
+            neg_local = np.flatnonzero(shard_y == 0)
+            if len(neg_local):
+                scores[offset + neg_local] = scorer.predict(
+                    shards_X[shard][neg_local], batch_size=batch_size
+                )
+
+        n_hard = int(round(n_negatives_keep * hard_fraction))
+        neg_scores = scores[neg_indices]
+        if n_hard > 0:
+            top = np.argpartition(-neg_scores, n_hard - 1)[:n_hard]
+            hard = neg_indices[top]
+        else:
+            hard = neg_indices[:0]
+
+        remaining = np.setdiff1d(neg_indices, hard, assume_unique=True)
+        easy = _stratified_sample(
+            scores, remaining, n_negatives_keep - len(hard), rng
+        )
+        keep_neg = np.concatenate([hard, easy])
+
+        threshold = 0.5
+        n_false_pos = int((neg_scores >= threshold).sum())
+        print(
+            f"  Previous model false positives at {threshold}: "
+            f"{n_false_pos}/{len(neg_indices)} negatives"
+        )
+        if len(hard):
+            print(
+                f"  Kept {len(hard)} hard negatives "
+                f"(score >= {scores[hard].min():.3f}) + "
+                f"{len(easy)} stratified random negatives"
             )
 
-        features.append(window_features)
+    keep_indices = np.concatenate([pos_indices, keep_neg])
+    rng.shuffle(keep_indices)
+
+    # Gather selected rows shard by shard
+    shard_of = np.searchsorted(offsets, keep_indices, side="right") - 1
+    X = np.empty((len(keep_indices), n_features), dtype=np.float64)
+    for shard, offset in enumerate(offsets[:-1]):
+        rows = np.flatnonzero(shard_of == shard)
+        if len(rows):
+            X[rows] = shards_X[shard][keep_indices[rows] - offset]
+    y = y_all[keep_indices]
+
+    print(f"  Kept {len(pos_indices)} positives + {len(keep_neg)} negatives")
+    print(f"  New ratio: {y.mean():.3f}")
+    if return_indices:
+        return X, y, keep_indices
+    return X, y
+
+
+def deduplicate_recordings(
+    names: list,
+    signatures: np.ndarray,
+    all_features: list,
+    all_labels: list,
+    all_instruments: list,
+    mode: str,
+    threshold: float,
+    profiler: Profiler,
+) -> dict:
+    """
+    Find near-duplicate recordings and thin their windows in place.
 
-        # Label is from the CURRENT frame (t), not future
-        current_frame = filtered_data[t]
-        labels.append(1 if current_frame.get("hasManualOnset", False) else 0)
+    The per-file lists are filtered before concatenation, so dropped
+    windows never reach balancing, scaling or training.
 
-    return np.array(features), np.array(labels)
+    Returns:
+        Summary for metadata.json (clusters by file name, windows saved)
+    """
+    from dedup import dedup_plan, find_duplicates, print_clusters
+
+    print("\nChecking for near-duplicate recordings...")
+    with profiler.stage("dedup", n_samples=len(names)):
+        clusters, pairs = find_duplicates(signatures, threshold)
+        masks = dedup_plan(
+            clusters, [len(labels) for labels in all_labels], mode
+        )
+    print_clusters(names, clusters, pairs)
+
+    windows_before = sum(len(labels) for labels in all_labels)
+    if mode != "report":
+        for i, mask in enumerate(masks):
+            if not mask.all():
+                if isinstance(all_features, SpilledShards):
+                    all_features.select(i, mask)
+                else:
+                    all_features[i] = all_features[i][mask]
+                all_labels[i] = all_labels[i][mask]
+                all_instruments[i] = all_instruments[i][mask]
+    windows_after = sum(len(labels) for labels in all_labels)
+    print(
+        f"  Dedup ({mode}): {windows_before} -> {windows_after} windows "
+        f"({windows_before - windows_after} saved)"
+    )
+    return {
+        "mode": mode,
+        "threshold": threshold,
+        "clusters": [
+            [names[index] for index in members] for members in clusters
+        ],
+        "windows_before": windows_before,
+        "windows_after": windows_after,
+        "windows_saved": windows_before - windows_after,
+    }
 
 
 def preprocess_data(
@@ -129,6 +612,17 @@ def preprocess_data(
     output_dir: str,
     window_size: int = 5,
     target_positive_ratio: float = 0.20,
+    profiler: Profiler | None = None,
+    negative_mining: str = "random",
+    mining_model_dir: str | None = None,
+    hard_fraction: float = 0.5,
+    dedup: str = "off",
+    dedup_threshold: float | None = None,
+    query: str | None = None,
+    catalog_path: str | None = None,
+    dataset_format: str = "npy",
+    feature_dtype: str = "float32",
+    holdout_fraction: float = 0.0,
 ):
     """
     Preprocess all JSON files in the raw data directory.
@@ -139,44 +633,143 @@ def preprocess_data(
         window_size: Temporal context window size (default 5 frames = 50ms)
         target_positive_ratio: Minimum positive ratio (default 0.20 = 20%)
                              If below this, negatives are downsampled
+        profiler: Optional profiler timing each preprocessing stage
+        negative_mining: "random" (uniform downsampling) or "hard" (keep the
+            negatives the previous model scores highest)
+        mining_model_dir: Exported TF.js bundle used to score negatives in
+            "hard" mode
+        hard_fraction: Share of kept negatives chosen by score in "hard"
+            mode; the rest is a score-stratified random sample
+        dedup: Near-duplicate recording handling (see dedup.py): "off",
+            "report" (only list clusters), "drop" (keep one recording per
+            cluster) or "downweight" (subsample each cluster's windows to
+            about one recording's worth)
+        dedup_threshold: Estimated similarity at which two recordings are
+            duplicates (default: dedup.DEFAULT_THRESHOLD)
+        query: Catalog query (SQL WHERE expression, see catalog.py) that
+            selects the recordings to use; unselected files are not opened
+        catalog_path: Catalog file (default: catalog.sqlite next to raw_dir)
+        dataset_format: "npy" (X.npy/y.npy/instruments.npy) or "compact"
+            (compressed shards, see dataset.py)
+        feature_dtype: Feature storage of the compact format: "float32"
+            (scaled) or "float16" (unscaled, scaled on load)
+        holdout_fraction: Share of recordings left out of the dataset (see
+            is_holdout; default 0, every recording is used); their names
+            are listed in metadata.json
     """
+    from dedup import DEDUP_MODES, DEFAULT_THRESHOLD, recording_signature
+
+    profiler = profiler or Profiler()
+    if dedup not in DEDUP_MODES:
+        raise ValueError(f"Unknown dedup mode: {dedup}")
+    if dedup_threshold is None:
+        dedup_threshold = DEFAULT_THRESHOLD
+
+    # Load the previous model before anything in output_dir is rewritten
+    scorer = None
+    if negative_mining == "hard":
+        scorer = load_mining_model(mining_model_dir)
+    elif negative_mining != "random":
+        raise ValueError(f"Unknown negative_mining mode: {negative_mining}")
+
     raw_path = Path(raw_dir)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
+    n_features = window_size * len(FEATURE_NAMES)
 
+    # Hard mining keeps per-file windows on disk until the balanced rows
+    # are gathered; random downsampling needs them stacked in memory
+    spill_dir = None
     all_features = []
+    if scorer is not None:
+        spill_dir = tempfile.TemporaryDirectory(
+            prefix=".windows-", dir=output_path
+        )
+        all_features = SpilledShards(spill_dir.name)
     all_labels = []
-
-    json_files = list(raw_path.glob("*.json"))
-    print(f"Found {len(json_files)} JSON files")
+    all_instruments = []
+    signatures = []
+
+    if query:
+        from catalog import select_recordings
+
+        json_files = select_recordings(raw_path, query, catalog_path)
+        print(f"Catalog query {query!r} selected {len(json_files)} files")
+        if not json_files:
+            raise ValueError(f"No recordings match catalog query {query!r}")
+    else:
+        json_files = list(raw_path.glob("*.json"))
+        print(f"Found {len(json_files)} JSON files")
+
+    holdout = sorted(
+        json_file.name
+        for json_file in json_files
+        if is_holdout(json_file.name, holdout_fraction)
+    )
+    if holdout:
+        json_files = [
+            json_file
+            for json_file in json_files
+            if json_file.name not in holdout
+        ]
+        print(f"Holding out {len(holdout)} recordings for evaluation")
+        if not json_files:
+            raise ValueError(
+                "Every recording is held out; lower --holdout-fraction"
+            )
 
     for json_file in json_files:
         print(f"Processing {json_file.name}...")
-        data = load_json_file(str(json_file))
-        features, labels = extract_features(data, window_size)
+        with profiler.stage("load") as stage:
+            data = load_json_file(str(json_file))
+            stage.set_samples(len(data))
+        features, labels = extract_features(data, window_size, profiler)
+        if len(labels) == 0:
+            features = np.empty((0, n_features))
+            labels = np.empty(0, dtype=np.int64)
+        if dedup != "off":
+            with profiler.stage("signature", n_samples=len(data)):
+                signatures.append(recording_signature(data))
 
         all_features.append(features)
         all_labels.append(labels)
+        instrument = INSTRUMENTS.index(
+            instrument_from_filename(json_file.name)
+        )
+        all_instruments.append(np.full(len(labels), instrument, np.int8))
 
-        onset_pct = 100 * labels.mean()
+        onset_pct = 100 * labels.mean() if len(labels) else 0.0
         print(
             f"  - Extracted {len(features)} samples, "
             f"{labels.sum()} onsets ({onset_pct:.2f}%)"
         )
 
-    # Concatenate all data
-    X = np.vstack(all_features)
+    dedup_info = None
+    if dedup != "off":
+        dedup_info = deduplicate_recordings(
+            [json_file.name for json_file in json_files],
+            np.stack(signatures),
+            all_features,
+            all_labels,
+            all_instruments,
+            dedup,
+            dedup_threshold,
+            profiler,
+        )
+
+    # Concatenate labels; features stay per-file until balancing so hard
+    # negative mining never materializes the full unbalanced matrix
     y = np.concatenate(all_labels)
 
     print("\nBefore balancing:")
-    print(f"  Total samples: {len(X)}")
+    print(f"  Total samples: {len(y)}")
     print(f"  Total onsets: {y.sum()} ({100*y.mean():.2f}%)")
-    print(f"  Feature shape: {X.shape}")
+    print(f"  Feature shape: {(len(y), n_features)}")
 
     # Warn if we don't have enough data
-    if len(X) < 1000:
+    if len(y) < 1000:
         print(
-            f"\n⚠️  WARNING: Only {len(X)} samples - need more training data!"
+            f"\n⚠️  WARNING: Only {len(y)} samples - need more training data!"
         )
         print("   Recommendation: Record more files with onset annotations")
     if y.sum() < 100:
@@ -187,44 +780,26 @@ def preprocess_data(
         print("   Recommendation: Add more onset markers when recording")
 
     # Balance data if positive ratio is too low
-    positive_ratio = y.mean()
-    if positive_ratio < target_positive_ratio:
-        print(
-            f"\nPositive ratio ({positive_ratio:.3f}) is below "
-            f"target ({target_positive_ratio:.3f})"
-        )
-        print("Downsampling negatives...")
-
-        # Get indices of positive and negative samples
-        pos_indices = np.where(y == 1)[0]
-        neg_indices = np.where(y == 0)[0]
-
-        n_positives = len(pos_indices)
-        # Calculate how many negatives we need to reach target ratio
-        # target_ratio = n_pos / (n_pos + n_neg_kept)
-        # n_neg_kept = n_pos * (1 - target_ratio) / target_ratio
-        n_negatives_keep = int(
-            n_positives * (1 - target_positive_ratio) / target_positive_ratio
-        )
-
-        # Randomly sample negatives
-        np.random.seed(42)
-        neg_indices_keep = np.random.choice(
-            neg_indices, size=n_negatives_keep, replace=False
-        )
-
-        # Combine and shuffle
-        keep_indices = np.concatenate([pos_indices, neg_indices_keep])
-        np.random.shuffle(keep_indices)
-
-        X = X[keep_indices]
-        y = y[keep_indices]
-
-        print(
-            f"  Kept {len(pos_indices)} positives + "
-            f"{n_negatives_keep} negatives"
-        )
-        print(f"  New ratio: {y.mean():.3f}")
+    with profiler.stage("balance", n_samples=len(y)):
+        if scorer is not None:
+            X, y, keep_indices = balance_hard_negatives(
+                all_features,
+                all_labels,
+                target_positive_ratio,
+                scorer,
+                n_features,
+                hard_fraction=hard_fraction,
+                return_indices=True,
+            )
+        else:
+            X = np.vstack(all_features)
+            X, y, keep_indices = balance_dataset(
+                X, y, target_positive_ratio, return_indices=True
+            )
+        instruments = np.concatenate(all_instruments)[keep_indices]
+    del all_features
+    if spill_dir is not None:
+        spill_dir.cleanup()
 
     print("\nAfter balancing:")
     print(f"  Total samples: {len(X)}")
@@ -232,12 +807,25 @@ def preprocess_data(
     print(f"  Feature shape: {X.shape}")
 
     # Normalize features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    with profiler.stage("scale", n_samples=len(X)):
+        scaler = StandardScaler()
+        X_scaled = scaler.fit_transform(X)
 
     # Save preprocessed data
-    np.save(output_path / "X.npy", X_scaled)
-    np.save(output_path / "y.npy", y)
+    with profiler.stage("save", n_samples=len(X)):
+        saved = save_dataset(
+            output_path,
+            X_scaled,
+            y,
+            instruments,
+            dataset_format,
+            X_raw=X,
+            feature_dtype=feature_dtype,
+        )
+    print(
+        f"Saved {saved['format']} dataset: {len(saved['files'])} files, "
+        f"{saved['bytes'] / 1e6:.1f} MB"
+    )
 
     # Save scaler for inference
     # (both pickle and JSON for browser compatibility)
@@ -245,23 +833,8 @@ def preprocess_data(
         pickle.dump(scaler, f)
 
     # Export scaler as JSON for browser/TypeScript use
-    assert scaler.mean_ is not None
-    assert scaler.scale_ is not None
-    scaler_data = {
-        "mean": scaler.mean_.tolist(),
-        "std": scaler.scale_.tolist(),  # sklearn uses scale_ (1/std_dev)
-        "n_features": len(scaler.mean_),
-        "feature_names": [
-            "amplitude",
-            "spectralFlux",
-            "phaseDeviation",
-            "highFrequencyEnergy",
-            "hasPitch",
-        ]
-        * 5,  # Repeated for each of 5 frames
-    }
     with open(output_path / "scaler.json", "w") as f:
-        json.dump(scaler_data, f, indent=2)
+        json.dump(scaler_json(scaler, window_size), f, indent=2)
 
     # Save metadata
     metadata = {
@@ -272,6 +845,26 @@ def preprocess_data(
         "window_size": window_size,
         "features_per_frame": 5,
         "total_frames_per_window": window_size,
+        "negative_mining": "hard" if scorer is not None else "random",
+        "dataset_format": dataset_format,
+        "feature_dtype": (
+            feature_dtype if dataset_format == "compact" else None
+        ),
+        "instruments": INSTRUMENTS,
+        "instrument_counts": {
+            name: int((instruments == index).sum())
+            for index, name in enumerate(INSTRUMENTS)
+            if (instruments == index).any()
+        },
+    }
+    if dedup_info is not None:
+        metadata["dedup"] = dedup_info
+    if query:
+        metadata["query"] = query
+        metadata["files"] = sorted(json_file.name for json_file in json_files)
+    metadata["holdout"] = {
+        "fraction": holdout_fraction,
+        "recordings": holdout,
     }
     with open(output_path / "metadata.json", "w") as f:
         json.dump(metadata, f, indent=2)
@@ -280,6 +873,66 @@ def preprocess_data(
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Preprocess onset detection training data"
+    )
+    parser.add_argument(
+        "--negative-mining",
+        choices=["random", "hard"],
+        default="random",
+        help="How to downsample negatives (default: random)",
+    )
+    parser.add_argument(
+        "--mining-model",
+        help="Exported TF.js bundle to score negatives with "
+        "(default: models/saved/tfjs_model)",
+    )
+    parser.add_argument(
+        "--hard-fraction",
+        type=float,
+        default=0.5,
+        help="Share of kept negatives chosen by previous-model score",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=["off", "report", "drop", "downweight"],
+        default="off",
+        help="Handle near-duplicate recordings (default: off)",
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        help="Similarity at which recordings count as duplicates",
+    )
+    parser.add_argument(
+        "--query",
+        help="Catalog query selecting recordings, e.g. "
+        '"n_onsets >= 50 AND silent_fraction < 0.3" (see catalog.py)',
+    )
+    parser.add_argument(
+        "--dataset-format",
+        choices=["npy", "compact"],
+        default="npy",
+        help="npy files or compressed shards (default: npy)",
+    )
+    parser.add_argument(
+        "--feature-dtype",
+        choices=["float32", "float16"],
+        default="float32",
+        help="Feature storage of the compact format",
+    )
+    parser.add_argument(
+        "--holdout-fraction",
+        type=float,
+        default=0.0,
+        help="Share of recordings kept out of the dataset for held-out "
+        f"event reports, e.g. {REPORT_HOLDOUT_FRACTION} (default: 0, "
+        "every recording is used)",
+    )
+    add_profiling_args(parser)
+    args = parser.parse_args()
+    profiler = profiler_from_args(args)
+
     # Get the directory where this script is located
     script_dir = Path(__file__).parent.resolve()
     training_dir = script_dir.parent
@@ -305,4 +958,23 @@ if __name__ == "__main__":
     print("  Target positive ratio: ≥20%")
     print("=" * 60)
 
-    preprocess_data(str(raw_dir), str(output_dir), window_size)
+    mining_model_dir = args.mining_model or str(
+        training_dir / "models" / "saved" / "tfjs_model"
+    )
+
+    preprocess_data(
+        str(raw_dir),
+        str(output_dir),
+        window_size,
+        profiler=profiler,
+        negative_mining=args.negative_mining,
+        mining_model_dir=mining_model_dir,
+        hard_fraction=args.hard_fraction,
+        dedup=args.dedup,
+        dedup_threshold=args.dedup_threshold,
+        query=args.query,
+        dataset_format=args.dataset_format,
+        feature_dtype=args.feature_dtype,
+        holdout_fraction=args.holdout_fraction,
+    )
+    profiler.finish(args.trace, args.chrome_trace)
@@ -0,0 +1,319 @@
+"""
+Opt-in instrumentation for the onset detection training pipeline.
+
+Each pipeline stage (load, filter, window, balance, scale, save, fit,
+predict, export) is wrapped in ``Profiler.stage``. When the profiler is
+disabled (the default) the wrapper is a no-op, so the scripts behave exactly
+as before unless a trace is requested on the command line.
+
+Measured per stage:
+- wall time and process CPU time
+- peak RSS of the process at the end of the stage (high-water mark)
+- samples/sec when the stage reports how many samples it handled
+
+Outputs:
+- a JSON trace with every stage event plus a per-stage summary
+- optionally a Chrome trace (chrome://tracing or ui.perfetto.dev)
+- optionally a cProfile dump with the top hot functions for chosen stages
+"""
+
+import argparse
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> float:
+    """Return the peak resident set size of this process in MiB."""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+class _StageHandle:
+    """Mutable handle yielded by ``Profiler.stage`` to report sample counts."""
+
+    def __init__(self):
+        self.n_samples = None
+        self.args = {}
+
+    def set_samples(self, n_samples: int) -> None:
+        self.n_samples = int(n_samples)
+
+
+class Profiler:
+    """Collects stage timings for one script run.
+
+    Args:
+        enabled: Record stage events. When False every call is a no-op.
+        profile_stages: Stage names to wrap in cProfile.
+        profile_top: Number of hot functions to print per profiled stage.
+        profile_dir: Directory for ``profile-<stage>.prof`` dumps (optional).
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        profile_stages=None,
+        profile_top: int = 25,
+        profile_dir=None,
+    ):
+        self.profile_stages = set(profile_stages or [])
+        # Asking for a cProfile dump implies tracing the run
+        self.enabled = enabled or bool(self.profile_stages)
+        self.profile_top = profile_top
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self.events = []
+        self.epochs = []
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, n_samples=None):
+        """Measure a pipeline stage.
+
+        Args:
+            name: Stage name (e.g. "load", "fit")
+            n_samples: Number of samples handled, if known up front. Can also
+                be reported from inside the block via ``set_samples``.
+        """
+        handle = _StageHandle()
+        if n_samples is not None:
+            handle.set_samples(n_samples)
+        if not self.enabled:
+            yield handle
+            return
+
+        profiler = None
+        if name in self.profile_stages:
+            profiler = cProfile.Profile()
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield handle
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+
+            event = {
+                "name": name,
+                "start_s": wall_start - self._origin,
+                "wall_s": wall,
+                "cpu_s": cpu,
+                "peak_rss_mb": peak_rss_mb(),
+            }
+            if handle.n_samples is not None:
+                event["n_samples"] = handle.n_samples
+                event["samples_per_s"] = (
+                    handle.n_samples / wall if wall > 0 else None
+                )
+            if handle.args:
+                event["args"] = handle.args
+            self.events.append(event)
+
+            if profiler is not None:
+                self._dump_profile(name, profiler)
+
+    def record_epoch(self, epoch_stats: dict) -> None:
+        """Record per-epoch timings reported by the Keras callback."""
+        if self.enabled:
+            self.epochs.append(epoch_stats)
+
+    def _dump_profile(self, name: str, profiler: cProfile.Profile) -> None:
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(self.profile_top)
+        print(f"\n--- cProfile: stage '{name}' ---")
+        print(stream.getvalue())
+        if self.profile_dir is not None:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            prof_path = self.profile_dir / f"profile-{name}.prof"
+            stats.dump_stats(str(prof_path))
+            print(f"cProfile stats saved to {prof_path}")
+
+    def summary(self) -> dict:
+        """Aggregate events by stage name (stages may run more than once)."""
+        summary = {}
+        for event in self.events:
+            entry = summary.setdefault(
+                event["name"],
+                {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0},
+            )
+            entry["calls"] += 1
+            entry["wall_s"] += event["wall_s"]
+            entry["cpu_s"] += event["cpu_s"]
+            entry["peak_rss_mb"] = max(
+                entry["peak_rss_mb"], event["peak_rss_mb"]
+            )
+            if "n_samples" in event:
+                entry["n_samples"] = (
+                    entry.get("n_samples", 0) + event["n_samples"]
+                )
+        for entry in summary.values():
+            if entry.get("n_samples") and entry["wall_s"] > 0:
+                entry["samples_per_s"] = entry["n_samples"] / entry["wall_s"]
+        return summary
+
+    def print_summary(self) -> None:
+        if not self.enabled or not self.events:
+            return
+        print("\nStage timings:")
+        print(
+            f"  {'stage':<10} {'calls':>5} {'wall s':>9} {'cpu s':>9} "
+            f"{'peak MiB':>9} {'samples/s':>11}"
+        )
+        for name, entry in self.summary().items():
+            rate = entry.get("samples_per_s")
+            rate_str = f"{rate:>11.0f}" if rate else f"{'-':>11}"
+            print(
+                f"  {name:<10} {entry['calls']:>5} {entry['wall_s']:>9.3f} "
+                f"{entry['cpu_s']:>9.3f} {entry['peak_rss_mb']:>9.1f} "
+                f"{rate_str}"
+            )
+
+    def write_json(self, path) -> None:
+        """Write the full trace (events, summary, epochs) as JSON."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        trace = {
+            "script": Path(sys.argv[0]).name,
+            "pid": os.getpid(),
+            "events": self.events,
+            "summary": self.summary(),
+            "epochs": self.epochs,
+        }
+        with open(path, "w") as f:
+            json.dump(trace, f, indent=2)
+        print(f"Profiling trace saved to {path}")
+
+    def write_chrome_trace(self, path) -> None:
+        """Write stage events in Chrome trace format (Perfetto compatible)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pid = os.getpid()
+        trace_events = []
+        for event in self.events:
+            args = {
+                "cpu_s": event["cpu_s"],
+                "peak_rss_mb": event["peak_rss_mb"],
+            }
+            if "n_samples" in event:
+                args["n_samples"] = event["n_samples"]
+            trace_events.append(
+                {
+                    "name": event["name"],
+                    "cat": "stage",
+                    "ph": "X",
+                    "ts": event["start_s"] * 1e6,
+                    "dur": event["wall_s"] * 1e6,
+                    "pid": pid,
+                    "tid": 0,
+                    "args": args,
+                }
+            )
+            trace_events.append(
+                {
+                    "name": "peak_rss_mb",
+                    "ph": "C",
+                    "ts": (event["start_s"] + event["wall_s"]) * 1e6,
+                    "pid": pid,
+                    "args": {"peak_rss_mb": event["peak_rss_mb"]},
+                }
+            )
+        for epoch in self.epochs:
+            trace_events.append(
+                {
+                    "name": f"epoch {epoch['epoch']}",
+                    "cat": "epoch",
+                    "ph": "X",
+                    "ts": epoch["start_s"] * 1e6,
+                    "dur": epoch["wall_s"] * 1e6,
+                    "pid": pid,
+                    "tid": 1,
+                    "args": {
+                        k: v
+                        for k, v in epoch.items()
+                        if k not in ("start_s", "wall_s")
+                    },
+                }
+            )
+        with open(path, "w") as f:
+            json.dump(
+                {"traceEvents": trace_events, "displayTimeUnit": "ms"}, f
+            )
+        print(f"Chrome trace saved to {path}")
+
+    def finish(self, trace_path=None, chrome_trace_path=None) -> None:
+        """Print the summary and write the requested trace files."""
+        self.print_summary()
+        if trace_path:
+            self.write_json(trace_path)
+        if chrome_trace_path:
+            self.write_chrome_trace(chrome_trace_path)
+
+    def elapsed(self) -> float:
+        """Seconds since the profiler was created (trace time origin)."""
+        return time.perf_counter() - self._origin
+
+
+def add_profiling_args(parser: argparse.ArgumentParser) -> None:
+    """Add the shared --trace/--chrome-trace/--profile options."""
+    group = parser.add_argument_group("profiling")
+    group.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write a JSON trace of per-stage wall/CPU time and peak RSS",
+    )
+    group.add_argument(
+        "--chrome-trace",
+        metavar="PATH",
+        help="Also write a Chrome/Perfetto trace file",
+    )
+    group.add_argument(
+        "--profile",
+        metavar="STAGE",
+        action="append",
+        default=[],
+        help="Wrap STAGE in cProfile and print the hot functions "
+        "(repeatable)",
+    )
+    group.add_argument(
+        "--profile-top",
+        type=int,
+        default=25,
+        help="Number of hot functions to print per profiled stage",
+    )
+
+
+def profiler_from_args(args: argparse.Namespace) -> Profiler:
+    """Build a Profiler from parsed ``add_profiling_args`` options."""
+    trace_dir = None
+    if args.trace:
+        trace_dir = Path(args.trace).parent
+    elif args.chrome_trace:
+        trace_dir = Path(args.chrome_trace).parent
+    return Profiler(
+        enabled=bool(args.trace or args.chrome_trace),
+        profile_stages=args.profile,
+        profile_top=args.profile_top,
+        profile_dir=trace_dir,
+    )
@@ -0,0 +1,260 @@
+"""
+Publish an exported TF.js onset model bundle to the app static folder.
+
+A bundle is model.json, its weight shards, config.json and scaler.json
+(or their contents merged into model.json by pack_bundle.py), the
+per-instrument heads of multi-head bundles, plus any precompressed .br/.gz
+siblings.
+Publishing never modifies files the browser may already be loading:
+
+1. The bundle is copied into a staging directory next to the target.
+2. The staged copy is verified: it loads through the NumPy path, the model,
+   scaler and config agree on the input size, and (if a Keras model is
+   given) its predictions match Keras.
+3. The staging directory is renamed to static/models/onset-model/<hash>/,
+   where <hash> is derived from the bundle contents.
+4. static/models/onset-model/manifest.json is atomically replaced to point
+   at the new version.
+
+Version directories are immutable, so they can be served with long-lived
+caching; only the small manifest must be revalidated.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+
+from numpy_model import head_files, load_tfjs_model, read_bundle_metadata
+from pack_bundle import COMPRESSED_SUFFIXES, METADATA_FILES
+
+STATIC_MODELS_DIR = Path(__file__).resolve().parents[3] / "static" / "models"
+BUNDLE_NAME = "onset-model"
+MANIFEST_NAME = "manifest.json"
+
+
+class PublishError(Exception):
+    """Raised when a bundle is incomplete or fails verification."""
+
+
+def bundle_files(tfjs_dir: Path) -> list:
+    """List the files that make up a bundle, failing if any is missing."""
+    model_json_path = tfjs_dir / "model.json"
+    if not model_json_path.exists():
+        raise PublishError(f"model.json not found in {tfjs_dir}")
+    with open(model_json_path, "r") as f:
+        model_json = json.load(f)
+
+    merged = model_json.get("userDefinedMetadata", {})
+    names = ["model.json"]
+    names += [
+        name
+        for name in METADATA_FILES
+        if name.removesuffix(".json") not in merged
+    ]
+    for group in model_json["weightsManifest"]:
+        names.extend(group["paths"])
+    config, _ = read_bundle_metadata(tfjs_dir, model_json)
+    try:
+        names += head_files(tfjs_dir, config)
+    except FileNotFoundError as err:
+        raise PublishError(f"Bundle in {tfjs_dir} is incomplete: {err}")
+
+    missing = [name for name in names if not (tfjs_dir / name).exists()]
+    if missing:
+        raise PublishError(
+            f"Bundle in {tfjs_dir} is incomplete, missing: {missing}"
+        )
+    names += [
+        name + suffix
+        for name in list(names)
+        for suffix in COMPRESSED_SUFFIXES
+        if (tfjs_dir / (name + suffix)).exists()
+    ]
+    return names
+
+
+def bundle_hash(tfjs_dir: Path, names: list) -> dict:
+    """Return {name: sha256} for every bundle file."""
+    return {
+        name: hashlib.sha256((tfjs_dir / name).read_bytes()).hexdigest()
+        for name in sorted(names)
+    }
+
+
+def verify_bundle(bundle_dir: Path, reference_model=None) -> None:
+    """
+    Check that a bundle loads and is self-consistent.
+
+    Args:
+        bundle_dir: Directory containing the bundle
+        reference_model: Optional Keras model whose predictions the bundle
+            must reproduce
+
+    Raises:
+        PublishError: If any check fails
+    """
+    try:
+        model = load_tfjs_model(bundle_dir)
+    except Exception as err:  # noqa: BLE001
+        raise PublishError(f"Bundle does not load: {err}") from err
+
+    n_features = model.n_features
+    if model.scaler_mean is None or len(model.scaler_mean) != n_features:
+        raise PublishError(
+            f"scaler.json does not match the model input size {n_features}"
+        )
+    config_shape = model.config.get("inputShape")
+    if config_shape and int(np.prod(config_shape)) != n_features:
+        raise PublishError(
+            f"config.json inputShape {config_shape} does not match the "
+            f"model input size {n_features}"
+        )
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(256, n_features)).astype(np.float32)
+    probabilities = model.predict(X, scaled=True)
+    if not np.all(np.isfinite(probabilities)) or (
+        probabilities.min() < 0 or probabilities.max() > 1
+    ):
+        raise PublishError("Bundle produces invalid probabilities")
+
+    if reference_model is not None:
+        expected = reference_model.predict(X, verbose=0).reshape(-1)
+        max_diff = float(np.abs(expected - probabilities).max())
+        if max_diff > 1e-4:
+            raise PublishError(
+                f"Bundle predictions differ from Keras by {max_diff:.2e}"
+            )
+        print(f"Verified bundle against Keras (max diff {max_diff:.2e})")
+    else:
+        print("Verified bundle with the NumPy loader")
+
+
+def _write_manifest(manifest_path: Path, manifest: dict) -> None:
+    tmp_path = manifest_path.with_name(f".{manifest_path.name}.{os.getpid()}")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, manifest_path)
+
+
+def _prune_versions(root: Path, current: str, keep: int) -> None:
+    """Remove old version directories, keeping the newest ``keep``."""
+    versions = sorted(
+        (
+            p
+            for p in root.iterdir()
+            if p.is_dir() and not p.name.startswith(".") and p.name != current
+        ),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for old in versions[keep:]:
+        shutil.rmtree(old)
+        print(f"Removed old model version {old.name}")
+
+
+def publish_bundle(
+    tfjs_dir,
+    static_models_dir=STATIC_MODELS_DIR,
+    reference_model=None,
+    keep_versions: int = 3,
+) -> Path:
+    """
+    Publish a TF.js bundle as an immutable, content-addressed version.
+
+    Args:
+        tfjs_dir: Exported bundle (model.json, shards, config.json,
+            scaler.json)
+        static_models_dir: The app's static/models directory
+        reference_model: Optional Keras model to verify predictions against
+        keep_versions: Old versions to keep besides the current one
+
+    Returns:
+        Path of the published version directory
+    """
+    tfjs_dir = Path(tfjs_dir)
+    root = Path(static_models_dir) / BUNDLE_NAME
+    root.mkdir(parents=True, exist_ok=True)
+
+    names = bundle_files(tfjs_dir)
+    hashes = bundle_hash(tfjs_dir, names)
+    version = hashlib.sha256(
+        json.dumps(hashes, sort_keys=True).encode()
+    ).hexdigest()[:16]
+    version_dir = root / version
+
+    if version_dir.exists():
+        print(f"Model version {version} already published, re-verifying")
+        verify_bundle(version_dir, reference_model)
+    else:
+        staging_dir = root / f".staging-{version}-{os.getpid()}"
+        if staging_dir.exists():
+            shutil.rmtree(staging_dir)
+        staging_dir.mkdir()
+        try:
+            for name in names:
+                (staging_dir / name).parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(tfjs_dir / name, staging_dir / name)
+            if bundle_hash(staging_dir, names) != hashes:
+                raise PublishError("Bundle changed while it was being copied")
+            verify_bundle(staging_dir, reference_model)
+            os.rename(staging_dir, version_dir)
+        except BaseException:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+    with open(version_dir / "model.json", "r") as f:
+        config, _ = read_bundle_metadata(version_dir, json.load(f))
+    manifest = {
+        "current": version,
+        "files": hashes,
+        "inputShape": config.get("inputShape"),
+        "published": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    _write_manifest(root / MANIFEST_NAME, manifest)
+    print(f"Published model version {version} -> {version_dir}")
+
+    if keep_versions is not None:
+        _prune_versions(root, version, keep_versions)
+    return version_dir
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Publish a TF.js onset model bundle to static/models"
+    )
+    parser.add_argument(
+        "tfjs_dir",
+        nargs="?",
+        default=str(training_dir / "models" / "saved" / "tfjs_model"),
+    )
+    parser.add_argument("--static-dir", default=str(STATIC_MODELS_DIR))
+    parser.add_argument(
+        "--keras-model",
+        help="Also verify predictions against this Keras model",
+    )
+    parser.add_argument("--keep", type=int, default=3)
+    args = parser.parse_args()
+
+    reference_model = None
+    if args.keras_model:
+        from tensorflow import keras  # type: ignore
+
+        reference_model = keras.models.load_model(args.keras_model)
+
+    publish_bundle(
+        args.tfjs_dir,
+        args.static_dir,
+        reference_model=reference_model,
+        keep_versions=args.keep,
+    )
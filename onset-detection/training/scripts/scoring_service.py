@@ -0,0 +1,493 @@
+"""
+Long-running local scoring service for recorded practice sessions.
+
+Loads an exported TF.js bundle once through the NumPy loader (no
+TensorFlow) and scores frame arrays for callers in the same process or
+over HTTP on localhost or a Unix socket. Concurrent requests are coalesced
+into micro-batches: a batch is scored when ``max_batch_rows`` windows are
+queued, or ``max_latency_ms`` after its first request arrived, whichever
+comes first, so one forward pass serves many sessions.
+
+HTTP API:
+
+    POST /score   {"frames": [...], "instrument": "violin"}
+                  -> {"probabilities": [...], "threshold": t,
+                      "onsets": [...], "head": ...}
+    GET  /health  -> model info and batching statistics
+
+``frames`` holds one entry per analysis frame, either an
+[amplitude, spectralFlux, phaseDeviation, highFrequencyEnergy, hasPitch]
+row or a frame object in the recording format. ``probabilities[i]`` is the
+onset probability of frame i; the first window_size - 1 frames have no
+full history and are null. Windows go through the cascade gate first
+when the bundle has one (gated-out frames score 0), and ``onsets`` are
+decided by the bundle's tuned post-processing, exactly as in the app
+(postprocess.detect_onsets). ``instrument`` selects the head of
+multi-head bundles and is ignored otherwise.
+
+Unlike preprocessing, silent frames are not filtered out: every frame is
+scored, as in the app.
+"""
+
+import argparse
+import http.client
+import json
+import queue
+import socket
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+import numpy as np
+
+from cascade import cascade_predict
+from numpy_model import load_tfjs_model
+from postprocess import active_postprocessing, detect_onsets
+from preprocess import FEATURE_NAMES, input_spec
+
+
+def frame_matrix(frames: list) -> np.ndarray:
+    """
+    Per-frame features as a (n_frames, 5) float32 array.
+
+    hasPitch is encoded as in preprocess.extract_features (2.0 / 0.0).
+
+    Raises:
+        ValueError: If frames are not rows of 5 features or frame objects
+    """
+    if frames and isinstance(frames[0], dict):
+        frames = [[frame[name] for name in FEATURE_NAMES] for frame in frames]
+    matrix = np.asarray(frames, dtype=np.float32)
+    if len(matrix) == 0:
+        return matrix.reshape(0, len(FEATURE_NAMES))
+    if matrix.ndim != 2 or matrix.shape[1] != len(FEATURE_NAMES):
+        raise ValueError(
+            f"frames must be rows of {len(FEATURE_NAMES)} features "
+            f"({', '.join(FEATURE_NAMES)}), got shape {matrix.shape}"
+        )
+    matrix[:, 4] = np.where(matrix[:, 4] > 0, 2.0, 0.0)
+    return matrix
+
+
+def window_frames(matrix: np.ndarray, window_size: int = 5) -> np.ndarray:
+    """
+    Causal windows [t-4 .. t] for every frame with full history.
+
+    Same layout as preprocess.extract_features: oldest frame first, the 5
+    features of each frame together.
+    """
+    n_features = window_size * matrix.shape[1]
+    if len(matrix) < window_size:
+        return np.empty((0, n_features), dtype=np.float32)
+    windows = np.lib.stride_tricks.sliding_window_view(
+        matrix, window_size, axis=0
+    )
+    # (n_windows, features, window) -> (n_windows, window * features)
+    return windows.transpose(0, 2, 1).reshape(-1, n_features)
+
+
+class _Request:
+    __slots__ = ("windows", "head", "future", "arrival")
+
+    def __init__(self, windows: np.ndarray, head):
+        self.windows = windows
+        self.head = head
+        self.future = Future()
+        self.arrival = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent scoring requests into batched forward passes.
+
+    A single worker thread owns the model. It takes the oldest request,
+    then keeps collecting until ``max_batch_rows`` windows are queued or
+    the request has waited ``max_latency_ms``, and scores the batch with
+    one call per head.
+
+    Args:
+        predict: Function (head, windows) -> probabilities
+        max_batch_rows: Windows per forward pass before flushing early
+        max_latency_ms: Longest a request waits for others to join
+    """
+
+    def __init__(
+        self,
+        predict,
+        max_batch_rows: int = 16384,
+        max_latency_ms: float = 5.0,
+    ):
+        self._predict = predict
+        self.max_batch_rows = max_batch_rows
+        self.max_latency = max_latency_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "batches": 0, "rows": 0}
+        self._thread = threading.Thread(
+            target=self._run, name="scoring-batcher", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, windows: np.ndarray, head=None) -> Future:
+        """Queue windows for scoring; the future resolves to probabilities."""
+        request = _Request(windows, head)
+        self._queue.put(request)
+        return request.future
+
+    def close(self) -> None:
+        """Score what is queued, then stop the worker."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["mean_batch_rows"] = (
+            stats["rows"] / stats["batches"] if stats["batches"] else 0.0
+        )
+        stats["mean_batch_requests"] = (
+            stats["requests"] / stats["batches"] if stats["batches"] else 0.0
+        )
+        return stats
+
+    def _collect(self, first: _Request) -> tuple:
+        """Batch up requests behind ``first``; returns (batch, closing)."""
+        batch = [first]
+        rows = len(first.windows)
+        deadline = first.arrival + self.max_latency
+        while rows < self.max_batch_rows:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    request = self._queue.get(timeout=timeout)
+                else:
+                    # Past the deadline: take only what is already queued
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+            rows += len(request.windows)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, closing = self._collect(first)
+            self._score(batch)
+            if closing:
+                return
+
+    def _score(self, batch: list) -> None:
+        by_head = {}
+        for request in batch:
+            by_head.setdefault(request.head, []).append(request)
+
+        for head, requests in by_head.items():
+            try:
+                X = np.concatenate([request.windows for request in requests])
+                probabilities = self._predict(head, X)
+            except Exception as err:  # noqa: BLE001
+                for request in requests:
+                    request.future.set_exception(err)
+                continue
+            splits = np.cumsum([len(request.windows) for request in requests])
+            for request, part in zip(
+                requests, np.split(probabilities, splits[:-1])
+            ):
+                request.future.set_result(part)
+
+        with self._lock:
+            self.stats["requests"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["rows"] += sum(
+                len(request.windows) for request in batch
+            )
+
+
+class ScoringService:
+    """
+    Score frame arrays with one exported model, loaded once.
+
+    Args:
+        model_dir: Exported TF.js bundle
+        max_batch_rows: Windows per forward pass before flushing early
+        max_latency_ms: Longest a request waits for others to join its
+            batch
+    """
+
+    def __init__(
+        self,
+        model_dir,
+        max_batch_rows: int = 16384,
+        max_latency_ms: float = 5.0,
+    ):
+        self.model_dir = Path(model_dir)
+        start = time.perf_counter()
+        model = load_tfjs_model(self.model_dir)
+        self.load_seconds = time.perf_counter() - start
+        self.config = model.config
+        self.heads = self.config.get("heads")
+        self.window_size = (self.config.get("inputs") or input_spec())[
+            "windowSize"
+        ]
+        # Loaded heads of multi-head bundles (key None otherwise); only the
+        # batcher thread touches this
+        self._models = {self.config.get("head"): model}
+        self.batcher = MicroBatcher(
+            self._predict, max_batch_rows, max_latency_ms
+        )
+
+    def _head(self, instrument: str | None):
+        if not self.heads:
+            return None
+        if instrument in self.heads["names"]:
+            return instrument
+        return self.heads["default"]
+
+    def _predict(self, head, X: np.ndarray) -> np.ndarray:
+        model = self._models.get(head)
+        if model is None:
+            model = load_tfjs_model(self.model_dir, instrument=head)
+            self._models[head] = model
+        return cascade_predict(model, X)[0]
+
+    def threshold(self, head=None) -> float:
+        return active_postprocessing(self.config, head)[0]
+
+    def score(
+        self,
+        frames: list,
+        instrument: str | None = None,
+        timeout: float | None = None,
+    ) -> dict:
+        """
+        Score one session (blocks until its micro-batch has run).
+
+        Args:
+            frames: Per-frame feature rows or frame objects
+            instrument: Head to use for multi-head bundles
+            timeout: Seconds to wait for the result
+
+        Returns:
+            {"probabilities", "threshold", "onsets", "head"}
+        """
+        windows = window_frames(frame_matrix(frames), self.window_size)
+        head = self._head(instrument)
+        probabilities = self.batcher.submit(windows, head).result(timeout)
+        threshold, postprocessing = active_postprocessing(self.config, head)
+        onsets = detect_onsets(probabilities, threshold, postprocessing)
+        offset = self.window_size - 1
+        padding = [None] * min(offset, len(frames))
+        return {
+            "probabilities": padding + probabilities.tolist(),
+            "threshold": threshold,
+            "onsets": (onsets + offset).astype(int).tolist(),
+            "head": head,
+        }
+
+    def health(self) -> dict:
+        return {
+            "model_dir": str(self.model_dir),
+            "version": self.config.get("version"),
+            "window_size": self.window_size,
+            "heads": self.heads["names"] if self.heads else None,
+            "load_seconds": self.load_seconds,
+            "batching": {
+                "max_batch_rows": self.batcher.max_batch_rows,
+                "max_latency_ms": self.batcher.max_latency * 1000,
+                **self.batcher.snapshot(),
+            },
+        }
+
+    def close(self) -> None:
+        self.batcher.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive for repeated requests
+
+    def _send(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send(404, {"error": f"no such endpoint: {self.path}"})
+            return
+        self._send(200, self.server.service.health())
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.path != "/score":
+            self._send(404, {"error": f"no such endpoint: {self.path}"})
+            return
+        try:
+            request = json.loads(body)
+            result = self.server.service.score(
+                request["frames"], request.get("instrument")
+            )
+        except (KeyError, TypeError, ValueError) as err:
+            self._send(400, {"error": f"bad request: {err}"})
+            return
+        except Exception as err:  # noqa: BLE001
+            self._send(500, {"error": f"internal error: {err}"})
+            return
+        self._send(200, result)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Many workers may connect at once; the socketserver default is 5
+    request_queue_size = 128
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler logs client_address[0]
+        return request, ("unix", 0)
+
+
+def make_server(
+    service: ScoringService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: str | None = None,
+    verbose: bool = False,
+):
+    """HTTP server for the service on host:port or a Unix socket path."""
+    if unix_socket:
+        Path(unix_socket).unlink(missing_ok=True)
+        server = _UnixHTTPServer(unix_socket, _Handler)
+    else:
+        server = _HTTPServer((host, port), _Handler)
+    server.service = service
+    server.verbose = verbose
+    return server
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class ScoringClient:
+    """
+    Keep-alive client for a running service (one per thread).
+
+    Args:
+        host: Service host (ignored with unix_socket)
+        port: Service port
+        unix_socket: Path of the service's Unix socket
+        timeout: Socket timeout in seconds
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        unix_socket: str | None = None,
+        timeout: float = 60.0,
+    ):
+        if unix_socket:
+            self.connection = _UnixHTTPConnection(unix_socket, timeout)
+        else:
+            self.connection = http.client.HTTPConnection(
+                host, port, timeout=timeout
+            )
+
+    def _request(self, method: str, path: str, body: bytes | None = None):
+        headers = {"Content-Type": "application/json"} if body else {}
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        payload = json.loads(response.read())
+        if response.status != 200:
+            raise RuntimeError(payload.get("error", response.reason))
+        return payload
+
+    def score(self, frames, instrument: str | None = None) -> dict:
+        if isinstance(frames, np.ndarray):
+            frames = frames.tolist()
+        body = {"frames": frames}
+        if instrument is not None:
+            body["instrument"] = instrument
+        return self.score_body(json.dumps(body).encode())
+
+    def score_body(self, body: bytes) -> dict:
+        """Send an already encoded /score request body."""
+        return self._request("POST", "/score", body)
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    script_dir = Path(__file__).parent.resolve()
+    training_dir = script_dir.parent
+
+    parser = argparse.ArgumentParser(
+        description="Serve onset probabilities for frame arrays"
+    )
+    parser.add_argument(
+        "--model-dir",
+        default=str(training_dir / "models" / "saved" / "tfjs_model"),
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--unix-socket", help="Listen on this socket path instead of TCP"
+    )
+    parser.add_argument("--max-batch-rows", type=int, default=16384)
+    parser.add_argument("--max-latency-ms", type=float, default=5.0)
+    parser.add_argument(
+        "--verbose", action="store_true", help="Log every request"
+    )
+    args = parser.parse_args()
+
+    service = ScoringService(
+        args.model_dir, args.max_batch_rows, args.max_latency_ms
+    )
+    server = make_server(
+        service, args.host, args.port, args.unix_socket, args.verbose
+    )
+    address = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(
+        f"Scoring with {args.model_dir} (loaded in "
+        f"{service.load_seconds * 1000:.0f} ms) on {address}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if args.unix_socket:
+            Path(args.unix_socket).unlink(missing_ok=True)
@@ -64,9 +64,9 @@ simplified_topology = {
 
 model["modelTopology"] = simplified_topology
 
-# Save simplified model
+# Save simplified model (minified; see pack_bundle.py for precompression)
 with open(model_path, "w") as f:
-    json.dump(model, f, indent=2)
+    json.dump(model, f, separators=(",", ":"))
 
 print(f"Simplified model saved to {model_path}")
 print(
@@ -2,24 +2,157 @@
 Train the onset detection neural network.
 """
 
+import argparse
 import json
+import os
+import time
 import numpy as np
-import shutil
 from pathlib import Path
 from sklearn.model_selection import train_test_split
 from sklearn.utils.class_weight import compute_class_weight
+import tensorflow as tf  # type: ignore
 from tensorflow import keras  # type: ignore
 from tensorflow.keras import layers, models, callbacks  # type: ignore
 import matplotlib.pyplot as plt
 
+from dataset import load_dataset
+from profiling import Profiler, add_profiling_args, profiler_from_args
+from pack_bundle import pack_bundle, print_report
+from preprocess import holdout_recordings, input_spec, select_scaler
+from publish_model import publish_bundle
 
-def create_model(input_shape: tuple, learning_rate: float = 0.001):
+
+class EpochTimingCallback(callbacks.Callback):
+    """
+    Log per-epoch step time and input-pipeline wait.
+
+    Step time is measured between on_train_batch_begin/end. The wait is the
+    gap between one batch ending and the next starting, which is where Keras
+    fetches the next batch from the input pipeline.
+    """
+
+    def __init__(self, profiler: Profiler):
+        super().__init__()
+        self.profiler = profiler
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = time.perf_counter()
+        self._epoch_start_s = self.profiler.elapsed()
+        self._batch_start = None
+        self._last_batch_end = None
+        self._step_time = 0.0
+        self._wait_time = 0.0
+        self._steps = 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._batch_start = time.perf_counter()
+        if self._last_batch_end is not None:
+            self._wait_time += self._batch_start - self._last_batch_end
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._last_batch_end = time.perf_counter()
+        if self._batch_start is not None:
+            self._step_time += self._last_batch_end - self._batch_start
+            self._steps += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        wall = time.perf_counter() - self._epoch_start
+        steps = max(1, self._steps)
+        epoch_stats = {
+            "epoch": epoch + 1,
+            "start_s": self._epoch_start_s,
+            "wall_s": wall,
+            "steps": self._steps,
+            "mean_step_ms": 1000 * self._step_time / steps,
+            "input_wait_ms": 1000 * self._wait_time / steps,
+            "input_wait_fraction": self._wait_time / wall if wall else 0.0,
+        }
+        self.profiler.record_epoch(epoch_stats)
+        print(
+            f"  [timing] epoch {epoch + 1}: {wall:.2f}s, "
+            f"{epoch_stats['mean_step_ms']:.2f} ms/step, "
+            f"input wait {epoch_stats['input_wait_ms']:.2f} ms/step"
+        )
+
+
+# CPU performance mode (--cpu-mode). The MLP is tiny, so on CPU each epoch
+# is dominated by per-step dispatch overhead rather than arithmetic: fewer,
+# larger steps are much faster, and XLA fuses the small ops of each step.
+# XLA is on by default in CPU mode; --no-xla turns it off for TensorFlow
+# builds where it is slower (compare_cpu_mode.py --no-xla measures both).
+BASE_BATCH_SIZE = 256
+CPU_MODE_BATCH_SIZE = 4096
+CPU_MODE_STEPS_PER_EXECUTION = 16
+CPU_MODE_WARMUP_EPOCHS = 5
+
+
+class LearningRateWarmup(callbacks.Callback):
+    """
+    Linearly ramp the learning rate up to its target over the first epochs.
+
+    Large batches need a larger learning rate, but starting at it from a
+    random init is unstable. Implemented as a callback (not a
+    LearningRateSchedule) so ReduceLROnPlateau can still adjust the rate
+    after warmup.
+    """
+
+    def __init__(self, target_lr: float, warmup_epochs: int):
+        super().__init__()
+        self.target_lr = target_lr
+        self.warmup_epochs = warmup_epochs
+
+    def on_epoch_begin(self, epoch, logs=None):
+        if epoch < self.warmup_epochs:
+            lr = self.target_lr * (epoch + 1) / self.warmup_epochs
+            self.model.optimizer.learning_rate.assign(lr)
+
+
+def configure_cpu_threads(
+    intra_op_threads: int | None = None, inter_op_threads: int | None = None
+) -> None:
+    """
+    Set explicit TensorFlow thread-pool sizes.
+
+    Must run before TensorFlow executes its first op; afterwards the pools
+    are fixed for the life of the process and a warning is printed.
+
+    Args:
+        intra_op_threads: Threads used inside one op (default: all cores)
+        inter_op_threads: Ops run concurrently (default: 2, the MLP graph is
+            a straight chain)
+    """
+    intra = intra_op_threads or os.cpu_count() or 1
+    inter = inter_op_threads or 2
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra)
+        tf.config.threading.set_inter_op_parallelism_threads(inter)
+        print(f"TensorFlow threads: intra-op {intra}, inter-op {inter}")
+    except RuntimeError as err:
+        print(f"Warning: could not set TensorFlow thread pools: {err}")
+
+
+def scaled_learning_rate(
+    batch_size: int, base_lr: float = 0.001, base_batch: int = BASE_BATCH_SIZE
+) -> float:
+    """Square-root learning-rate scaling for Adam with larger batches."""
+    return base_lr * (batch_size / base_batch) ** 0.5
+
+
+def create_model(
+    input_shape: tuple,
+    learning_rate: float = 0.001,
+    jit_compile="auto",
+    steps_per_execution: int = 1,
+):
     """
     Create the onset detection neural network.
 
     Args:
         input_shape: Shape of input features (n_features,)
         learning_rate: Learning rate for optimizer
+        jit_compile: Compile train/predict steps with XLA. Keras' "auto"
+            disables XLA on CPU-only machines.
+        steps_per_execution: Batches run per compiled call
 
     Returns:
         Compiled Keras model
@@ -47,18 +180,20 @@ def create_model(input_shape: tuple, learning_rate: float = 0.001):
             keras.metrics.Recall(name="recall"),
             keras.metrics.AUC(name="auc"),
         ],
+        jit_compile=jit_compile,
+        steps_per_execution=steps_per_execution,
     )
 
     return model
 
 
-def plot_training_history(history, output_dir: Path):
-    """Plot and save training history."""
+def plot_training_history(history: dict, output_dir: Path):
+    """Plot and save training history (a Keras History.history dict)."""
     fig, axes = plt.subplots(2, 2, figsize=(12, 10))
 
     # Loss
-    axes[0, 0].plot(history.history["loss"], label="Training")
-    axes[0, 0].plot(history.history["val_loss"], label="Validation")
+    axes[0, 0].plot(history["loss"], label="Training")
+    axes[0, 0].plot(history["val_loss"], label="Validation")
     axes[0, 0].set_title("Loss")
     axes[0, 0].set_xlabel("Epoch")
     axes[0, 0].set_ylabel("Loss")
@@ -66,8 +201,8 @@ def plot_training_history(history, output_dir: Path):
     axes[0, 0].grid(True)
 
     # Accuracy
-    axes[0, 1].plot(history.history["accuracy"], label="Training")
-    axes[0, 1].plot(history.history["val_accuracy"], label="Validation")
+    axes[0, 1].plot(history["accuracy"], label="Training")
+    axes[0, 1].plot(history["val_accuracy"], label="Validation")
     axes[0, 1].set_title("Accuracy")
     axes[0, 1].set_xlabel("Epoch")
     axes[0, 1].set_ylabel("Accuracy")
@@ -75,8 +210,8 @@ def plot_training_history(history, output_dir: Path):
     axes[0, 1].grid(True)
 
     # Precision
-    axes[1, 0].plot(history.history["precision"], label="Training")
-    axes[1, 0].plot(history.history["val_precision"], label="Validation")
+    axes[1, 0].plot(history["precision"], label="Training")
+    axes[1, 0].plot(history["val_precision"], label="Validation")
     axes[1, 0].set_title("Precision")
     axes[1, 0].set_xlabel("Epoch")
     axes[1, 0].set_ylabel("Precision")
@@ -84,8 +219,8 @@ def plot_training_history(history, output_dir: Path):
     axes[1, 0].grid(True)
 
     # Recall
-    axes[1, 1].plot(history.history["recall"], label="Training")
-    axes[1, 1].plot(history.history["val_recall"], label="Validation")
+    axes[1, 1].plot(history["recall"], label="Training")
+    axes[1, 1].plot(history["val_recall"], label="Validation")
     axes[1, 1].set_title("Recall")
     axes[1, 1].set_xlabel("Epoch")
     axes[1, 1].set_ylabel("Recall")
@@ -122,30 +257,27 @@ def _fix_tfjs_input_layer(tfjs_model_json: Path, input_shape) -> None:
             json.dump(data, f, separators=(",", ":"))
 
 
-def _copy_to_static(tfjs_dir: Path) -> None:
-    """Copy exported tfjs model into the app static path."""
-    repo_root = Path(__file__).resolve().parents[3]
-    static_dir = repo_root / "static" / "models" / "onset-model-v1"
-    static_dir.mkdir(parents=True, exist_ok=True)
-    # Copy files individually to avoid stale leftovers
-    for fname in [
-        "model.json",
-        "group1-shard1of1.bin",
-        "config.json",
-        "scaler.json",
-    ]:
-        src = tfjs_dir / fname
-        if src.exists():
-            shutil.copy2(src, static_dir / fname)
-            print(f"Copied {fname} -> {static_dir}")
-        elif fname == "scaler.json":
-            print(f"Warning: {fname} not found in {tfjs_dir}")
-
-
 def export_tfjs_model(
-    model, output_dir: Path, input_shape, X_val=None, y_val=None
+    model,
+    output_dir: Path,
+    input_shape,
+    X_val=None,
+    y_val=None,
+    profiler: Profiler | None = None,
+    scaler_src: Path | None = None,
+    publish: bool = True,
+    merge_metadata: bool = False,
+    inputs: dict | None = None,
+    gate: dict | None = None,
 ):
-    """Export model to TensorFlow.js format with proper configuration."""
+    """Export model to TensorFlow.js format with proper configuration.
+
+    ``inputs`` (see preprocess.input_spec) records which window columns the
+    model consumes; config.json and scaler.json are written for just those.
+    ``gate`` (see cascade.py) is written to config.json as the first stage.
+    """
+    inputs = inputs or input_spec()
+    profiler = profiler or Profiler()
 
     tfjs_path = output_dir / "tfjs_model"
     tfjs_path.mkdir(parents=True, exist_ok=True)
@@ -153,7 +285,8 @@ def export_tfjs_model(
     print("\nConverting model to TensorFlow.js format...")
 
     # Create TFJS-compatible model from Keras
-    _create_tfjs_from_keras(model, tfjs_path, input_shape)
+    with profiler.stage("export"):
+        _create_tfjs_from_keras(model, tfjs_path, input_shape)
 
     # Calculate optimal threshold if validation data provided
     optimal_threshold = 0.5  # Default
@@ -161,7 +294,8 @@ def export_tfjs_model(
         from sklearn.metrics import roc_curve
 
         print("Calculating optimal threshold from validation data...")
-        y_pred = model.predict(X_val, verbose=0)
+        with profiler.stage("predict", n_samples=len(X_val)):
+            y_pred = model.predict(X_val, verbose=0)
         fpr, tpr, thresholds = roc_curve(y_val, y_pred)
         # Find threshold that maximizes TPR - FPR
         optimal_idx = np.argmax(tpr - fpr)
@@ -177,7 +311,10 @@ def export_tfjs_model(
         "optimalThreshold": optimal_threshold,
         "version": "2.0.0",
         "created": datetime.utcnow().strftime("%Y-%m-%d"),
+        "inputs": inputs,
     }
+    if gate is not None:
+        model_config["gate"] = gate
 
     with open(tfjs_path / "config.json", "w") as f:
         json.dump(model_config, f, indent=2)
@@ -186,19 +323,26 @@ def export_tfjs_model(
     _fix_tfjs_input_layer(tfjs_path / "model.json", input_shape)
 
     # Copy scaler from processed data directory to tfjs model directory
-    from pathlib import Path
-
-    training_dir = Path(__file__).parent.parent
-    scaler_src = training_dir / "data" / "processed" / "scaler.json"
+    if scaler_src is None:
+        training_dir = Path(__file__).parent.parent
+        scaler_src = training_dir / "data" / "processed" / "scaler.json"
     if scaler_src.exists():
         scaler_dst = tfjs_path / "scaler.json"
-        shutil.copy2(scaler_src, scaler_dst)
-        print(f"Copied scaler.json to {scaler_dst}")
+        with open(scaler_src, "r") as f:
+            scaler_data = select_scaler(json.load(f), inputs)
+        with open(scaler_dst, "w") as f:
+            json.dump(scaler_data, f, indent=2)
+        print(f"Wrote scaler.json for {len(inputs['columns'])} inputs")
     else:
         print(f"Warning: scaler.json not found at {scaler_src}")
 
-    # Copy into app static folder for immediate use
-    _copy_to_static(tfjs_path)
+    # Minify and precompress for the browser
+    with profiler.stage("pack"):
+        print_report(pack_bundle(tfjs_path, merge_metadata=merge_metadata))
+
+    # Publish to the app static folder for immediate use
+    if publish:
+        publish_bundle(tfjs_path, reference_model=model)
 
     print(f"TensorFlow.js model saved to {tfjs_path}")
 
@@ -333,7 +477,26 @@ def _create_tfjs_from_keras(model, tfjs_path: Path, input_shape):
 
 
 def train_model(
-    data_dir: str, output_dir: str, epochs: int = 100, batch_size: int = 256
+    data_dir: str,
+    output_dir: str,
+    epochs: int = 100,
+    batch_size: int = 256,
+    profiler: Profiler | None = None,
+    publish: bool = True,
+    plot_history: bool = True,
+    cpu_mode: bool = False,
+    intra_op_threads: int | None = None,
+    inter_op_threads: int | None = None,
+    warmup_epochs: int = CPU_MODE_WARMUP_EPOCHS,
+    xla: bool | None = None,
+    merge_metadata: bool = False,
+    features: list | None = None,
+    lags: list | None = None,
+    multi_head: bool = False,
+    min_head_windows: int | None = None,
+    raw_dir: str | None = None,
+    cascade: bool = False,
+    gate_recall: float | None = None,
 ):
     """
     Train the onset detection model.
@@ -343,25 +506,97 @@ def train_model(
         output_dir: Directory to save trained model
         epochs: Number of training epochs
         batch_size: Batch size for training
+        profiler: Optional profiler timing load/fit/predict/export and
+            logging per-epoch step time
+        publish: Publish the TF.js bundle to the app static folder
+        plot_history: Plot training_history.png (history.json is always
+            saved, so plotting can also be done separately)
+        cpu_mode: Train with explicit thread pools, several steps per call
+            and a square-root scaled learning rate with warmup (use a large
+            batch_size, e.g. CPU_MODE_BATCH_SIZE)
+        intra_op_threads: Intra-op thread pool size in cpu_mode
+        inter_op_threads: Inter-op thread pool size in cpu_mode
+        warmup_epochs: Learning-rate warmup epochs in cpu_mode
+        xla: Compile the train/predict steps with XLA (jit_compile).
+            None: on in cpu_mode, Keras' "auto" otherwise
+        merge_metadata: Merge config.json and scaler.json into the exported
+            model.json (see pack_bundle.py)
+        features: Train on these per-frame features only (default: all)
+        lags: Train on these frame lags only, 0 = current frame (default:
+            all)
+        multi_head: Train a shared trunk with one head per instrument
+            (see multi_head.py)
+        min_head_windows: Training windows an instrument needs for its own
+            head in multi_head mode
+        raw_dir: Raw recordings for the per-instrument event metrics in
+            multi_head mode and the cascade gate (default: data_dir/../raw)
+        cascade: Export a linear first-stage gate so the client skips the
+            MLP on frames that are clearly not onsets (see cascade.py)
+        gate_recall: Share of onsets the gate must keep (default:
+            cascade.TARGET_RECALL)
     """
+    profiler = profiler or Profiler()
+    if cpu_mode:
+        # Before any TensorFlow op runs
+        configure_cpu_threads(intra_op_threads, inter_op_threads)
+
     data_path = Path(data_dir)
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
+    raw_path = Path(raw_dir) if raw_dir else data_path.parent / "raw"
 
     # Load preprocessed data
     print("Loading preprocessed data...")
-    X = np.load(data_path / "X.npy")
-    y = np.load(data_path / "y.npy")
+    with profiler.stage("load") as stage:
+        if multi_head:
+            X, y, instruments = load_dataset(data_path, with_instruments=True)
+        else:
+            X, y = load_dataset(data_path)
+        stage.set_samples(len(X))
 
     with open(data_path / "metadata.json", "r") as f:
         metadata = json.load(f)
 
     print(f"Loaded {len(X)} samples with {X.shape[1]} features")
+    # Recordings preprocess.py kept out of the dataset, for the reports
+    holdout = holdout_recordings(data_path)
     print(f"Onset ratio: {metadata['onset_ratio']:.4f}")
 
-    # Split data
-    X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
+    gate = None
+    if cascade:
+        # The gate reads the current frame, whatever inputs the MLP keeps
+        from cascade import TARGET_RECALL, fit_gate, gate_columns
+
+        columns = gate_columns(metadata["window_size"])
+        with open(data_path / "scaler.json", "r") as f:
+            scaler_data = json.load(f)
+        with profiler.stage("gate", n_samples=len(X)):
+            gate = fit_gate(
+                X[:, columns],
+                y,
+                np.asarray(scaler_data["mean"])[columns],
+                np.asarray(scaler_data["std"])[columns],
+                raw_path,
+                metadata["window_size"],
+                gate_recall or TARGET_RECALL,
+                holdout,
+            )
+        print(
+            f"Cascade gate keeps {gate['onsetRecall']:.2%} of onsets and "
+            f"passes {gate['passRate']:.1%} of frames"
+        )
+
+    inputs = input_spec(metadata["window_size"], features, lags)
+    if len(inputs["columns"]) != X.shape[1]:
+        X = X[:, inputs["columns"]]
+        print(
+            f"Training on {X.shape[1]} inputs: features {inputs['features']}, "
+            f"lags {inputs['lags']}"
+        )
+
+    # Split data (indices recover each window's instrument)
+    X_train, X_val, y_train, y_val, idx_train, idx_val = train_test_split(
+        X, y, np.arange(len(X)), test_size=0.2, random_state=42, stratify=y
     )
 
     print(f"Training samples: {len(X_train)}")
@@ -376,7 +611,60 @@ def train_model(
 
     # Create model
     print("\nCreating model...")
-    model = create_model(input_shape=(X.shape[1],))
+    learning_rate = 0.001
+    jit_compile = "auto" if xla is None else xla
+    steps_per_execution = 1
+    if cpu_mode:
+        learning_rate = scaled_learning_rate(batch_size)
+        jit_compile = True if xla is None else xla
+        steps_per_execution = CPU_MODE_STEPS_PER_EXECUTION
+        print(
+            f"CPU mode: batch {batch_size}, "
+            f"{CPU_MODE_STEPS_PER_EXECUTION} steps/execution, "
+            f"lr {learning_rate:.5f} after {warmup_epochs} warmup epochs, "
+            f"XLA {'on' if jit_compile else 'off'}"
+        )
+    if multi_head:
+        # Local import: multi_head imports the export helpers from here
+        from multi_head import MIN_HEAD_WINDOWS, MultiHeadModel, head_layout
+
+        head_names = head_layout(
+            instruments[idx_train],
+            metadata["instruments"],
+            min_head_windows or MIN_HEAD_WINDOWS,
+        )
+        print(f"Heads: {head_names}")
+        net = MultiHeadModel(
+            X.shape[1],
+            head_names,
+            metadata["instruments"],
+            learning_rate=learning_rate,
+            jit_compile=jit_compile,
+            steps_per_execution=steps_per_execution,
+        )
+        model = net.model
+        train_data = {
+            "x": net.inputs(X_train, instruments[idx_train]),
+            "y": net.targets(y_train),
+            "sample_weight": net.sample_weight(y_train, class_weight_dict),
+        }
+        val_data = (
+            net.inputs(X_val, instruments[idx_val]),
+            net.targets(y_val),
+        )
+    else:
+        model = create_model(
+            input_shape=(X.shape[1],),
+            learning_rate=learning_rate,
+            jit_compile=jit_compile,
+            steps_per_execution=steps_per_execution,
+        )
+        train_data = {
+            "x": X_train,
+            "y": y_train,
+            "class_weight": class_weight_dict,
+        }
+        val_data = (X_val, y_val)
     model.summary()
 
     # Callbacks
@@ -398,41 +686,144 @@ def train_model(
             verbose=1,
         ),
     ]
+    if cpu_mode and warmup_epochs > 0:
+        model_callbacks.append(
+            LearningRateWarmup(learning_rate, warmup_epochs)
+        )
+    if profiler.enabled:
+        model_callbacks.append(EpochTimingCallback(profiler))
 
     # Train model
     print("\nTraining model...")
-    history = model.fit(
-        X_train,
-        y_train,
-        validation_data=(X_val, y_val),
-        epochs=epochs,
-        batch_size=batch_size,
-        class_weight=class_weight_dict,
-        callbacks=model_callbacks,
-        verbose=1,
+    fit_start = time.perf_counter()
+    with profiler.stage("fit") as stage:
+        history = model.fit(
+            **train_data,
+            validation_data=val_data,
+            epochs=epochs,
+            batch_size=batch_size,
+            callbacks=model_callbacks,
+            verbose=1,
+        )
+        stage.set_samples(len(X_train) * len(history.history["loss"]))
+    fit_seconds = time.perf_counter() - fit_start
+    history_dict = history.history
+    if multi_head:
+        history_dict = net.history(history_dict)
+
+    # Metrics of the weights actually kept (best epoch, restored by
+    # EarlyStopping), comparable across batch sizes and modes
+    best_val_metrics = model.evaluate(
+        *val_data, batch_size=4096, verbose=0, return_dict=True
     )
+    if multi_head:
+        best_val_metrics = net.history(best_val_metrics)
 
     # Save final model
     model.save(output_path / "final_model.keras")
     print(f"\nModel saved to {output_path}")
 
-    # Plot training history
-    plot_training_history(history, output_path)
+    # Save and plot training history
+    with open(output_path / "history.json", "w") as f:
+        json.dump(
+            {k: [float(v) for v in vals] for k, vals in history_dict.items()},
+            f,
+        )
+    if plot_history:
+        plot_training_history(history_dict, output_path)
 
     # Export to TensorFlow.js format with optimal threshold calculation
-    export_tfjs_model(model, output_path, X.shape, X_val, y_val)
+    head_metadata = None
+    if multi_head:
+        from multi_head import (
+            instrument_event_report,
+            print_multi_head_report,
+            size_report,
+        )
+
+        # evaluate.py and finetune.py expect a single-output model: keep the
+        # full model separately and save trunk + generic head as best_model
+        os.replace(
+            output_path / "best_model.keras",
+            output_path / "multi_head_model.keras",
+        )
+        net.reference_model().save(output_path / "best_model.keras")
+
+        tfjs_path, head_stats = net.export(
+            output_path,
+            X_val,
+            y_val,
+            instruments[idx_val],
+            metadata["instruments"],
+            profiler=profiler,
+            scaler_src=data_path / "scaler.json",
+            publish=publish,
+            merge_metadata=merge_metadata,
+            inputs=inputs,
+            gate=gate,
+        )
+        if not holdout:
+            print(
+                "No held-out recordings in the dataset: per-instrument "
+                "event metrics include training recordings"
+            )
+        events = instrument_event_report(tfjs_path, raw_path, holdout or None)
+        sizes = size_report(tfjs_path)
+        print_multi_head_report(head_stats, events, sizes)
+        head_metadata = {
+            "heads": head_stats,
+            "event_metrics": events,
+            "sizes": sizes,
+        }
+    else:
+        export_tfjs_model(
+            model,
+            output_path,
+            X.shape,
+            X_val,
+            y_val,
+            profiler=profiler,
+            scaler_src=data_path / "scaler.json",
+            publish=publish,
+            merge_metadata=merge_metadata,
+            inputs=inputs,
+            gate=gate,
+        )
+
+    cascade_metadata = None
+    if gate is not None:
+        from cascade import cascade_report, print_cascade_report
+
+        report = cascade_report(
+            output_path / "tfjs_model",
+            raw_path,
+            recordings=holdout or None,
+        )
+        print_cascade_report(report)
+        cascade_metadata = {"gate": gate, "report": report}
 
     # Save training metadata
     training_metadata = {
-        "epochs": len(history.history["loss"]),
+        "epochs": len(history_dict["loss"]),
         "batch_size": batch_size,
-        "final_val_loss": float(history.history["val_loss"][-1]),
-        "final_val_accuracy": float(history.history["val_accuracy"][-1]),
-        "final_val_precision": float(history.history["val_precision"][-1]),
-        "final_val_recall": float(history.history["val_recall"][-1]),
-        "final_val_auc": float(history.history["val_auc"][-1]),
+        "cpu_mode": cpu_mode,
+        "xla": jit_compile,
+        "learning_rate": learning_rate,
+        "fit_seconds": fit_seconds,
+        "mean_epoch_seconds": fit_seconds / len(history_dict["loss"]),
+        "best_val_metrics": {k: float(v) for k, v in best_val_metrics.items()},
+        "final_val_loss": float(history_dict["val_loss"][-1]),
+        "final_val_accuracy": float(history_dict["val_accuracy"][-1]),
+        "final_val_precision": float(history_dict["val_precision"][-1]),
+        "final_val_recall": float(history_dict["val_recall"][-1]),
+        "final_val_auc": float(history_dict["val_auc"][-1]),
         "class_weights": class_weight_dict,
+        "inputs": inputs,
     }
+    if head_metadata is not None:
+        training_metadata["multi_head"] = head_metadata
+    if cascade_metadata is not None:
+        training_metadata["cascade"] = cascade_metadata
 
     with open(output_path / "training_metadata.json", "w") as f:
         json.dump(training_metadata, f, indent=2)
@@ -447,6 +838,72 @@ def train_model(
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train the onset detection model"
+    )
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help=f"Default {BASE_BATCH_SIZE}, or {CPU_MODE_BATCH_SIZE} with "
+        "--cpu-mode",
+    )
+    parser.add_argument(
+        "--cpu-mode",
+        action="store_true",
+        help="Explicit thread pools and large-batch schedule",
+    )
+    parser.add_argument(
+        "--xla",
+        action=argparse.BooleanOptionalAction,
+        help="Compile with XLA (jit_compile); on by default with "
+        "--cpu-mode, --no-xla turns it off",
+    )
+    parser.add_argument(
+        "--merge-metadata",
+        action="store_true",
+        help="Merge config.json and scaler.json into model.json",
+    )
+    parser.add_argument(
+        "--features",
+        type=lambda value: value.split(","),
+        help="Comma-separated per-frame features to train on",
+    )
+    parser.add_argument(
+        "--lags",
+        type=lambda value: [int(lag) for lag in value.split(",")],
+        help="Comma-separated frame lags to train on (0 = current frame)",
+    )
+    parser.add_argument(
+        "--multi-head",
+        action="store_true",
+        help="Shared trunk with one head per instrument",
+    )
+    parser.add_argument(
+        "--min-head-windows",
+        type=int,
+        help="Training windows an instrument needs for its own head "
+        "(default 500)",
+    )
+    parser.add_argument(
+        "--cascade",
+        action="store_true",
+        help="Export a linear first-stage gate in front of the MLP",
+    )
+    parser.add_argument(
+        "--gate-recall",
+        type=float,
+        help="Share of onsets the cascade gate must keep (default 0.999)",
+    )
+    parser.add_argument("--intra-op-threads", type=int)
+    parser.add_argument("--inter-op-threads", type=int)
+    parser.add_argument(
+        "--warmup-epochs", type=int, default=CPU_MODE_WARMUP_EPOCHS
+    )
+    add_profiling_args(parser)
+    args = parser.parse_args()
+    profiler = profiler_from_args(args)
+
     # Get the directory where this script is located
     script_dir = Path(__file__).parent.resolve()
     training_dir = script_dir.parent
@@ -454,6 +911,27 @@ if __name__ == "__main__":
     data_dir = str(training_dir / "data" / "processed")
     output_dir = str(training_dir / "models" / "saved")
 
+    batch_size = args.batch_size or (
+        CPU_MODE_BATCH_SIZE if args.cpu_mode else BASE_BATCH_SIZE
+    )
+
     train_model(
-        data_dir=data_dir, output_dir=output_dir, epochs=100, batch_size=256
+        data_dir=data_dir,
+        output_dir=output_dir,
+        epochs=args.epochs,
+        batch_size=batch_size,
+        profiler=profiler,
+        cpu_mode=args.cpu_mode,
+        intra_op_threads=args.intra_op_threads,
+        inter_op_threads=args.inter_op_threads,
+        warmup_epochs=args.warmup_epochs,
+        xla=args.xla,
+        merge_metadata=args.merge_metadata,
+        features=args.features,
+        lags=args.lags,
+        multi_head=args.multi_head,
+        min_head_windows=args.min_head_windows,
+        cascade=args.cascade,
+        gate_recall=args.gate_recall,
     )
+    profiler.finish(args.trace, args.chrome_trace)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The scripts import each other by module name, as when run from scripts/
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
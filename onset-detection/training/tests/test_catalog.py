@@ -0,0 +1,75 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from catalog import query_catalog, update_catalog
+from generate_synthetic import generate_recording
+
+
+def _write(path, n_frames, seed):
+    frames = generate_recording(n_frames, rng=np.random.default_rng(seed))
+    path.write_text(json.dumps(frames))
+    return frames
+
+
+def _names(raw_dir, catalog_path, query=None):
+    rows = query_catalog(raw_dir, query, catalog_path, update=False)
+    return [row["name"] for row in rows]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for index, n_frames in enumerate((300, 400, 500)):
+        _write(raw_dir / f"take{index}.json", n_frames, seed=index)
+    return raw_dir, tmp_path / "catalog.sqlite"
+
+
+def test_update_reads_only_changed_files(corpus):
+    raw_dir, catalog_path = corpus
+    counts = update_catalog(raw_dir, catalog_path, jobs=1, verbose=False)
+    assert counts == {"scanned": 3, "unchanged": 0, "removed": 0}
+
+    counts = update_catalog(raw_dir, catalog_path, jobs=1, verbose=False)
+    assert counts == {"scanned": 0, "unchanged": 3, "removed": 0}
+
+    # Rewritten file: new size and mtime, its row is recomputed
+    path = raw_dir / "take1.json"
+    frames = _write(path, 250, seed=9)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    counts = update_catalog(raw_dir, catalog_path, jobs=1, verbose=False)
+    assert counts == {"scanned": 1, "unchanged": 2, "removed": 0}
+    rows = query_catalog(raw_dir, "name = 'take1.json'", catalog_path, False)
+    assert rows[0]["n_frames"] == len(frames) == 250
+    assert rows[0]["size"] == path.stat().st_size
+
+
+def test_deleted_recordings_are_removed(corpus):
+    raw_dir, catalog_path = corpus
+    update_catalog(raw_dir, catalog_path, jobs=1, verbose=False)
+    (raw_dir / "take0.json").unlink()
+
+    counts = update_catalog(raw_dir, catalog_path, jobs=1, verbose=False)
+    assert counts == {"scanned": 0, "unchanged": 2, "removed": 1}
+    assert _names(raw_dir, catalog_path) == ["take1.json", "take2.json"]
+
+
+def test_queries_filter_rows_of_their_directory(corpus, tmp_path):
+    raw_dir, catalog_path = corpus
+    other_dir = tmp_path / "other"
+    other_dir.mkdir()
+    _write(other_dir / "take9.json", 600, seed=5)
+    update_catalog(raw_dir, catalog_path, jobs=1, verbose=False)
+    update_catalog(other_dir, catalog_path, jobs=1, verbose=False)
+
+    assert _names(raw_dir, catalog_path, "n_frames >= 400") == [
+        "take1.json",
+        "take2.json",
+    ]
+    assert _names(other_dir, catalog_path) == ["take9.json"]
+    with pytest.raises(ValueError, match="Invalid catalog query"):
+        _names(raw_dir, catalog_path, "no_such_column > 1")
@@ -0,0 +1,75 @@
+import numpy as np
+
+from dedup import (
+    DEFAULT_THRESHOLD,
+    dedup_plan,
+    find_duplicates,
+    recording_signature,
+)
+from generate_synthetic import generate_recording
+
+
+def _retake(data, gain, noise, seed):
+    """Same take at another gain with per-frame multiplicative noise."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for frame in data:
+        frame = dict(frame)
+        for name in ("amplitude", "spectralFlux", "highFrequencyEnergy"):
+            frame[name] *= gain
+        for name in (
+            "amplitude",
+            "spectralFlux",
+            "phaseDeviation",
+            "highFrequencyEnergy",
+        ):
+            frame[name] *= float(rng.normal(1.0, noise))
+        frames.append(frame)
+    return frames
+
+
+def _similarity(a, b):
+    return float(np.mean(recording_signature(a) == recording_signature(b)))
+
+
+def test_retake_is_duplicate_and_other_take_is_not():
+    rng = np.random.default_rng(7)
+    take = generate_recording(6000, rng=rng)
+    other = generate_recording(6000, rng=rng)
+    retake = _retake(take, gain=1.5, noise=0.1, seed=1)
+
+    assert _similarity(take, retake) >= DEFAULT_THRESHOLD + 0.2
+    assert _similarity(take, other) < DEFAULT_THRESHOLD - 0.3
+
+    signatures = np.stack(
+        [recording_signature(data) for data in (take, other, retake)]
+    )
+    clusters, pairs = find_duplicates(signatures)
+    assert clusters == [[0, 2]]
+    assert [(i, j) for i, j, _ in pairs] == [(0, 2)]
+
+
+def test_gain_does_not_change_signature():
+    take = generate_recording(3000, rng=np.random.default_rng(3))
+    assert _similarity(take, _retake(take, gain=0.3, noise=0.0, seed=0)) == 1
+
+
+def test_recordings_without_onsets_never_match():
+    silence = [
+        {
+            "timestamp": 10.0 * i,
+            "amplitude": 0.0,
+            "spectralFlux": 0.0,
+            "phaseDeviation": 0.0,
+            "highFrequencyEnergy": 0.0,
+            "hasPitch": False,
+        }
+        for i in range(500)
+    ]
+    signatures = np.stack([recording_signature(silence)] * 2)
+    assert find_duplicates(signatures) == ([], [])
+
+
+def test_drop_keeps_largest_recording_of_each_cluster():
+    masks = dedup_plan([[0, 2]], [10, 5, 30], "drop")
+    assert [mask.sum() for mask in masks] == [0, 5, 30]
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from finetune import ReplayBuffer  # noqa: E402
+
+
+def _stream(buffer, n_items, chunk):
+    """Add items 0..n_items-1 in chunks; y carries each item's id."""
+    for start in range(0, n_items, chunk):
+        ids = np.arange(start, min(start + chunk, n_items))
+        buffer.add(ids[:, None].astype(np.float32), ids)
+
+
+def test_reservoir_size_never_exceeds_capacity():
+    buffer = ReplayBuffer(capacity=50, n_features=1)
+    _stream(buffer, 30, chunk=7)
+    assert len(buffer) == 30
+    assert sorted(buffer.y.tolist()) == list(range(30))
+
+    _stream(buffer, 500, chunk=13)
+    assert len(buffer) == 50
+    assert buffer.n_seen == 530
+    # Features and labels stay paired through replacements
+    np.testing.assert_array_equal(buffer.X[:, 0], buffer.y)
+
+
+def test_reservoir_sample_is_uniform_over_the_stream():
+    capacity, n_items, trials = 100, 1000, 300
+    counts = np.zeros(n_items)
+    for seed in range(trials):
+        buffer = ReplayBuffer(capacity, n_features=1, seed=seed)
+        # Uneven chunks: the first fills the buffer part-way
+        _stream(buffer, n_items, chunk=37)
+        assert len(np.unique(buffer.y)) == capacity
+        counts[buffer.y] += 1
+
+    # Every item is kept with probability capacity / n_items; early and
+    # late parts of the stream are equally represented
+    by_decile = counts.reshape(10, -1).mean(axis=1) / trials
+    np.testing.assert_allclose(by_decile, capacity / n_items, atol=0.01)
+
+
+def test_reservoir_state_survives_save_and_load(tmp_path):
+    buffer = ReplayBuffer(capacity=20, n_features=1, seed=3)
+    _stream(buffer, 100, chunk=9)
+    buffer.save(tmp_path / "replay.npz")
+    loaded = ReplayBuffer.load(tmp_path / "replay.npz")
+
+    _stream(buffer, 50, chunk=9)
+    _stream(loaded, 50, chunk=9)
+    np.testing.assert_array_equal(loaded.y, buffer.y)
+    assert loaded.n_seen == buffer.n_seen
@@ -0,0 +1,134 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from publish_model import (
+    BUNDLE_NAME,
+    MANIFEST_NAME,
+    PublishError,
+    publish_bundle,
+)
+
+N_FEATURES = 25
+
+
+def _write_bundle(directory, seed=0, scaler_size=N_FEATURES):
+    """Minimal one-Dense-layer bundle in the layout train.py exports."""
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    kernel = rng.normal(size=(N_FEATURES, 1)).astype(np.float32)
+    bias = rng.normal(size=1).astype(np.float32)
+    (directory / "group1-shard1of1.bin").write_bytes(
+        kernel.tobytes() + bias.tobytes()
+    )
+    model_json = {
+        "modelTopology": {
+            "config": {
+                "layers": [
+                    {"class_name": "InputLayer", "config": {}},
+                    {
+                        "class_name": "Dense",
+                        "config": {"name": "output", "activation": "sigmoid"},
+                    },
+                ]
+            }
+        },
+        "weightsManifest": [
+            {
+                "paths": ["group1-shard1of1.bin"],
+                "weights": [
+                    {
+                        "name": "output/kernel",
+                        "shape": [N_FEATURES, 1],
+                        "dtype": "float32",
+                    },
+                    {"name": "output/bias", "shape": [1], "dtype": "float32"},
+                ],
+            }
+        ],
+    }
+    (directory / "model.json").write_text(json.dumps(model_json))
+    (directory / "config.json").write_text(
+        json.dumps({"inputShape": [N_FEATURES], "optimalThreshold": 0.5})
+    )
+    (directory / "scaler.json").write_text(
+        json.dumps({"mean": [0.0] * scaler_size, "std": [1.0] * scaler_size})
+    )
+    return directory
+
+
+def _versions(root):
+    return sorted(path.name for path in root.iterdir() if path.is_dir())
+
+
+def test_publish_writes_version_and_manifest(tmp_path):
+    bundle = _write_bundle(tmp_path / "bundle")
+    static = tmp_path / "static"
+    version_dir = publish_bundle(bundle, static)
+
+    root = static / BUNDLE_NAME
+    manifest = json.loads((root / MANIFEST_NAME).read_text())
+    assert manifest["current"] == version_dir.name
+    assert sorted(manifest["files"]) == [
+        "config.json",
+        "group1-shard1of1.bin",
+        "model.json",
+        "scaler.json",
+    ]
+    assert manifest["inputShape"] == [N_FEATURES]
+    for name in manifest["files"]:
+        assert (version_dir / name).read_bytes() == (
+            bundle / name
+        ).read_bytes()
+    # No staging directory or temporary manifest left behind
+    assert _versions(root) == [version_dir.name]
+    assert sorted(path.name for path in root.iterdir()) == sorted(
+        [version_dir.name, MANIFEST_NAME]
+    )
+
+    # Same contents, same version: nothing is copied again
+    assert publish_bundle(bundle, static) == version_dir
+    assert _versions(root) == [version_dir.name]
+
+
+def test_failed_verification_leaves_current_version(tmp_path):
+    static = tmp_path / "static"
+    good = publish_bundle(_write_bundle(tmp_path / "good"), static)
+    root = static / BUNDLE_NAME
+    manifest = (root / MANIFEST_NAME).read_text()
+
+    broken = _write_bundle(tmp_path / "broken", seed=1, scaler_size=10)
+    with pytest.raises(PublishError, match="scaler.json"):
+        publish_bundle(broken, static)
+
+    assert (root / MANIFEST_NAME).read_text() == manifest
+    assert _versions(root) == [good.name]
+
+
+def test_incomplete_bundle_is_rejected(tmp_path):
+    bundle = _write_bundle(tmp_path / "bundle")
+    (bundle / "group1-shard1of1.bin").unlink()
+    with pytest.raises(PublishError):
+        publish_bundle(bundle, tmp_path / "static")
+    assert _versions(tmp_path / "static" / BUNDLE_NAME) == []
+
+
+def test_prune_keeps_current_and_newest(tmp_path):
+    static = tmp_path / "static"
+    published = []
+    for seed in range(5):
+        version_dir = publish_bundle(
+            _write_bundle(tmp_path / f"bundle{seed}", seed=seed),
+            static,
+            keep_versions=2,
+        )
+        # Distinct mtimes so "newest" does not depend on timer resolution
+        os.utime(version_dir, (1_000_000 + seed, 1_000_000 + seed))
+        published.append(version_dir.name)
+
+    root = static / BUNDLE_NAME
+    assert _versions(root) == sorted(published[-3:])
+    manifest = json.loads((root / MANIFEST_NAME).read_text())
+    assert manifest["current"] == published[-1]
@@ -0,0 +1,172 @@
+import json
+
+import numpy as np
+import pytest
+
+from generate_synthetic import generate_recording
+from postprocess import (
+    active_postprocessing,
+    detect_onsets,
+    evaluate_grid,
+    tune_postprocessing,
+)
+from scoring_service import MicroBatcher
+from test_publish_model import _write_bundle
+
+
+class _RecordingPredict:
+    """Fake model: returns the first feature and records every call."""
+
+    def __init__(self, failing_head=""):
+        self.calls = []
+        self.failing_head = failing_head
+
+    def __call__(self, head, X):
+        self.calls.append((head, len(X)))
+        if head == self.failing_head:
+            raise RuntimeError(f"{head} failed")
+        return X[:, 0].copy()
+
+
+def _windows(start, n):
+    return np.arange(start, start + n, dtype=np.float32)[:, None]
+
+
+def test_batcher_scores_one_pass_per_head():
+    predict = _RecordingPredict()
+    batcher = MicroBatcher(predict, max_batch_rows=1000, max_latency_ms=500)
+    requests = [
+        (_windows(0, 3), "violin"),
+        (_windows(10, 2), None),
+        (_windows(20, 4), "violin"),
+        (_windows(30, 1), None),
+    ]
+    futures = [batcher.submit(windows, head) for windows, head in requests]
+    results = [future.result(timeout=5) for future in futures]
+    batcher.close()
+
+    # Each request gets back exactly its own rows, in order
+    for (windows, _), result in zip(requests, results):
+        np.testing.assert_array_equal(result, windows[:, 0])
+    # One forward pass per head, over all of that head's requests
+    assert sorted(predict.calls, key=lambda call: call[1]) == [
+        (None, 3),
+        ("violin", 7),
+    ]
+    stats = batcher.snapshot()
+    assert stats["batches"] == 1
+    assert stats["requests"] == 4
+    assert stats["rows"] == 10
+
+
+def test_batcher_flushes_at_max_batch_rows():
+    predict = _RecordingPredict()
+    batcher = MicroBatcher(predict, max_batch_rows=4, max_latency_ms=500)
+    futures = [batcher.submit(_windows(i * 10, 2)) for i in range(4)]
+    for future in futures:
+        future.result(timeout=5)
+    batcher.close()
+
+    assert predict.calls == [(None, 4), (None, 4)]
+    assert batcher.snapshot()["batches"] == 2
+
+
+def test_batcher_failure_only_affects_its_head():
+    predict = _RecordingPredict(failing_head="cello")
+    batcher = MicroBatcher(predict, max_batch_rows=1000, max_latency_ms=500)
+    good = batcher.submit(_windows(0, 2), "violin")
+    bad = batcher.submit(_windows(5, 2), "cello")
+    np.testing.assert_array_equal(good.result(timeout=5), [0, 1])
+    with pytest.raises(RuntimeError, match="cello failed"):
+        bad.result(timeout=5)
+    batcher.close()
+
+
+@pytest.mark.parametrize(
+    "threshold, hysteresis, min_interval, peak_window",
+    [(0.5, 0.0, 0, 0), (0.4, 0.2, 3, 1), (0.6, 0.1, 8, 2), (0.3, 0.3, 0, 2)],
+)
+def test_detect_onsets_matches_grid_search(
+    threshold, hysteresis, min_interval, peak_window
+):
+    rng = np.random.default_rng(0)
+    probabilities = rng.random(400).astype(np.float32) ** 3
+    postprocessing = {
+        "threshold": threshold,
+        "hysteresis": hysteresis,
+        "minIntervalFrames": min_interval,
+        "peakWindow": peak_window,
+    }
+    onsets = detect_onsets(probabilities, threshold, postprocessing)
+
+    # Every onset scored as a hit when it is the only true onset
+    truth = [onsets]
+    counts = evaluate_grid(
+        [probabilities],
+        truth,
+        [(threshold, hysteresis, min_interval, peak_window)],
+        tolerance=0,
+    )[0]
+    assert counts.tolist() == [len(onsets), 0, 0]
+
+
+def test_active_postprocessing_is_per_head():
+    block = {
+        "threshold": 0.7,
+        "hysteresis": 0.1,
+        "minIntervalFrames": 5,
+        "peakWindow": 1,
+    }
+    config = {
+        "optimalThreshold": 0.5,
+        "postprocessing": {**block, "threshold": 0.9},
+        "heads": {
+            "names": ["generic", "violin", "cello"],
+            "default": "generic",
+            "thresholds": {"generic": 0.4, "violin": 0.6, "cello": 0.3},
+            "postprocessing": {"violin": block},
+        },
+    }
+    assert active_postprocessing(config, "violin") == (0.7, block)
+    # No block of its own: plain threshold, never another head's block
+    assert active_postprocessing(config, "cello") == (0.3, None)
+    assert active_postprocessing(config, "flute") == (0.4, None)
+
+    single = {"optimalThreshold": 0.5, "postprocessing": block}
+    assert active_postprocessing(single) == (0.7, block)
+    assert active_postprocessing({"optimalThreshold": 0.5}) == (0.5, None)
+
+
+def test_tuning_writes_a_copy_of_the_bundle(tmp_path):
+    bundle = _write_bundle(tmp_path / "tfjs_model")
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for seed in range(3):
+        frames = generate_recording(400, rng=np.random.default_rng(seed))
+        (raw_dir / f"take{seed}.json").write_text(json.dumps(frames))
+    before = {path.name: path.read_bytes() for path in bundle.iterdir()}
+
+    output_dir = tmp_path / "tuned_model"
+    for _ in range(2):  # the second run replaces the first copy
+        tuned = tune_postprocessing(
+            bundle,
+            raw_dir,
+            grid={"threshold": [0.5], "hysteresis": [0.0, 0.1]},
+            jobs=1,
+            output_dir=output_dir,
+        )
+
+    # The trained bundle (a pipeline train output) is never modified
+    assert {path.name: path.read_bytes() for path in bundle.iterdir()} == (
+        before
+    )
+    config = json.loads((output_dir / "config.json").read_text())
+    assert (
+        config["postprocessing"]["threshold"] == tuned[""]["best"]["threshold"]
+    )
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "probability_cache.npz",
+        "raw",
+        "tfjs_model",
+        "tuned_model",
+    ]
@@ -1,9 +1,17 @@
 #!/bin/bash
 
 # Onset Detection Model Training Script
-# This script runs the complete training pipeline:
-# 1. Preprocess raw data
-# 2. Train the model
+# Runs the training pipeline through scripts/pipeline.py:
+#   preprocess -> train -> plot / evaluate / postprocess -> publish
+# Stages whose inputs, code and parameters are unchanged are skipped.
+#
+# Extra arguments are passed to the runner, e.g.
+#   ./train.sh --epochs 50
+#   ./train.sh --force train
+#   ./train.sh --dry-run
+#
+# Optional profiling: TRACE_DIR=traces ./train.sh
+# writes JSON + Chrome traces for each stage that runs into $TRACE_DIR
 
 set -e  # Exit on error
 
@@ -18,15 +26,12 @@ NC='\033[0m' # No Color
 echo -e "${YELLOW}=== Onset Detection Training Pipeline ===${NC}"
 echo ""
 
-# Step 1: Preprocess data
-echo -e "${YELLOW}Step 1: Preprocessing raw data...${NC}"
-python scripts/preprocess.py
+TRACE_ARGS=()
+if [ -n "$TRACE_DIR" ]; then
+    TRACE_ARGS=(--trace-dir "$TRACE_DIR")
+fi
 
-echo ""
-
-# Step 2: Train model
-echo -e "${YELLOW}Step 2: Training model...${NC}"
-python scripts/train.py
+python scripts/pipeline.py "${TRACE_ARGS[@]}" "$@"
 
 echo ""
 echo -e "${GREEN}=== Training Pipeline Complete ===${NC}"
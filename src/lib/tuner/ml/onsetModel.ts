@@ -1,11 +1,64 @@
 import * as tf from '@tensorflow/tfjs';
 
+// Which window columns the model consumes (train.py --features/--lags)
+export interface OnsetModelInputs {
+	windowSize: number;
+	features: string[];
+	lags: number[]; // 0 = current frame
+	columns: number[]; // Indices into the full [t-4 .. t] x 5-feature window
+}
+
+// Per-instrument heads on a shared trunk (train.py --multi-head)
+export interface OnsetModelHeads {
+	names: string[];
+	default: string;
+	inputShape: number[];
+	thresholds: Record<string, number>;
+	// Tuned per head (postprocess.py); heads without one use a plain threshold
+	postprocessing?: Record<string, OnsetModelPostprocessing>;
+}
+
+// Linear first stage on the current frame (train.py --cascade): the MLP only
+// runs when sum(weights[i] * window[columns[i]]) + bias >= 0 on raw features
+export interface OnsetModelGate {
+	features: string[];
+	columns: number[]; // Indices into the full [t-4 .. t] x 5-feature window
+	weights: number[];
+	bias: number;
+}
+
+// Onset decision rule tuned for event F1 (postprocess.py); frame counts at the
+// training hop. A peak window of w frames delays each decision by w frames.
+export interface OnsetModelPostprocessing {
+	threshold: number;
+	hysteresis: number; // Re-arm once the probability drops below threshold - hysteresis
+	minIntervalFrames: number;
+	minIntervalMs: number;
+	peakWindow: number; // Candidate must be the maximum within ±peakWindow frames
+	latencyMs: number;
+}
+
 export interface OnsetModelConfig {
 	inputShape: number[];
 	outputShape: number[];
 	optimalThreshold: number;
 	version: string;
 	created: string;
+	inputs?: OnsetModelInputs;
+	heads?: OnsetModelHeads;
+	gate?: OnsetModelGate;
+	postprocessing?: OnsetModelPostprocessing;
+}
+
+interface ScalerData {
+	mean: number[];
+	std: number[];
+}
+
+// config.json and scaler.json merged into model.json by pack_bundle.py --merge-metadata
+interface PackedMetadata {
+	config?: OnsetModelConfig;
+	scaler?: ScalerData;
 }
 
 export interface OnsetPrediction {
@@ -20,21 +73,42 @@ export class OnsetModel {
 	private scalerMean: number[] = [];
 	private scalerStd: number[] = [];
 	private isLoaded = false;
+	private modelPath = '';
+	// Multi-head bundles: model.json is the trunk, heads are fetched on demand
+	private heads = new Map<string, Promise<tf.LayersModel>>();
+	private head: tf.LayersModel | null = null;
+	private headName: string | null = null;
+	private requestedHead: string | null = null;
+	private threshold = 0.5;
+	// Decision rule of the active head (or of the whole model)
+	private postprocessing: OnsetModelPostprocessing | null = null;
+	// Streaming onset detector state (predict() only)
+	private recentProbabilities: number[] = [];
+	private armed = true;
+	private framesSinceOnset = Number.POSITIVE_INFINITY;
 
-	async load(modelPath: string): Promise<void> {
+	async load(modelPath: string, instrument: string = 'generic'): Promise<void> {
 		try {
+			this.modelPath = modelPath;
+
 			// Load the model
 			this.model = await tf.loadLayersModel(`${modelPath}/model.json`);
 
+			// Packed bundles carry config and scaler inside model.json
+			const packed = this.model.getUserDefinedMetadata() as PackedMetadata | undefined;
+
 			// Load the config
-			const configResponse = await fetch(`${modelPath}/config.json`);
-			this.config = await configResponse.json();
+			if (packed?.config) {
+				this.config = packed.config;
+			} else {
+				const configResponse = await fetch(`${modelPath}/config.json`);
+				this.config = await configResponse.json();
+			}
 
 			// Load the scaler (mean and std from training)
 			try {
-				const scalerResponse = await fetch(`${modelPath}/scaler.json`);
-				if (scalerResponse.ok) {
-					const scalerData = await scalerResponse.json();
+				const scalerData = packed?.scaler ?? (await this.fetchScaler(modelPath));
+				if (scalerData) {
 					this.scalerMean = scalerData.mean;
 					this.scalerStd = scalerData.std;
 					console.log('[OnsetModel] Scaler loaded', {
@@ -48,6 +122,13 @@ export class OnsetModel {
 				console.warn('[OnsetModel] Failed to load scaler:', scalerError);
 			}
 
+			this.postprocessing = this.config!.postprocessing ?? null;
+			this.threshold = this.postprocessing?.threshold ?? this.config!.optimalThreshold;
+			this.resetDetector();
+			if (this.config!.heads) {
+				await this.setInstrument(instrument);
+			}
+
 			this.isLoaded = true;
 			console.log('[OnsetModel] Model loaded successfully', this.config);
 		} catch (error) {
@@ -56,6 +137,112 @@ export class OnsetModel {
 		}
 	}
 
+	/**
+	 * Use the head trained for this instrument (multi-head bundles only).
+	 * Only the trunk and the active head are downloaded; heads are fetched on
+	 * first use and cached. Instruments without their own head use the default.
+	 */
+	async setInstrument(instrument: string): Promise<void> {
+		const heads = this.config?.heads;
+		if (!heads) return;
+
+		const name = heads.names.includes(instrument) ? instrument : heads.default;
+		this.requestedHead = name;
+		if (name === this.headName) return;
+
+		let pending = this.heads.get(name);
+		if (!pending) {
+			pending = tf.loadLayersModel(`${this.modelPath}/heads/${name}/model.json`);
+			this.heads.set(name, pending);
+			// Allow a retry if the download fails
+			pending.catch(() => this.heads.delete(name));
+		}
+		const head = await pending;
+
+		// A later call may have picked another head while this one loaded
+		if (this.requestedHead !== name) return;
+		this.head = head;
+		this.headName = name;
+		// A block tuned for another head's threshold would not fit this one
+		this.postprocessing = heads.postprocessing?.[name] ?? null;
+		this.threshold =
+			this.postprocessing?.threshold ?? heads.thresholds[name] ?? this.config!.optimalThreshold;
+		this.resetDetector();
+		console.log(`[OnsetModel] Using ${name} head`);
+	}
+
+	private async fetchScaler(modelPath: string): Promise<ScalerData | null> {
+		const scalerResponse = await fetch(`${modelPath}/scaler.json`);
+		return scalerResponse.ok ? scalerResponse.json() : null;
+	}
+
+	/**
+	 * Pick the model's inputs from a full 25-feature window.
+	 * Models trained on a feature/lag subset list their columns in config.json.
+	 */
+	private selectInputs(features: number[]): number[] {
+		const columns = this.config?.inputs?.columns;
+		return columns ? columns.map((column) => features[column]) : features;
+	}
+
+	/**
+	 * Cheap first-stage check on the raw window; frames it rejects are not onsets
+	 */
+	private gatePasses(features: number[]): boolean {
+		const gate = this.config?.gate;
+		if (!gate) return true;
+		let score = gate.bias;
+		for (let i = 0; i < gate.columns.length; i++) {
+			score += gate.weights[i] * features[gate.columns[i]];
+		}
+		return score >= 0;
+	}
+
+	/**
+	 * Turn the latest frame probability into an onset decision. Without tuned
+	 * post-processing for the active head this is a plain threshold; with it,
+	 * the decision is for the frame peakWindow frames ago (see postprocess.py).
+	 */
+	private detect(probability: number): boolean {
+		const post = this.postprocessing;
+		if (!post) return probability > this.threshold;
+
+		const recent = this.recentProbabilities;
+		recent.push(probability);
+		if (recent.length > 2 * post.peakWindow + 1) recent.shift();
+		if (recent.length <= post.peakWindow) return false;
+
+		const candidate = recent[recent.length - 1 - post.peakWindow];
+		if (candidate < this.threshold - post.hysteresis) this.armed = true;
+		const fire =
+			candidate > this.threshold &&
+			candidate >= Math.max(...recent) &&
+			this.armed &&
+			this.framesSinceOnset >= post.minIntervalFrames;
+		if (fire) this.armed = false;
+		this.framesSinceOnset = fire ? 0 : this.framesSinceOnset + 1;
+		return fire;
+	}
+
+	/**
+	 * Forget detector history, e.g. when the audio stream restarts
+	 */
+	resetDetector(): void {
+		this.recentProbabilities = [];
+		this.armed = true;
+		this.framesSinceOnset = Number.POSITIVE_INFINITY;
+	}
+
+	/**
+	 * Run the model, chaining the trunk with the active head for multi-head bundles
+	 */
+	private run(inputTensor: tf.Tensor2D): tf.Tensor {
+		return tf.tidy(() => {
+			const output = this.model!.predict(inputTensor) as tf.Tensor;
+			return this.head ? (this.head.predict(output) as tf.Tensor) : output;
+		});
+	}
+
 	/**
 	 * Apply StandardScaler normalization to raw features
 	 * @param features Raw feature values
@@ -97,27 +284,32 @@ export class OnsetModel {
 			return null;
 		}
 
+		// Skip the MLP on frames the gate rules out
+		if (!this.gatePasses(features)) {
+			return { probability: 0, isOnset: this.detect(0), threshold: this.threshold };
+		}
+
 		try {
 			// CRITICAL: Scale features using training set statistics
-			const scaledFeatures = this.scaleFeatures(features);
+			const scaledFeatures = this.scaleFeatures(this.selectInputs(features));
 
 			// Create tensor from scaled features
-			const inputTensor = tf.tensor2d([scaledFeatures], [1, 25]);
+			const inputTensor = tf.tensor2d([scaledFeatures], [1, scaledFeatures.length]);
 
 			// Run prediction
-			const prediction = this.model.predict(inputTensor) as tf.Tensor;
+			const prediction = this.run(inputTensor);
 			const probability = prediction.dataSync()[0];
 
 			// Clean up tensors
 			inputTensor.dispose();
 			prediction.dispose();
 
-			const isOnset = probability > this.config.optimalThreshold;
+			const isOnset = this.detect(probability);
 
 			return {
 				probability,
 				isOnset,
-				threshold: this.config.optimalThreshold
+				threshold: this.threshold
 			};
 		} catch (error) {
 			console.error('[OnsetModel] Prediction error:', error);
@@ -126,7 +318,8 @@ export class OnsetModel {
 	}
 
 	/**
-	 * Batch predict for multiple frames
+	 * Batch predict for multiple independent frames (threshold only, no
+	 * streaming post-processing)
 	 */
 	predictBatch(featuresBatch: number[][]): OnsetPrediction[] | null {
 		if (!this.isLoaded || !this.model || !this.config) {
@@ -134,20 +327,31 @@ export class OnsetModel {
 		}
 
 		try {
-			// Scale each feature vector in the batch
-			const scaledBatch = featuresBatch.map((features) => this.scaleFeatures(features));
+			// Only frames that pass the gate reach the MLP
+			const probabilities = new Array<number>(featuresBatch.length).fill(0);
+			const passed = featuresBatch
+				.map((features, index) => (this.gatePasses(features) ? index : -1))
+				.filter((index) => index >= 0);
+
+			if (passed.length > 0) {
+				// Scale each feature vector in the batch
+				const scaledBatch = passed.map((index) =>
+					this.scaleFeatures(this.selectInputs(featuresBatch[index]))
+				);
 
-			const inputTensor = tf.tensor2d(scaledBatch);
-			const predictions = this.model.predict(inputTensor) as tf.Tensor;
-			const probabilities = Array.from(predictions.dataSync());
+				const inputTensor = tf.tensor2d(scaledBatch);
+				const predictions = this.run(inputTensor);
+				const scored = predictions.dataSync();
+				passed.forEach((index, i) => (probabilities[index] = scored[i]));
 
-			inputTensor.dispose();
-			predictions.dispose();
+				inputTensor.dispose();
+				predictions.dispose();
+			}
 
 			return probabilities.map((probability) => ({
 				probability,
-				isOnset: probability > this.config!.optimalThreshold,
-				threshold: this.config!.optimalThreshold
+				isOnset: probability > this.threshold,
+				threshold: this.threshold
 			}));
 		} catch (error) {
 			console.error('[OnsetModel] Batch prediction error:', error);
@@ -159,6 +363,16 @@ export class OnsetModel {
 		return this.config;
 	}
 
+	/**
+	 * Per-frame features the model and its gate read; extractors for others can be skipped
+	 */
+	getRequiredFeatures(): string[] | null {
+		const features = this.config?.inputs?.features;
+		if (!features) return null;
+		const gate = this.config?.gate;
+		return gate ? [...new Set([...features, ...gate.features])] : features;
+	}
+
 	isReady(): boolean {
 		return this.isLoaded;
 	}
@@ -167,6 +381,13 @@ export class OnsetModel {
 		if (this.model) {
 			this.model.dispose();
 			this.model = null;
+			for (const pending of this.heads.values()) {
+				pending.then((head) => head.dispose()).catch(() => {});
+			}
+			this.heads.clear();
+			this.head = null;
+			this.headName = null;
+			this.requestedHead = null;
 			this.config = null;
 			this.isLoaded = false;
 		}
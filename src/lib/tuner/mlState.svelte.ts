@@ -3,6 +3,9 @@ import { OnsetModel, type OnsetPrediction } from './ml/onsetModel';
 
 const ML_WINDOW_SIZE = 5; // Same as training: current + 4 previous frames
 const ML_LOG_INTERVAL = 500; // ms between diagnostic logs
+// Published model versions are immutable; the manifest points at the current one
+const ML_MODEL_MANIFEST = 'models/onset-model/manifest.json';
+const ML_LEGACY_MODEL_DIR = 'models/onset-model-v1';
 
 export interface MLState {
 	mlModelReady: boolean;
@@ -15,7 +18,7 @@ export interface MLState {
 	mlOnsetProbability: number;
 }
 
-export function createMLState(basePath: string = '') {
+export function createMLState(basePath: string = '', instrument: string = 'generic') {
 	const state: MLState = {
 		mlModelReady: false,
 		mlModelLoadStarted: false,
@@ -28,7 +31,21 @@ export function createMLState(basePath: string = '') {
 	};
 
 	const mlModel = new OnsetModel();
-	const mlModelPath = `${basePath}/models/onset-model-v1`;
+	let mlModelPath = `${basePath}/${ML_LEGACY_MODEL_DIR}`;
+	let mlInstrument = instrument;
+
+	async function resolveMlModelPath(): Promise<string> {
+		try {
+			const response = await fetch(`${basePath}/${ML_MODEL_MANIFEST}`, { cache: 'no-cache' });
+			if (response.ok) {
+				const manifest: { current: string } = await response.json();
+				return `${basePath}/models/onset-model/${manifest.current}`;
+			}
+		} catch {
+			// Fall back to the legacy unversioned bundle
+		}
+		return `${basePath}/${ML_LEGACY_MODEL_DIR}`;
+	}
 
 	function debugLogForce(...args: unknown[]): void {
 		const timestamp = new SvelteDate().toISOString().split('T')[1].slice(0, -1); // HH:MM:SS.mmm
@@ -40,6 +57,7 @@ export function createMLState(basePath: string = '') {
 		state.mlModelLoadStarted = true;
 		state.mlModelLoadFailed = false;
 		// const loadStart = performance.now();
+		mlModelPath = await resolveMlModelPath();
 		try {
 			const probe = await fetch(`${mlModelPath}/model.json`, { method: 'GET' });
 			if (!probe.ok) {
@@ -53,10 +71,12 @@ export function createMLState(basePath: string = '') {
 		}
 
 		mlModel
-			.load(mlModelPath)
+			.load(mlModelPath, mlInstrument)
 			.then(() => {
 				state.mlModelReady = true;
 				state.mlModelLoadFailed = false;
+				// The instrument may have changed while the model was loading
+				setInstrument(mlInstrument);
 				// debugLogForce(
 				// 	`[ML] Onset model loaded successfully in ${Math.round(performance.now() - loadStart)}ms`
 				// );
@@ -183,8 +203,18 @@ export function createMLState(basePath: string = '') {
 		}
 	}
 
+	// Multi-head models switch to the instrument's head (fetched on first use)
+	function setInstrument(value: string) {
+		mlInstrument = value;
+		if (!state.mlModelReady) return; // load() picks it up
+		mlModel.setInstrument(value).catch((err) => {
+			debugLogForce(`[ML] Failed to load ${value} head, keeping the current one`, err);
+		});
+	}
+
 	function reset() {
 		state.mlFeatureHistory.length = 0;
+		mlModel.resetDetector();
 		state.mlOnsetDetected = false;
 		state.mlOnsetProbability = 0;
 		state.mlDiagLastState = null;
@@ -193,7 +223,10 @@ export function createMLState(basePath: string = '') {
 
 	return {
 		state,
+		// Per-frame features the loaded model and gate read (null = all or not loaded)
+		getRequiredFeatures: () => mlModel.getRequiredFeatures(),
 		ensureMlModelLoad,
+		setInstrument,
 		updateMLDiagnostics,
 		predict,
 		reset
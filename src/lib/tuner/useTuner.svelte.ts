@@ -96,7 +96,7 @@ export function createTuner(options: TunerOptions = {}) {
 	// ========================================================================
 	// MODULARIZED STATE
 	// ========================================================================
-	const mlState = createMLState(options.basePath ?? '');
+	const mlState = createMLState(options.basePath ?? '', options.instrument ?? 'generic');
 	const gainState = createGainState({
 		gain: options.gain ?? 2,
 		autoGain: options.autoGain ?? true,
@@ -554,7 +554,14 @@ export function createTuner(options: TunerOptions = {}) {
 		state.spectralFlux = excitationCue;
 		state.phaseDeviation = phaseCueAbsSmoothed;
 		state.hasPitch = hasPitch;
-		state.highFrequencyEnergy = calculateHighFrequencyEnergy(fftResult, audioContext.sampleRate);
+		// Only the ML model reads high-frequency energy: skip it when the loaded model
+		// was trained without it (train.py --features)
+		const mlFeatures =
+			useMlOnsets && mlState.state.mlModelReady ? mlState.getRequiredFeatures() : null;
+		state.highFrequencyEnergy =
+			mlFeatures && !mlFeatures.includes('highFrequencyEnergy')
+				? 0
+				: calculateHighFrequencyEnergy(fftResult, audioContext.sampleRate);
 
 		// Track pitch confidence: stable pitch over multiple frames
 		if (hasPitch) {
@@ -1340,6 +1347,7 @@ export function createTuner(options: TunerOptions = {}) {
 		},
 		set instrument(value: InstrumentKind) {
 			instrument.value = value;
+			mlState.setInstrument(value);
 		},
 		start,
 		startWithFile,